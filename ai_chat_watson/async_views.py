@@ -0,0 +1,135 @@
+"""
+Async (ASGI) Watson init/chat endpoints, mirroring WatsonInitView/WatsonChatView.
+The orchestration call uses httpx.AsyncClient and retrieval uses AsyncOpenAI
+embeddings. Routed in place of the DRF views when CHAT_ASYNC_VIEWS is enabled.
+"""
+import logging
+from typing import Optional
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+
+from aichat.async_support import async_login_required, request_data
+from aichat.history import aload_history
+from aichat.rag_retriever import aretrieve_relevant_chunks
+
+from .models import WatsonChatSession, WatsonChatMessage
+from .serializers import (
+    WatsonChatSessionSerializer,
+    WatsonChatMessageSerializer,
+    WatsonChatRequestSerializer,
+)
+from .views import (
+    WATSON_UNAVAILABLE_REPLY,
+    _assemble_watson_messages,
+    _build_retrieval_query,
+    _ensure_session,
+    _format_retrieved_docs,
+    _get_uhfs_and_products,
+    _save_user_message,
+    _session_context_block,
+)
+from .watson_client import asend_watson_chat
+
+logger = logging.getLogger(__name__)
+
+
+async def agenerate_watson_reply(session, message_text, language_instruction: Optional[str] = None):
+    context_block = await sync_to_async(_session_context_block)(session)
+    try:
+        retrieved_docs = await aretrieve_relevant_chunks(
+            _build_retrieval_query(context_block, message_text), top_k=5
+        )
+    except Exception as e:
+        logger.error(f"Watson RAG retrieval failed: {e}")
+        retrieved_docs = []
+
+    history = await aload_history(session)
+    messages = _assemble_watson_messages(
+        context_block, _format_retrieved_docs(retrieved_docs), history, message_text, language_instruction
+    )
+
+    try:
+        return await asend_watson_chat(messages, context=context_block, temperature=0.2)
+    except Exception as e:
+        logger.error(f"Watson orchestration call failed: {e}")
+        return WATSON_UNAVAILABLE_REPLY
+
+
+def _init_response_data(session, uhfs_score, uhfs_components, overall_risk, suggested_products):
+    return {
+        "session": WatsonChatSessionSerializer(session).data,
+        "uhfs": {
+            "score": uhfs_score,
+            "components": uhfs_components,
+            "overall_risk": overall_risk,
+        },
+        "suggested_products": suggested_products,
+    }
+
+
+def _chat_response_data(session, user_msg, assistant_msg):
+    return {
+        "session": WatsonChatSessionSerializer(session).data,
+        "user_message": WatsonChatMessageSerializer(user_msg).data,
+        "assistant_message": WatsonChatMessageSerializer(assistant_msg).data,
+    }
+
+
+@csrf_exempt
+@require_GET
+@async_login_required
+async def watson_init(request):
+    uhfs_score, uhfs_components, overall_risk, suggested_products = await sync_to_async(
+        _get_uhfs_and_products
+    )(request.user)
+
+    session = await WatsonChatSession.objects.acreate(
+        user=request.user,
+        title=f"Watson chat {timezone.now().date()}",
+        uhfs_score=uhfs_score,
+        uhfs_components=uhfs_components,
+        uhfs_overall_risk=overall_risk,
+        suggested_products_snapshot=suggested_products,
+    )
+
+    data = await sync_to_async(_init_response_data)(
+        session, uhfs_score, uhfs_components, overall_risk, suggested_products
+    )
+    return JsonResponse(data, status=200)
+
+
+@csrf_exempt
+@require_POST
+@async_login_required
+async def watson_chat(request):
+    data = request_data(request)
+    if data is None:
+        return JsonResponse({"error": "Malformed JSON body"}, status=400)
+    serializer = WatsonChatRequestSerializer(data=data)
+    if not serializer.is_valid():
+        return JsonResponse(serializer.errors, status=400)
+
+    session_id = serializer.validated_data.get("session_id")
+    message_text = serializer.validated_data["message"]
+
+    try:
+        session = await sync_to_async(_ensure_session)(request.user, session_id=session_id)
+    except WatsonChatSession.DoesNotExist:
+        return JsonResponse({"error": "Session not found"}, status=404)
+
+    user_msg = await sync_to_async(_save_user_message)(session, message_text, request.FILES)
+
+    reply_text = await agenerate_watson_reply(session, message_text)
+
+    assistant_msg = await WatsonChatMessage.objects.acreate(
+        session=session,
+        role="assistant",
+        content=reply_text,
+    )
+
+    response_data = await sync_to_async(_chat_response_data)(session, user_msg, assistant_msg)
+    return JsonResponse(response_data, status=200)
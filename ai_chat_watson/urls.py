@@ -1,9 +1,18 @@
+from django.conf import settings
 from django.urls import path
 
 from .views import WatsonInitView, WatsonChatView
 
+if getattr(settings, "CHAT_ASYNC_VIEWS", False):
+    from . import async_views
+
+    watson_init_view = async_views.watson_init
+    watson_chat_view = async_views.watson_chat
+else:
+    watson_init_view = WatsonInitView.as_view()
+    watson_chat_view = WatsonChatView.as_view()
+
 urlpatterns = [
-    path("watson/init/", WatsonInitView.as_view(), name="watson-init"),
-    path("watson/chat/", WatsonChatView.as_view(), name="watson-chat"),
+    path("watson/init/", watson_init_view, name="watson-init"),
+    path("watson/chat/", watson_chat_view, name="watson-chat"),
 ]
-
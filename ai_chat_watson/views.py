@@ -11,7 +11,9 @@ from finance.models import UHFSScore
 from finance.services.uhfs_v2 import calculate_and_store_uhfs
 from finance.services.products_util import get_suggested_products_util
 from finance.serializers import ProductSerializer
-from training.models import TrainingSection
+from training.services.chat_context import get_training_sections_context
+from aichat.history import load_history
+from aichat.prompt_context import render_context
 
 from .models import WatsonChatSession, WatsonChatMessage, WatsonChatAttachment
 from .serializers import (
@@ -55,25 +57,10 @@ def _get_uhfs_and_products(user):
 
 def _get_training_sections_context():
     """
-    Provide active training sections so Watson can recommend the right modules.
+    Provide active training sections so Watson can recommend the right modules
+    (cached and invalidated on TrainingSection changes).
     """
-    sections = TrainingSection.objects.filter(is_active=True).order_by("order", "id")
-    context_sections = []
-    for section in sections:
-        context_sections.append(
-            {
-                "id": section.id,
-                "title": section.title,
-                "description": section.description or "",
-                "score": section.score,
-                "order": section.order,
-                "content_types": section.get_available_content_types(),
-                "has_video": section.has_video(),
-                "has_audio": section.has_audio(),
-                "has_text": section.has_text(),
-            }
-        )
-    return context_sections
+    return get_training_sections_context()
 
 
 def _build_system_prompt(language_instruction=None):
@@ -125,13 +112,27 @@ def _ensure_session(user, session_id=None):
     )
 
 
-def _generate_watson_reply(session, message_text, language_instruction: Optional[str] = None):
-    try:
-        from aichat.rag_retriever import retrieve_relevant_chunks
-    except Exception:
-        retrieve_relevant_chunks = None
+def _build_retrieval_query(context_block, message_text):
+    return (
+        f"User question: {message_text}\n"
+        f"UHFS score: {context_block.get('uhfs_score')}\n"
+        f"Components: {context_block.get('uhfs_components')}\n"
+        "Retrieve documents that explain this situation and suggest suitable products "
+        "and training modules to improve the user's UHFS."
+    )
 
-    context_block = _build_context_block(
+
+def _format_retrieved_docs(retrieved_docs):
+    chunks = []
+    for d in retrieved_docs or []:
+        title = d.get("title") or d.get("id", "")
+        text = d.get("text", "")
+        chunks.append(f"[{d.get('type','doc')}:{d.get('id','')}] {title}\n{text}")
+    return "\n\n".join(chunks)
+
+
+def _session_context_block(session):
+    return _build_context_block(
         session.uhfs_score,
         session.uhfs_components,
         session.uhfs_overall_risk,
@@ -139,62 +140,90 @@ def _generate_watson_reply(session, message_text, language_instruction: Optional
         training_sections=_get_training_sections_context(),
     )
 
-    retrieval_query = (
-        f"User question: {message_text}\n"
-        f"UHFS score: {context_block.get('uhfs_score')}\n"
-        f"Components: {context_block.get('uhfs_components')}\n"
-        "Retrieve documents that explain this situation and suggest suitable products "
-        "and training modules to improve the user's UHFS."
+
+def _assemble_watson_messages(context_block, retrieved_text_block, history, message_text, language_instruction=None):
+    messages = [{"role": "system", "content": _build_system_prompt(language_instruction)}]
+    messages.append(
+        {
+            "role": "system",
+            "content": (
+                "Context (compact JSON: uhfs, suggested products ranked by relevance, training sections):\n"
+                f"{render_context(context_block)}"
+            ),
+        }
     )
-    retrieved_text_block = ""
+    if history and history[-1]["role"] == "user" and history[-1]["content"] == message_text:
+        history = history[:-1]
+    messages.extend(history)
+    if retrieved_text_block:
+        messages.append(
+            {
+                "role": "system",
+                "content": (
+                    "Retrieved knowledge snippets (RAG). Use these as factual references "
+                    "when giving advice. If something conflicts with safety or UHFS logic, "
+                    "prioritize safety and UHFS rules:\n"
+                    f"{retrieved_text_block}"
+                ),
+            }
+        )
+    messages.append({"role": "user", "content": message_text})
+    return messages
+
+
+WATSON_UNAVAILABLE_REPLY = (
+    "I couldn't reach the Watson agent right now. "
+    "Please try again later."
+)
+
+
+def _generate_watson_reply(session, message_text, language_instruction: Optional[str] = None):
+    try:
+        from aichat.rag_retriever import retrieve_relevant_chunks
+    except Exception:
+        retrieve_relevant_chunks = None
+
+    context_block = _session_context_block(session)
+
+    retrieved_docs = []
     if retrieve_relevant_chunks:
         try:
-            retrieved_docs = retrieve_relevant_chunks(retrieval_query, top_k=5)
+            retrieved_docs = retrieve_relevant_chunks(_build_retrieval_query(context_block, message_text), top_k=5)
         except Exception as e:
             logger.error(f"Watson RAG retrieval failed: {e}")
             retrieved_docs = []
 
-        if retrieved_docs:
-            chunks = []
-            for d in retrieved_docs:
-                title = d.get("title") or d.get("id", "")
-                text = d.get("text", "")
-                chunks.append(f"[{d.get('type','doc')}:{d.get('id','')}] {title}\n{text}")
-            retrieved_text_block = "\n\n".join(chunks)
+    history = load_history(session)
 
-    history = []
-    for msg in session.messages.order_by("created_at").all()[:20]:
-        history.append({"role": msg.role, "content": msg.content})
-
-    messages = [{"role": "system", "content": _build_system_prompt(language_instruction)}]
-    system_context = (
-        "Context JSON (UHFS + suggested products + training_sections):\n"
-        f"{context_block}"
+    messages = _assemble_watson_messages(
+        context_block, _format_retrieved_docs(retrieved_docs), history, message_text, language_instruction
     )
-    if retrieved_text_block:
-        system_context += (
-            "\n\nRetrieved knowledge snippets (RAG). Use these as factual references "
-            "when giving advice. If something conflicts with safety or UHFS logic, "
-            "prioritize safety and UHFS rules:\n"
-            f"{retrieved_text_block}"
-        )
-    messages.append({"role": "system", "content": system_context})
-    messages.extend(history)
-    if not history or history[-1]["role"] != "user" or history[-1]["content"] != message_text:
-        messages.append({"role": "user", "content": message_text})
 
     try:
         reply_text = send_watson_chat(messages, context=context_block, temperature=0.2)
     except Exception as e:
         logger.error(f"Watson orchestration call failed: {e}")
-        reply_text = (
-            "I couldn't reach the Watson agent right now. "
-            "Please try again later."
-        )
+        reply_text = WATSON_UNAVAILABLE_REPLY
 
     return reply_text
 
 
+def _save_user_message(session, message_text, files=None):
+    user_msg = WatsonChatMessage.objects.create(
+        session=session,
+        role="user",
+        content=message_text,
+    )
+    for file_key, f in (files or {}).items():
+        WatsonChatAttachment.objects.create(
+            message=user_msg,
+            file=f,
+            original_name=getattr(f, "name", ""),
+            mime_type=getattr(f, "content_type", ""),
+        )
+    return user_msg
+
+
 class WatsonInitView(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -242,19 +271,7 @@ class WatsonChatView(APIView):
         except WatsonChatSession.DoesNotExist:
             return Response({"error": "Session not found"}, status=404)
 
-        user_msg = WatsonChatMessage.objects.create(
-            session=session,
-            role="user",
-            content=message_text,
-        )
-
-        for file_key, f in request.FILES.items():
-            WatsonChatAttachment.objects.create(
-                message=user_msg,
-                file=f,
-                original_name=getattr(f, "name", ""),
-                mime_type=getattr(f, "content_type", ""),
-            )
+        user_msg = _save_user_message(session, message_text, request.FILES)
 
         reply_text = _generate_watson_reply(session, message_text)
 
@@ -1,8 +1,13 @@
+import asyncio
 import json
 import logging
-from typing import Dict, List, Optional, Any
+import threading
+import weakref
+from typing import Dict, List, Optional, Any, Tuple
 
+import httpx
 import requests
+from requests.adapters import HTTPAdapter
 from django.conf import settings
 
 logger = logging.getLogger(__name__)
@@ -17,14 +22,42 @@ def _get_config() -> Dict[str, str]:
     }
 
 
-def send_watson_chat(
+WATSON_TIMEOUT_SECONDS = 30
+
+# Keep-alive connections to the orchestration endpoint are reused across calls:
+# one requests.Session per thread, one httpx.AsyncClient per event loop.
+_thread_local = threading.local()
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+
+
+def _get_session() -> requests.Session:
+    session = getattr(_thread_local, "session", None)
+    if session is None:
+        session = requests.Session()
+        session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=10))
+        _thread_local.session = session
+    return session
+
+
+def _get_async_client() -> httpx.AsyncClient:
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(
+            timeout=WATSON_TIMEOUT_SECONDS,
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+        )
+        _async_clients[loop] = client
+    return client
+
+
+def _build_request(
     messages: List[Dict[str, str]],
-    context: Optional[Dict[str, Any]] = None,
-    temperature: float = 0.2,
-) -> str:
+    context: Optional[Dict[str, Any]],
+    temperature: float,
+) -> Tuple[str, Dict[str, Any], Dict[str, str]]:
     """
-    Call IBM Watson AI Orchestration to get a chat reply.
-    The payload is kept generic; adjust `base_url` and fields to match the deployed agent spec.
+    URL, JSON payload and headers for a Watson orchestration call.
     """
     cfg = _get_config()
     missing = [k for k, v in cfg.items() if not v]
@@ -43,12 +76,10 @@ def send_watson_chat(
         "Authorization": f"Bearer {cfg['api_key']}",
         "Content-Type": "application/json",
     }
+    return url, payload, headers
 
-    logger.info("Calling Watson orchestration agent")
-    resp = requests.post(url, json=payload, headers=headers, timeout=30)
-    resp.raise_for_status()
-    data = resp.json()
 
+def _parse_reply(data: Dict[str, Any]) -> str:
     # Try common response shapes; keep fallback to raw JSON.
     text = (
         data.get("output_text")
@@ -62,3 +93,35 @@ def send_watson_chat(
     logger.warning("Unexpected Watson response shape; returning raw JSON")
     return json.dumps(data)
 
+
+def send_watson_chat(
+    messages: List[Dict[str, str]],
+    context: Optional[Dict[str, Any]] = None,
+    temperature: float = 0.2,
+) -> str:
+    """
+    Call IBM Watson AI Orchestration to get a chat reply.
+    The payload is kept generic; adjust `base_url` and fields to match the deployed agent spec.
+    """
+    url, payload, headers = _build_request(messages, context, temperature)
+
+    logger.info("Calling Watson orchestration agent")
+    resp = _get_session().post(url, json=payload, headers=headers, timeout=WATSON_TIMEOUT_SECONDS)
+    resp.raise_for_status()
+    return _parse_reply(resp.json())
+
+
+async def asend_watson_chat(
+    messages: List[Dict[str, str]],
+    context: Optional[Dict[str, Any]] = None,
+    temperature: float = 0.2,
+) -> str:
+    """
+    Async variant of send_watson_chat (httpx), for the ASGI Watson views.
+    """
+    url, payload, headers = _build_request(messages, context, temperature)
+
+    logger.info("Calling Watson orchestration agent (async)")
+    resp = await _get_async_client().post(url, json=payload, headers=headers)
+    resp.raise_for_status()
+    return _parse_reply(resp.json())
@@ -0,0 +1,136 @@
+"""
+Approximate nearest-neighbour search for the RAG index (pure NumPy IVF).
+
+An inverted-file index partitions the normalised embedding rows into `n_lists`
+clusters with spherical k-means. A query is compared with the centroids, and
+only the rows of the `n_probe` closest clusters are scored exactly. `n_probe`
+is the recall/latency knob: n_probe == n_lists is exact search.
+"""
+import math
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from .rag_store import normalize_rows
+
+# Rows assigned per block during k-means, to bound the (rows x n_lists) score matrix.
+ASSIGN_BLOCK_ROWS = 8192
+# Rows sampled to train the centroids.
+MAX_TRAINING_ROWS = 50_000
+
+
+def default_n_lists(n_rows: int) -> int:
+    return max(1, min(n_rows, int(round(4 * math.sqrt(n_rows)))))
+
+
+def _assign(rows: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    labels = np.empty(rows.shape[0], dtype=np.int64)
+    for start in range(0, rows.shape[0], ASSIGN_BLOCK_ROWS):
+        block = np.asarray(rows[start:start + ASSIGN_BLOCK_ROWS], dtype=np.float32)
+        labels[start:start + block.shape[0]] = np.argmax(block @ centroids.T, axis=1)
+    return labels
+
+
+def _spherical_kmeans(x: np.ndarray, k: int, n_iter: int, rng: np.random.Generator) -> np.ndarray:
+    centroids = x[rng.choice(x.shape[0], size=k, replace=False)].copy()
+    for _ in range(n_iter):
+        labels = _assign(x, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, x)
+        counts = np.bincount(labels, minlength=k)
+        empty = np.flatnonzero(counts == 0)
+        if empty.size:
+            # Re-seed empty clusters with random rows
+            sums[empty] = x[rng.choice(x.shape[0], size=empty.size, replace=False)]
+        centroids = normalize_rows(sums).astype(np.float32)
+    return centroids
+
+
+class IVFIndex:
+    """
+    Centroids plus row ids grouped by cluster (CSR-style offsets into list_ids).
+    The embedding matrix itself is not copied; search scores rows of the caller's matrix.
+    """
+
+    def __init__(self, centroids: np.ndarray, list_offsets: np.ndarray, list_ids: np.ndarray):
+        self.centroids = centroids
+        self.list_offsets = list_offsets
+        self.list_ids = list_ids
+
+    @property
+    def n_lists(self) -> int:
+        return self.centroids.shape[0]
+
+    @classmethod
+    def build(
+        cls,
+        matrix: np.ndarray,
+        n_lists: Optional[int] = None,
+        n_iter: int = 10,
+        seed: int = 0,
+    ) -> "IVFIndex":
+        """
+        Train centroids on (a sample of) the normalised rows and assign every row to a list.
+        """
+        n_rows = matrix.shape[0]
+        n_lists = min(n_lists or default_n_lists(n_rows), n_rows)
+        rng = np.random.default_rng(seed)
+        if n_rows > MAX_TRAINING_ROWS:
+            sample = np.sort(rng.choice(n_rows, size=MAX_TRAINING_ROWS, replace=False))
+            training = np.asarray(matrix[sample], dtype=np.float32)
+        else:
+            training = np.asarray(matrix, dtype=np.float32)
+        centroids = _spherical_kmeans(training, n_lists, n_iter, rng)
+
+        labels = _assign(matrix, centroids)
+        list_ids = np.argsort(labels, kind="stable").astype(np.int64)
+        counts = np.bincount(labels, minlength=n_lists)
+        list_offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        return cls(centroids, list_offsets, list_ids)
+
+    def save(self, path) -> None:
+        with open(path, "wb") as f:
+            np.savez(f, centroids=self.centroids, list_offsets=self.list_offsets, list_ids=self.list_ids)
+
+    @classmethod
+    def load(cls, path) -> "IVFIndex":
+        with np.load(path) as data:
+            return cls(data["centroids"], data["list_offsets"], data["list_ids"])
+
+    def search(
+        self,
+        matrix: np.ndarray,
+        queries: np.ndarray,
+        top_k: int,
+        n_probe: int,
+        scales: Optional[np.ndarray] = None,
+    ) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        For each normalised float32 query, return (scores, row_ids) of its top_k
+        rows among the n_probe closest lists, best first. `scales` are the
+        per-row factors of an int8-quantised matrix.
+        """
+        n_probe = max(1, min(n_probe, self.n_lists))
+        centroid_scores = queries @ self.centroids.T
+        if n_probe < self.n_lists:
+            probes = np.argpartition(-centroid_scores, n_probe - 1, axis=1)[:, :n_probe]
+        else:
+            probes = np.broadcast_to(np.arange(self.n_lists), centroid_scores.shape)
+
+        results = []
+        for query, lists in zip(queries, probes):
+            candidates = np.concatenate(
+                [self.list_ids[self.list_offsets[c]:self.list_offsets[c + 1]] for c in lists]
+            )
+            if candidates.size == 0:
+                results.append((np.empty(0, dtype=np.float32), candidates))
+                continue
+            candidates.sort()  # sequential reads from a memory-mapped matrix
+            scores = np.asarray(matrix[candidates], dtype=np.float32) @ query
+            if scales is not None:
+                scores *= scales[candidates]
+            k = min(top_k, candidates.size)
+            top = np.argpartition(-scores, k - 1)[:k] if k < candidates.size else np.arange(candidates.size)
+            top = top[np.argsort(-scores[top])]
+            results.append((scores[top], candidates[top]))
+        return results
@@ -0,0 +1,356 @@
+"""
+Semantic answer cache for FinMate.
+
+Frequent standalone questions ("how do I improve my score", "what is
+PM-SVANidhi") are answered from earlier replies when a previous question in the
+same partition is similar enough. Partitions are deliberately coarse, so
+users with similar profiles share answers. A partition is keyed by:
+
+- the UHFS score bucket (ANSWER_CACHE_SCORE_BUCKET points wide),
+- overall_risk,
+- the set of weak UHFS components (below ANSWER_CACHE_WEAK_BELOW),
+- the categories of the suggested products,
+- the language instruction,
+- a content version.
+
+"Similar enough" means the cosine similarity of the question embeddings is at
+least ANSWER_CACHE_THRESHOLD. Products and training changes rotate the content
+version (see aichat.signals), so stale answers are never served. Each partition
+is a ring of ANSWER_CACHE_MAX_ENTRIES slots, one TieredCache key per entry, so
+workers sharing a Redis alias also share answers. The next slot comes from an
+atomic counter in the shared cache, so concurrent stores never overwrite each
+other's entries.
+
+Versions and entries live in ANSWER_CACHE_ALIAS, which must be a shared cache
+(e.g. Redis via REDIS_CACHE_URL): with a per-process backend such as the
+LocMemCache default, a product change would only invalidate the process that
+saved it, so the cache is disabled instead.
+
+Only first turns are cached. Later turns depend on the conversation, which the
+key does not capture. The user's own numbers (the score in "Your UHFS score is
+X" and the exact component values) are templated out on store and filled in
+from the asking user's profile on a hit.
+"""
+import logging
+import random
+import re
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import caches
+
+from common.utils import is_shared_cache
+
+from .cache import TieredCache, hash_key
+
+logger = logging.getLogger(__name__)
+
+ANSWER_CACHE_ENABLED = getattr(settings, "FINMATE_ANSWER_CACHE_ENABLED", True)
+ANSWER_CACHE_THRESHOLD = getattr(settings, "FINMATE_ANSWER_CACHE_THRESHOLD", 0.93)
+ANSWER_CACHE_TTL = getattr(settings, "FINMATE_ANSWER_CACHE_TTL", 6 * 60 * 60)
+ANSWER_CACHE_SCORE_BUCKET = getattr(settings, "FINMATE_ANSWER_CACHE_SCORE_BUCKET", 10)
+ANSWER_CACHE_WEAK_BELOW = getattr(settings, "FINMATE_ANSWER_CACHE_WEAK_BELOW", 0.5)
+ANSWER_CACHE_MAX_ENTRIES = getattr(settings, "FINMATE_ANSWER_CACHE_MAX_ENTRIES", 64)
+ANSWER_CACHE_ALIAS = getattr(settings, "FINMATE_ANSWER_CACHE_ALIAS", "default")
+# Reduced-size embeddings are plenty for question matching
+ANSWER_CACHE_DIMENSIONS = getattr(settings, "FINMATE_ANSWER_CACHE_DIMENSIONS", 256)
+
+VERSION_KEY = "finmate-answer:version"
+SLOT_COUNTER_PREFIX = "finmate-answer:slot"
+VERSION_CHECK_INTERVAL = 5.0
+
+_SCORE_PHRASE_RE = r"(UHFS score (?:is|of)\s*\**\s*){score}\b"
+_PLACEHOLDER = "\x00{name}\x00"
+_PLACEHOLDER_RE = re.compile("\x00([^\x00]+)\x00")
+
+_answers = TieredCache(
+    "finmate-answer",
+    maxsize=512,
+    ttl=ANSWER_CACHE_TTL,
+    shared_alias=ANSWER_CACHE_ALIAS,
+)
+
+_lock = threading.Lock()
+_version: Dict[str, Any] = {"value": None, "checked_at": 0.0}
+_stats = {"hits": 0, "misses": 0, "stores": 0, "errors": 0}
+_warned = {"per_process": False}
+
+
+class AnswerProbe:
+    """
+    A question's partition and embedding, kept from lookup for the later store.
+    """
+
+    def __init__(self, partition: str, embedding: np.ndarray, question: str, values: Dict[str, Any]):
+        self.partition = partition
+        self.embedding = embedding
+        self.question = question
+        self.values = values
+
+
+def _count(stat: str) -> None:
+    with _lock:
+        _stats[stat] += 1
+
+
+def get_answer_cache_stats() -> Dict[str, Any]:
+    with _lock:
+        stats = dict(_stats)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+    return stats
+
+
+def _content_version() -> str:
+    now = time.monotonic()
+    with _lock:
+        if _version["value"] is not None and now - _version["checked_at"] < VERSION_CHECK_INTERVAL:
+            return _version["value"]
+    try:
+        cache = caches[ANSWER_CACHE_ALIAS]
+        version = cache.get(VERSION_KEY)
+        if version is None:
+            cache.add(VERSION_KEY, uuid.uuid4().hex, timeout=None)
+            version = cache.get(VERSION_KEY)
+    except Exception as e:
+        logger.warning(f"Answer cache version unavailable: {e}")
+        version = None
+    version = version or "local"
+    with _lock:
+        _version.update(value=version, checked_at=now)
+    return version
+
+
+def invalidate_answer_cache() -> None:
+    """
+    Rotate the content version so every cached answer is bypassed.
+    """
+    with _lock:
+        _version.update(value=None, checked_at=0.0)
+    try:
+        caches[ANSWER_CACHE_ALIAS].set(VERSION_KEY, uuid.uuid4().hex, timeout=None)
+    except Exception as e:
+        logger.warning(f"Answer cache invalidation failed: {e}")
+    _answers.local.clear()
+
+
+def score_bucket(uhfs_score) -> str:
+    if uhfs_score is None:
+        return "none"
+    return str(int(uhfs_score) // ANSWER_CACHE_SCORE_BUCKET)
+
+
+def weak_components(uhfs_components) -> List[str]:
+    if not isinstance(uhfs_components, dict):
+        return []
+    return sorted(
+        k for k, v in uhfs_components.items() if isinstance(v, (int, float)) and v < ANSWER_CACHE_WEAK_BELOW
+    )
+
+
+def product_categories(suggested_products) -> List[str]:
+    return sorted(
+        {(p.get("category") or "").strip().lower() for p in suggested_products or [] if isinstance(p, dict)}
+    )
+
+
+def partition_key(
+    uhfs_score, overall_risk, language_instruction, uhfs_components=None, suggested_products=None
+) -> str:
+    return hash_key(
+        _content_version(),
+        score_bucket(uhfs_score),
+        weak_components(uhfs_components),
+        product_categories(suggested_products),
+        (overall_risk or "").lower(),
+        (language_instruction or "").strip().lower(),
+    )
+
+
+def profile_values(uhfs_score, uhfs_components=None) -> Dict[str, Any]:
+    """
+    The per-user numbers templated out of cached answers.
+    """
+    values = {"uhfs_score": uhfs_score}
+    if isinstance(uhfs_components, dict):
+        values.update(
+            (f"component_{k}", v) for k, v in uhfs_components.items() if isinstance(v, (int, float))
+        )
+    return values
+
+
+def session_partition_key(session, language_instruction=None) -> str:
+    return partition_key(
+        session.uhfs_score,
+        session.uhfs_overall_risk,
+        language_instruction,
+        session.uhfs_components,
+        session.suggested_products_snapshot,
+    )
+
+
+def _slot_keys(partition: str) -> List[str]:
+    return [f"{partition}:{slot}" for slot in range(ANSWER_CACHE_MAX_ENTRIES)]
+
+
+def _next_slot(partition: str) -> int:
+    counter_key = f"{SLOT_COUNTER_PREFIX}:{partition}"
+    try:
+        cache = caches[ANSWER_CACHE_ALIAS]
+        cache.add(counter_key, 0, timeout=ANSWER_CACHE_TTL)
+        return cache.incr(counter_key) % ANSWER_CACHE_MAX_ENTRIES
+    except Exception as e:
+        # Counter expired between add and incr, or no shared cache: any slot will do
+        logger.debug(f"Answer cache slot counter unavailable: {e}")
+        return random.randrange(ANSWER_CACHE_MAX_ENTRIES)
+
+
+def _templatize(answer: str, values: Dict[str, Any]) -> str:
+    uhfs_score = values.get("uhfs_score")
+    if uhfs_score is not None:
+        placeholder = _PLACEHOLDER.format(name="uhfs_score")
+        pattern = _SCORE_PHRASE_RE.format(score=re.escape(str(uhfs_score)))
+        answer = re.sub(pattern, lambda m: m.group(1) + placeholder, answer, flags=re.IGNORECASE)
+    for name, value in values.items():
+        # Exact component values such as 0.41237; short ones like 0.5 are too ambiguous
+        if name == "uhfs_score" or value is None or len(str(value)) < 4:
+            continue
+        pattern = rf"(?<![\d.]){re.escape(str(value))}(?!\d)"
+        answer = re.sub(pattern, _PLACEHOLDER.format(name=name), answer)
+    return answer
+
+
+def _render(answer: str, values: Dict[str, Any]) -> Optional[str]:
+    """
+    answer with the placeholders filled from values, or None if one has no value.
+    """
+    missing = False
+
+    def fill(m):
+        nonlocal missing
+        value = values.get(m.group(1))
+        if value is None:
+            missing = True
+            return ""
+        return str(value)
+
+    rendered = _PLACEHOLDER_RE.sub(fill, answer)
+    return None if missing else rendered
+
+
+def _normalize(embedding) -> Optional[np.ndarray]:
+    vec = np.asarray(embedding, dtype=np.float32)
+    norm = float(np.linalg.norm(vec))
+    if not vec.size or norm == 0.0:
+        return None
+    return vec / norm
+
+
+def _best_match(entries: List[Dict[str, Any]], embedding: np.ndarray) -> Tuple[float, Optional[Dict[str, Any]]]:
+    now = time.time()
+    live = [e for e in entries if now - e["t"] < ANSWER_CACHE_TTL and len(e["e"]) == embedding.size]
+    if not live:
+        return 0.0, None
+    scores = np.asarray([e["e"] for e in live], dtype=np.float32) @ embedding
+    best = int(np.argmax(scores))
+    return float(scores[best]), live[best]
+
+
+def _lookup(partition: str, embedding: np.ndarray, values: Dict[str, Any]) -> Optional[str]:
+    score, entry = _best_match(list(_answers.get_many(_slot_keys(partition)).values()), embedding)
+    answer = _render(entry["a"], values) if entry is not None and score >= ANSWER_CACHE_THRESHOLD else None
+    if answer is None:
+        _count("misses")
+        return None
+    _count("hits")
+    logger.info(f"FinMate answer cache hit (similarity {score:.3f})")
+    return answer
+
+
+def _probe(session, embedding: np.ndarray, question: str, language_instruction) -> AnswerProbe:
+    return AnswerProbe(
+        session_partition_key(session, language_instruction),
+        embedding,
+        question,
+        profile_values(session.uhfs_score, session.uhfs_components),
+    )
+
+
+def _cache_usable() -> bool:
+    if not ANSWER_CACHE_ENABLED:
+        return False
+    if not is_shared_cache(ANSWER_CACHE_ALIAS):
+        if not _warned["per_process"]:
+            _warned["per_process"] = True
+            logger.warning(
+                f"FinMate answer cache disabled: cache alias '{ANSWER_CACHE_ALIAS}' is not shared between processes"
+            )
+        return False
+    return True
+
+
+def lookup_answer(session, question: str, language_instruction=None) -> Tuple[Optional[str], Optional[AnswerProbe]]:
+    """
+    Return (cached answer or None, probe for store_answer). Never raises.
+    """
+    if not _cache_usable():
+        return None, None
+    from .rag_retriever import embed_query
+
+    try:
+        embedding = _normalize(embed_query(question, dimensions=ANSWER_CACHE_DIMENSIONS))
+        if embedding is None:
+            return None, None
+        probe = _probe(session, embedding, question, language_instruction)
+        return _lookup(probe.partition, embedding, probe.values), probe
+    except Exception as e:
+        _count("errors")
+        logger.warning(f"Answer cache lookup failed: {e}")
+        return None, None
+
+
+async def alookup_answer(
+    session, question: str, language_instruction=None
+) -> Tuple[Optional[str], Optional[AnswerProbe]]:
+    """
+    Async variant of lookup_answer.
+    """
+    if not _cache_usable():
+        return None, None
+    from .rag_retriever import aembed_queries
+
+    try:
+        embeddings = await aembed_queries([question], dimensions=ANSWER_CACHE_DIMENSIONS)
+        embedding = _normalize(embeddings[0]) if embeddings else None
+        if embedding is None:
+            return None, None
+        probe = _probe(session, embedding, question, language_instruction)
+        return _lookup(probe.partition, embedding, probe.values), probe
+    except Exception as e:
+        _count("errors")
+        logger.warning(f"Answer cache lookup failed: {e}")
+        return None, None
+
+
+def store_answer(probe: Optional[AnswerProbe], answer: str) -> None:
+    """
+    Add a freshly generated answer to the next slot of its partition (the oldest is replaced).
+    """
+    if probe is None or not answer:
+        return
+    try:
+        entry = {
+            "e": probe.embedding.tolist(),
+            "q": probe.question,
+            "a": _templatize(answer, probe.values),
+            "t": time.time(),
+        }
+        _answers.set(f"{probe.partition}:{_next_slot(probe.partition)}", entry)
+        _count("stores")
+    except Exception as e:
+        _count("errors")
+        logger.warning(f"Answer cache store failed: {e}")
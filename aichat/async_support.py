@@ -0,0 +1,60 @@
+"""
+Helpers for the async (ASGI) chat views.
+
+DRF's APIView is synchronous, so the async chat endpoints are plain Django
+async views. These helpers give them the same JWT authentication and request
+parsing the DRF views get.
+"""
+import functools
+import json
+import logging
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+logger = logging.getLogger(__name__)
+
+_jwt_authentication = JWTAuthentication()
+
+
+def _authenticate(request):
+    try:
+        result = _jwt_authentication.authenticate(request)
+    except AuthenticationFailed as e:
+        logger.info(f"Async view authentication failed: {e}")
+        return None
+    return result[0] if result else None
+
+
+def async_login_required(view):
+    """
+    Authenticate an async view with the SimpleJWT bearer token (401 if missing or invalid).
+    """
+
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        user = await sync_to_async(_authenticate)(request)
+        if user is None or not user.is_active:
+            return JsonResponse(
+                {"detail": "Authentication credentials were not provided or are invalid."},
+                status=401,
+            )
+        request.user = user
+        return await view(request, *args, **kwargs)
+
+    return wrapper
+
+
+def request_data(request):
+    """
+    Body of a JSON or form/multipart request as a dict; None for malformed JSON.
+    """
+    if request.content_type == "application/json":
+        try:
+            data = json.loads(request.body or b"{}")
+        except ValueError:
+            return None
+        return data if isinstance(data, dict) else None
+    return request.POST.dict()
@@ -0,0 +1,214 @@
+"""
+Async (ASGI) FinMate init/chat endpoints.
+
+Same request/response contract as FinMateInitView and FinMateChatView, but the
+embedding and completion calls use AsyncOpenAI and message/session writes use
+the async ORM, so an in-flight LLM call holds a socket instead of a worker
+thread. Routed in place of the DRF views when CHAT_ASYNC_VIEWS is enabled.
+
+The voice job events (SSE) endpoint only exists here: a subscriber waits on
+asyncio.sleep between polls instead of pinning a WSGI worker for the whole
+subscription. Under WSGI, clients poll the job status endpoint instead.
+"""
+import asyncio
+import logging
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+
+from .answer_cache import store_answer
+from .async_support import async_login_required, request_data
+from .guardrails import get_safe_fallback_message
+from .history import maybe_schedule_summary
+from .llm_clients import get_async_openai_client
+from .models import ChatSession, ChatMessage, VoiceJob
+from .orchestrator import aprepare_turn
+from .serializers import (
+    ChatSessionSerializer,
+    ChatMessageSerializer,
+    FinMateChatRequestSerializer,
+    VoiceJobSerializer,
+)
+from .uploads import UploadError
+from .views import (
+    FINMATE_MISSING_KEY_REPLY,
+    FINMATE_UNAVAILABLE_REPLY,
+    _ensure_chat_session,
+    _get_uhfs_and_products,
+    _save_user_message,
+    _sse_event,
+    _turn_messages,
+)
+
+logger = logging.getLogger(__name__)
+
+VOICE_JOB_EVENTS_TIMEOUT = getattr(settings, "VOICE_JOB_EVENTS_TIMEOUT", 120)
+VOICE_JOB_EVENTS_POLL_INTERVAL = 1.0
+
+
+async def agenerate_finmate_ai_reply(session, message_text, language_instruction=None):
+    """
+    Async counterpart of views._generate_finmate_ai_reply.
+    """
+    turn = await aprepare_turn(session, message_text, language_instruction)
+    if turn.blocked_reason:
+        logger.warning(f"FinMate message blocked by guardrails: {turn.blocked_reason}")
+        return get_safe_fallback_message()
+    if turn.cached_reply:
+        return turn.cached_reply
+
+    messages = _turn_messages(turn, message_text, language_instruction)
+
+    client = get_async_openai_client()
+    if client is None:
+        logger.error("OPENAI_API_KEY is not configured in settings/env.")
+        return FINMATE_MISSING_KEY_REPLY
+
+    try:
+        completion = await client.chat.completions.create(
+            model="gpt-4.1-mini",
+            messages=messages,
+            temperature=0.3,
+            max_tokens=600,
+        )
+        reply_text = completion.choices[0].message.content
+    except Exception as e:
+        logger.error(f"Error calling OpenAI: {e}")
+        return FINMATE_UNAVAILABLE_REPLY
+
+    store_answer(turn.answer_probe, reply_text)
+    return reply_text
+
+
+def _init_response_data(session, uhfs_score, uhfs_components, overall_risk, suggested_products):
+    return {
+        "session": ChatSessionSerializer(session).data,
+        "uhfs": {
+            "score": uhfs_score,
+            "components": uhfs_components,
+            "overall_risk": overall_risk,
+        },
+        "suggested_products": suggested_products,
+    }
+
+
+def _chat_response_data(session, user_msg, assistant_msg):
+    return {
+        "session": ChatSessionSerializer(session).data,
+        "user_message": ChatMessageSerializer(user_msg).data,
+        "assistant_message": ChatMessageSerializer(assistant_msg).data,
+    }
+
+
+@csrf_exempt
+@require_GET
+@async_login_required
+async def finmate_init(request):
+    """
+    GET /api/aichat/finmate/init/ (async)
+    """
+    uhfs_score, uhfs_components, overall_risk, suggested_products = await sync_to_async(
+        _get_uhfs_and_products
+    )(request.user)
+
+    session = await ChatSession.objects.acreate(
+        user=request.user,
+        title=f"FinMate session {timezone.now().date()}",
+        uhfs_score=uhfs_score,
+        uhfs_components=uhfs_components,
+        uhfs_overall_risk=overall_risk,
+        suggested_products_snapshot=suggested_products,
+    )
+
+    data = await sync_to_async(_init_response_data)(
+        session, uhfs_score, uhfs_components, overall_risk, suggested_products
+    )
+    return JsonResponse(data, status=200)
+
+
+@csrf_exempt
+@require_POST
+@async_login_required
+async def finmate_chat(request):
+    """
+    POST /api/aichat/finmate/chat/ (async)
+    """
+    data = request_data(request)
+    if data is None:
+        return JsonResponse({"error": "Malformed JSON body"}, status=400)
+    serializer = FinMateChatRequestSerializer(data=data)
+    if not serializer.is_valid():
+        return JsonResponse(serializer.errors, status=400)
+
+    session_id = serializer.validated_data.get("session_id")
+    message_text = serializer.validated_data["message"]
+
+    try:
+        session = await sync_to_async(_ensure_chat_session)(request.user, session_id)
+    except ChatSession.DoesNotExist:
+        return JsonResponse({"error": "Session not found"}, status=404)
+
+    try:
+        user_msg = await sync_to_async(_save_user_message)(
+            session, message_text, request.FILES, serializer.validated_data.get("attachment_tokens")
+        )
+    except UploadError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    reply_text = await agenerate_finmate_ai_reply(session, message_text)
+
+    assistant_msg = await ChatMessage.objects.acreate(
+        session=session,
+        role="assistant",
+        content=reply_text,
+    )
+    await sync_to_async(maybe_schedule_summary)(session)
+
+    response_data = await sync_to_async(_chat_response_data)(session, user_msg, assistant_msg)
+    return JsonResponse(response_data, status=200)
+
+
+def _voice_job_data(job):
+    return VoiceJobSerializer(job).data
+
+
+async def _stream_voice_job_events(job_id):
+    """
+    `status` on every status change, then `done` with the full job once it is
+    completed or failed (or `timeout` after VOICE_JOB_EVENTS_TIMEOUT seconds).
+    """
+    deadline = time.monotonic() + VOICE_JOB_EVENTS_TIMEOUT
+    last_status = None
+    while True:
+        job = await VoiceJob.objects.aget(id=job_id)
+        if job.status in VoiceJob.TERMINAL_STATUSES:
+            yield _sse_event("done", await sync_to_async(_voice_job_data)(job))
+            return
+        if job.status != last_status:
+            last_status = job.status
+            yield _sse_event("status", {"id": str(job.id), "status": job.status})
+        if time.monotonic() >= deadline:
+            yield _sse_event("timeout", {"id": str(job.id), "status": job.status})
+            return
+        await asyncio.sleep(VOICE_JOB_EVENTS_POLL_INTERVAL)
+
+
+@csrf_exempt
+@require_GET
+@async_login_required
+async def voice_job_events(request, job_id):
+    """
+    GET /api/aichat/voice/jobs/<job_id>/events/ (async)
+    Server-Sent Events for a voice job (`status`..., then `done` or `timeout`).
+    """
+    if not await VoiceJob.objects.filter(id=job_id, user=request.user).aexists():
+        return JsonResponse({"error": "Voice job not found"}, status=404)
+    response = StreamingHttpResponse(_stream_voice_job_events(job_id), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
@@ -0,0 +1,152 @@
+"""
+Local BM25 (lexical) index over the RAG documents.
+
+Built by build_rag_index from the same chunk docs as the vector index and
+stored next to it as rag_index.<build_id>.bm25.npz (CSR postings). It needs no
+network, so it serves as the fallback when the embeddings API is unavailable,
+and it gives exact-match recall for scheme names such as "PM-SVANidhi".
+"""
+import re
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+
+_TOKEN_RE = re.compile(r"\w+(?:[-/.]\w+)*")
+
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have how i if in into is it its me my "
+    "of on or our so that the their them then there these they this to was we what "
+    "when which who why will with you your".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lower-cased word tokens without stopwords. Compound tokens such as
+    "pm-svanidhi" are kept whole and also emitted as their joined form and parts,
+    so "PM SVANidhi", "PMSVANidhi" and "PM-SVANidhi" all match.
+    """
+    tokens: List[str] = []
+    for match in _TOKEN_RE.finditer((text or "").lower()):
+        token = match.group(0)
+        parts = [p for p in re.split(r"[-/.]", token) if p]
+        if len(parts) > 1:
+            tokens.append(token)
+            tokens.append("".join(parts))
+            tokens.extend(p for p in parts if p not in STOPWORDS)
+        elif token not in STOPWORDS:
+            tokens.append(token)
+    return tokens
+
+
+class BM25Index:
+    """
+    Okapi BM25 with postings stored as flat arrays:
+    term i's postings are doc_ids/tfs[offsets[i]:offsets[i + 1]].
+    """
+
+    def __init__(
+        self,
+        terms: List[str],
+        offsets: np.ndarray,
+        doc_ids: np.ndarray,
+        tfs: np.ndarray,
+        doc_lengths: np.ndarray,
+        k1: float = 1.5,
+        b: float = 0.75,
+    ):
+        self.term_index: Dict[str, int] = {t: i for i, t in enumerate(terms)}
+        self.terms = terms
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.tfs = tfs
+        self.doc_lengths = doc_lengths
+        self.k1 = k1
+        self.b = b
+        n_docs = len(doc_lengths)
+        df = np.diff(offsets).astype(np.float32)
+        self.idf = np.log1p((n_docs - df + 0.5) / (df + 0.5)).astype(np.float32)
+        avgdl = float(doc_lengths.mean()) if n_docs else 0.0
+        # Per-doc length normalisation term of the BM25 denominator
+        if avgdl:
+            self.norm = (k1 * (1 - b + b * doc_lengths / avgdl)).astype(np.float32)
+        else:
+            self.norm = np.zeros(n_docs, dtype=np.float32)
+
+    @property
+    def n_docs(self) -> int:
+        return len(self.doc_lengths)
+
+    @classmethod
+    def build(cls, texts: Iterable[str]) -> "BM25Index":
+        postings: Dict[str, Dict[int, int]] = {}
+        doc_lengths = []
+        for doc_id, text in enumerate(texts):
+            tokens = tokenize(text)
+            doc_lengths.append(len(tokens))
+            for token in tokens:
+                counts = postings.setdefault(token, {})
+                counts[doc_id] = counts.get(doc_id, 0) + 1
+
+        terms = sorted(postings)
+        offsets = [0]
+        doc_ids: List[int] = []
+        tfs: List[int] = []
+        for term in terms:
+            for doc_id, tf in sorted(postings[term].items()):
+                doc_ids.append(doc_id)
+                tfs.append(tf)
+            offsets.append(len(doc_ids))
+        return cls(
+            terms,
+            np.asarray(offsets, dtype=np.int64),
+            np.asarray(doc_ids, dtype=np.int32),
+            np.asarray(tfs, dtype=np.float32),
+            np.asarray(doc_lengths, dtype=np.float32),
+        )
+
+    def save(self, path) -> None:
+        with open(path, "wb") as f:
+            np.savez(
+                f,
+                terms=np.asarray(self.terms, dtype=str),
+                offsets=self.offsets,
+                doc_ids=self.doc_ids,
+                tfs=self.tfs,
+                doc_lengths=self.doc_lengths,
+            )
+
+    @classmethod
+    def load(cls, path) -> "BM25Index":
+        with np.load(path) as data:
+            return cls(
+                data["terms"].tolist(),
+                data["offsets"],
+                data["doc_ids"],
+                data["tfs"],
+                data["doc_lengths"],
+            )
+
+    def search(self, query: str, top_k: int = 5) -> List[Tuple[float, int]]:
+        """
+        Return up to top_k (score, row) pairs with a positive score, best first.
+        """
+        if not self.n_docs or top_k <= 0:
+            return []
+        scores = np.zeros(self.n_docs, dtype=np.float32)
+        for token in set(tokenize(query)):
+            i = self.term_index.get(token)
+            if i is None:
+                continue
+            start, end = self.offsets[i], self.offsets[i + 1]
+            ids = self.doc_ids[start:end]
+            tf = self.tfs[start:end]
+            scores[ids] += self.idf[i] * tf * (self.k1 + 1) / (tf + self.norm[ids])
+
+        matched = np.flatnonzero(scores > 0)
+        if matched.size == 0:
+            return []
+        k = min(top_k, matched.size)
+        top = matched[np.argpartition(-scores[matched], k - 1)[:k]] if k < matched.size else matched
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), int(i)) for i in top]
@@ -0,0 +1,195 @@
+"""
+Small caching helpers shared by the FinMate pipeline.
+
+LocalLRUCache is an in-process, thread-safe LRU with a TTL. TieredCache puts one
+in front of an optional shared Django cache alias (e.g. a django-redis backend),
+so a value computed by one worker can be reused by the others, and keeps
+hit/miss counters for monitoring.
+"""
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+def hash_key(*parts: Any) -> str:
+    """
+    Stable sha256 key over the given parts (joined with a separator that cannot appear in str()).
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+class LocalLRUCache:
+    """
+    Thread-safe in-process LRU cache with an optional TTL (seconds, None = no expiry).
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                return default
+            expires_at, value = entry
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any) -> None:
+        if self.maxsize <= 0:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class TieredCache:
+    """
+    In-process LRU tier in front of an optional shared Django cache.
+    Errors from the shared tier are logged and treated as misses, so an
+    unavailable Redis never fails the request.
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        maxsize: int = 1024,
+        ttl: Optional[float] = None,
+        shared_alias: Optional[str] = None,
+    ):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.shared_alias = shared_alias
+        self.local = LocalLRUCache(maxsize=maxsize, ttl=ttl)
+        self._stats_lock = threading.Lock()
+        self._stats = {"local_hits": 0, "shared_hits": 0, "misses": 0}
+
+    def _shared(self):
+        if not self.shared_alias:
+            return None
+        try:
+            return caches[self.shared_alias]
+        except Exception as e:
+            logger.warning(f"Shared cache '{self.shared_alias}' unavailable: {e}")
+            return None
+
+    def _shared_key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    def _count(self, stat: str) -> None:
+        with self._stats_lock:
+            self._stats[stat] += 1
+
+    def get(self, key: str, default: Any = None) -> Any:
+        value = self.local.get(key, _MISSING)
+        if value is not _MISSING:
+            self._count("local_hits")
+            return value
+
+        shared = self._shared()
+        if shared is not None:
+            try:
+                value = shared.get(self._shared_key(key), _MISSING)
+            except Exception as e:
+                logger.warning(f"Shared cache get failed for {self.namespace}: {e}")
+                value = _MISSING
+            if value is not _MISSING:
+                self.local.set(key, value)
+                self._count("shared_hits")
+                return value
+
+        self._count("misses")
+        return default
+
+    def get_many(self, keys) -> Dict[str, Any]:
+        """
+        {key: value} for the keys found; local misses go to the shared tier in one round trip.
+        """
+        found, missing = {}, []
+        for key in keys:
+            value = self.local.get(key, _MISSING)
+            if value is _MISSING:
+                missing.append(key)
+            else:
+                found[key] = value
+                self._count("local_hits")
+
+        shared = self._shared()
+        if missing and shared is not None:
+            try:
+                values = shared.get_many([self._shared_key(key) for key in missing])
+            except Exception as e:
+                logger.warning(f"Shared cache get_many failed for {self.namespace}: {e}")
+                values = {}
+            still_missing = []
+            for key in missing:
+                value = values.get(self._shared_key(key), _MISSING)
+                if value is _MISSING:
+                    still_missing.append(key)
+                    continue
+                self.local.set(key, value)
+                found[key] = value
+                self._count("shared_hits")
+            missing = still_missing
+        for _ in missing:
+            self._count("misses")
+        return found
+
+    def set(self, key: str, value: Any) -> None:
+        self.local.set(key, value)
+        shared = self._shared()
+        if shared is not None:
+            try:
+                shared.set(self._shared_key(key), value, timeout=self.ttl)
+            except Exception as e:
+                logger.warning(f"Shared cache set failed for {self.namespace}: {e}")
+
+    def delete(self, key: str) -> None:
+        self.local.delete(key)
+        shared = self._shared()
+        if shared is not None:
+            try:
+                shared.delete(self._shared_key(key))
+            except Exception as e:
+                logger.warning(f"Shared cache delete failed for {self.namespace}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        lookups = stats["local_hits"] + stats["shared_hits"] + stats["misses"]
+        stats["hit_rate"] = (lookups - stats["misses"]) / lookups if lookups else 0.0
+        stats["local_size"] = len(self.local)
+        return stats
@@ -0,0 +1,127 @@
+"""
+Split RAG documents into overlapping, token-bounded chunks.
+
+Text is packed sentence by sentence up to the token budget; consecutive chunks
+share roughly `overlap_tokens` of trailing sentences so facts that straddle a
+boundary stay retrievable. Sentences longer than the budget are split on
+token windows. Token counts use tiktoken's cl100k_base (the encoding of the
+text-embedding-3 models) when available, else a ~4 chars/token estimate.
+"""
+import re
+from functools import lru_cache
+from typing import Any, Dict, List
+
+DEFAULT_CHUNK_TOKENS = 400
+DEFAULT_CHUNK_OVERLAP = 60
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?।])\s+|\n+")
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    try:
+        import tiktoken
+
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return None
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    enc = _encoding()
+    if enc is not None:
+        return len(enc.encode(text))
+    return len(text) // 4 + 1
+
+
+def _split_long(sentence: str, max_tokens: int, overlap_tokens: int) -> List[str]:
+    """
+    Window a single over-long sentence by tokens (or by characters without tiktoken).
+    """
+    step = max(1, max_tokens - overlap_tokens)
+    enc = _encoding()
+    if enc is not None:
+        tokens = enc.encode(sentence)
+        return [enc.decode(tokens[i:i + max_tokens]) for i in range(0, len(tokens), step)]
+
+    # Same ~4 chars/token estimate as count_tokens
+    return [sentence[i:i + max_tokens * 4] for i in range(0, len(sentence), step * 4)]
+
+
+def chunk_text(
+    text: str,
+    max_tokens: int = DEFAULT_CHUNK_TOKENS,
+    overlap_tokens: int = DEFAULT_CHUNK_OVERLAP,
+) -> List[str]:
+    """
+    Split text into chunks of at most ~max_tokens, overlapping by ~overlap_tokens.
+    """
+    text = (text or "").strip()
+    if not text:
+        return []
+    if count_tokens(text) <= max_tokens:
+        return [text]
+
+    pieces: List[tuple] = []
+    for sentence in _SENTENCE_RE.split(text):
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        size = count_tokens(sentence)
+        if size > max_tokens:
+            pieces.extend((part, count_tokens(part)) for part in _split_long(sentence, max_tokens, overlap_tokens))
+        else:
+            pieces.append((sentence, size))
+
+    chunks: List[str] = []
+    current: List[tuple] = []
+    current_tokens = 0
+    for piece, size in pieces:
+        if current and current_tokens + size > max_tokens:
+            chunks.append(" ".join(p for p, _ in current))
+            # Carry trailing sentences forward as overlap
+            carried: List[tuple] = []
+            carried_tokens = 0
+            for prev, prev_size in reversed(current):
+                if carried_tokens + prev_size > overlap_tokens:
+                    break
+                carried.insert(0, (prev, prev_size))
+                carried_tokens += prev_size
+            current, current_tokens = carried, carried_tokens
+        current.append((piece, size))
+        current_tokens += size
+    if current:
+        chunks.append(" ".join(p for p, _ in current))
+    return chunks
+
+
+def chunk_document(
+    doc: Dict[str, Any],
+    max_tokens: int = DEFAULT_CHUNK_TOKENS,
+    overlap_tokens: int = DEFAULT_CHUNK_OVERLAP,
+) -> List[Dict[str, Any]]:
+    """
+    Split a builder doc ({"id", "type", "title", "text", "metadata"}) into chunk docs.
+    Each chunk keeps the parent's type/title/metadata and gets id "<parent id>#<n>"
+    plus parent_id / chunk_index. Continuation chunks are prefixed with the title.
+    """
+    chunks = chunk_text(doc.get("text", ""), max_tokens=max_tokens, overlap_tokens=overlap_tokens)
+    title = doc.get("title") or ""
+    chunk_docs = []
+    for n, chunk in enumerate(chunks):
+        if n > 0 and title:
+            chunk = f"{title}: {chunk}"
+        chunk_docs.append(
+            {
+                "id": f"{doc['id']}#{n}",
+                "parent_id": doc["id"],
+                "chunk_index": n,
+                "type": doc.get("type"),
+                "title": doc.get("title"),
+                "text": chunk,
+                "metadata": doc.get("metadata", {}),
+            }
+        )
+    return chunk_docs
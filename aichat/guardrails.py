@@ -2,10 +2,14 @@
 Responsible AI guardrails for FinMate chatbot.
 Includes content filtering, prompt injection detection, and response validation.
 """
+import json
+import os
 import re
 import logging
-from typing import Dict, Tuple, Optional
-from openai import OpenAI
+import threading
+import time
+from typing import Dict, List, Tuple, Optional
+
 from django.conf import settings
 
 logger = logging.getLogger(__name__)
@@ -42,6 +46,182 @@ SCAM_PATTERNS = [
     r'100%\s+guaranteed',
 ]
 
+# Rule families, in priority order per check type (the first family is reported
+# when several match).
+CHECK_TYPE_FAMILIES = {
+    "user": ("blocked", "prompt_injection"),
+    "assistant": ("blocked", "scam"),
+}
+DEFAULT_FAMILIES = ("blocked",)
+
+FAMILY_REASONS = {
+    "blocked": "Contains inappropriate content (blocked pattern detected)",
+    "prompt_injection": "Potential prompt injection attempt detected",
+    "scam": "Response contains potentially misleading financial claims",
+}
+
+FAMILY_LOG_MESSAGES = {
+    "blocked": "Content safety check failed: {}",
+    "prompt_injection": "Prompt injection detected: {}",
+    "scam": "Scam pattern detected in assistant response: {}",
+}
+
+# Optional JSON file {"blocked": [...], "prompt_injection": [...], "scam": [...]}
+# whose patterns extend the built-in lists; re-read when its mtime changes.
+RULES_FILE = getattr(settings, "GUARDRAIL_RULES_FILE", None)
+RULES_RELOAD_INTERVAL = getattr(settings, "GUARDRAIL_RULES_RELOAD_INTERVAL", 5.0)
+
+_WHITESPACE_RE = re.compile(r'\s+')
+_GUARANTEED_RE = re.compile(r'guaranteed\s+(return|profit|income)', re.IGNORECASE)
+_SPECIFIC_AMOUNT_RE = re.compile(r'invest\s+₹?\s*\d+[,\d]*\s*(lakh|crore|thousand)', re.IGNORECASE)
+_DISCLAIMER_WORDS = ('consult', 'advisor', 'disclaimer', 'educational', 'not guaranteed')
+
+
+def default_rules() -> Dict[str, List[str]]:
+    return {
+        "blocked": list(BLOCKED_PATTERNS),
+        "prompt_injection": list(PROMPT_INJECTION_PATTERNS),
+        "scam": list(SCAM_PATTERNS),
+    }
+
+
+def load_rules(path: Optional[str] = None) -> Dict[str, List[str]]:
+    """
+    Built-in rules extended with the patterns of a JSON rules file.
+    """
+    rules = default_rules()
+    if not path:
+        return rules
+    with open(path, "r", encoding="utf-8") as f:
+        extra = json.load(f)
+    for family, patterns in extra.items():
+        if family not in rules:
+            logger.warning(f"Ignoring unknown guardrail rule family '{family}' in {path}")
+            continue
+        rules[family].extend(p for p in patterns if p not in rules[family])
+    return rules
+
+
+def _case_insensitive_by_lowering(pattern: str) -> bool:
+    """
+    True if searching text.lower() with pattern (no IGNORECASE) finds the same
+    matches as an IGNORECASE search of text: the pattern has no uppercase
+    letters outside backslash escapes, and no escapes that spell a character code.
+    """
+    chars = iter(pattern)
+    for c in chars:
+        if c == "\\":
+            if next(chars, "") in "xuUN0123456789":
+                return False
+        elif c != c.lower():
+            return False
+    return True
+
+
+class GuardrailMatcher:
+    """
+    Rule patterns compiled once per check type, checked family by family in
+    priority order (the first family with a hit is reported).
+
+    The text is lowercased once per check, and patterns that are already
+    lowercase are compiled without IGNORECASE and searched against that
+    copy. Case-insensitive matching defeats the regex engine's literal-prefix
+    search, so this is several times faster on long replies than searching
+    with IGNORECASE, or than one big alternation, which has no common prefix
+    either. Patterns that need IGNORECASE (uppercase literals, character
+    classes such as [A-Z]) keep it and are searched against the original text.
+    """
+
+    def __init__(self, rules: Dict[str, List[str]]):
+        self.rules = rules
+        self._plans = {check_type: self._plan(families) for check_type, families in CHECK_TYPE_FAMILIES.items()}
+        self._plans[None] = self._plan(DEFAULT_FAMILIES)
+
+    def _plan(self, families) -> List[Tuple[str, List[Tuple[re.Pattern, bool]]]]:
+        plan = []
+        for family in families:
+            compiled = []
+            for pattern in self.rules.get(family, []):
+                lowered = _case_insensitive_by_lowering(pattern)
+                try:
+                    compiled.append((re.compile(pattern, 0 if lowered else re.IGNORECASE), lowered))
+                except re.error as e:
+                    logger.error(f"Skipping invalid guardrail pattern {pattern!r}: {e}")
+            if compiled:
+                plan.append((family, compiled))
+        return plan
+
+    def match(self, text: str, check_type: str = "user") -> Optional[Tuple[str, str]]:
+        """
+        (family, matched text) of the highest-priority family found in text, or None.
+        """
+        if not text:
+            return None
+        text_lower = text.lower()
+        for family, patterns in self._plans.get(check_type, self._plans[None]):
+            for regex, lowered in patterns:
+                m = regex.search(text_lower if lowered else text)
+                if m is not None:
+                    return family, m.group(0).lower()
+        return None
+
+
+class _MatcherHolder:
+    """
+    Current matcher, rebuilt when RULES_FILE changes on disk (checked at most
+    every RULES_RELOAD_INTERVAL seconds). A broken rules file keeps the previous rules.
+    """
+
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self._lock = threading.Lock()
+        self._matcher: Optional[GuardrailMatcher] = None
+        self._mtime = None
+        self._checked_at = 0.0
+
+    def _file_mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns if self.path else None
+        except OSError:
+            return None
+
+    def reload(self) -> GuardrailMatcher:
+        with self._lock:
+            mtime = self._file_mtime()
+            try:
+                self._matcher = GuardrailMatcher(load_rules(self.path if mtime is not None else None))
+                self._mtime = mtime
+            except (OSError, ValueError) as e:
+                logger.error(f"Could not load guardrail rules from {self.path}: {e}")
+                if self._matcher is None:
+                    self._matcher = GuardrailMatcher(default_rules())
+            self._checked_at = time.monotonic()
+            return self._matcher
+
+    def get(self) -> GuardrailMatcher:
+        matcher = self._matcher
+        if matcher is None:
+            return self.reload()
+        if self.path and time.monotonic() - self._checked_at >= RULES_RELOAD_INTERVAL:
+            self._checked_at = time.monotonic()
+            if self._file_mtime() != self._mtime:
+                return self.reload()
+        return matcher
+
+
+_matcher_holder = _MatcherHolder(RULES_FILE)
+
+
+def get_matcher() -> GuardrailMatcher:
+    return _matcher_holder.get()
+
+
+def reload_rules() -> GuardrailMatcher:
+    """
+    Rebuild the matcher from the built-in rules and RULES_FILE now.
+    """
+    return _matcher_holder.reload()
+
 
 def check_content_safety(text: str, check_type: str = "user") -> Tuple[bool, Optional[str]]:
     """
@@ -57,32 +237,14 @@ def check_content_safety(text: str, check_type: str = "user") -> Tuple[bool, Opt
     if not text:
         return True, None
     
-    text_lower = text.lower()
-    
-    # Check blocked patterns
-    for pattern in BLOCKED_PATTERNS:
-        if re.search(pattern, text_lower, re.IGNORECASE):
-            reason = f"Contains inappropriate content (blocked pattern detected)"
-            logger.warning(f"Content safety check failed: {reason}")
-            return False, reason
-    
-    # Check for prompt injection (only on user input)
-    if check_type == "user":
-        for pattern in PROMPT_INJECTION_PATTERNS:
-            if re.search(pattern, text_lower, re.IGNORECASE):
-                reason = f"Potential prompt injection attempt detected"
-                logger.warning(f"Prompt injection detected: {reason}")
-                return False, reason
-    
-    # Check for financial scams (especially in assistant output)
-    if check_type == "assistant":
-        for pattern in SCAM_PATTERNS:
-            if re.search(pattern, text_lower, re.IGNORECASE):
-                reason = f"Response contains potentially misleading financial claims"
-                logger.warning(f"Scam pattern detected in assistant response: {reason}")
-                return False, reason
+    hit = get_matcher().match(text, check_type)
+    if hit is None:
+        return True, None
     
-    return True, None
+    family, _ = hit
+    reason = FAMILY_REASONS[family]
+    logger.warning(FAMILY_LOG_MESSAGES[family].format(reason))
+    return False, reason
 
 
 def validate_financial_advice(response: str) -> Tuple[bool, Optional[str]]:
@@ -95,17 +257,16 @@ def validate_financial_advice(response: str) -> Tuple[bool, Optional[str]]:
     if not response:
         return True, None
     
-    response_lower = response.lower()
-    
     # Check for guaranteed returns claims
-    if re.search(r'guaranteed\s+(return|profit|income)', response_lower):
+    if _GUARANTEED_RE.search(response):
         return False, "Response makes guaranteed return claims (not allowed)"
     
     # Check for specific investment amount recommendations without disclaimers
     # (We allow general advice, but flag if it's too specific without warnings)
-    if re.search(r'invest\s+₹?\s*\d+[,\d]*\s*(lakh|crore|thousand)', response_lower):
+    if _SPECIFIC_AMOUNT_RE.search(response):
         # Check if disclaimer is present
-        if not any(word in response_lower for word in ['consult', 'advisor', 'disclaimer', 'educational', 'not guaranteed']):
+        response_lower = response.lower()
+        if not any(word in response_lower for word in _DISCLAIMER_WORDS):
             return False, "Specific investment amounts without proper disclaimers"
     
     return True, None
@@ -122,7 +283,7 @@ def sanitize_user_input(user_message: str) -> Tuple[str, bool, Optional[str]]:
         return "", False, "Empty message"
     
     # Basic sanitization: remove excessive whitespace, trim
-    sanitized = re.sub(r'\s+', ' ', user_message.strip())
+    sanitized = _WHITESPACE_RE.sub(' ', user_message.strip())
     
     # Check content safety
     is_safe, reason = check_content_safety(sanitized, check_type="user")
@@ -191,29 +352,74 @@ def get_safe_fallback_message(user_language: str = "en") -> str:
 def moderate_with_openai(text: str, check_type: str = "user") -> Tuple[bool, Optional[str]]:
     """
     Use OpenAI moderation API for additional safety check.
+    Verdicts are cached by text hash (see aichat.moderation, which also has the
+    tiered local-classifier entry point `moderate`).
     Falls back to pattern-based checks if API is unavailable.
     
     Returns:
         (is_safe, reason_if_unsafe)
     """
-    api_key = getattr(settings, "OPENAI_API_KEY", None)
-    if not api_key:
-        # Fallback to pattern-based checks
-        return check_content_safety(text, check_type)
-    
-    try:
-        client = OpenAI(api_key=api_key)
-        response = client.moderations.create(input=text)
-        
-        result = response.results[0]
-        if result.flagged:
-            categories = [cat for cat, flagged in result.categories.__dict__.items() if flagged]
-            reason = f"OpenAI moderation flagged: {', '.join(categories)}"
-            logger.warning(f"OpenAI moderation flagged content: {reason}")
-            return False, reason
-        
-        return True, None
-    except Exception as e:
-        logger.error(f"OpenAI moderation API error: {e}, falling back to pattern checks")
-        return check_content_safety(text, check_type)
+    from .moderation import moderate_remote
+
+    return moderate_remote(text, check_type)
+
+
+class StreamingOutputGuard:
+    """
+    Incremental output guardrails for a streamed assistant reply.
+
+    Deltas are held back until a sentence boundary, then the new sentences (plus a
+    short tail of already-released text, so patterns spanning a boundary still
+    match) are checked with check_content_safety. `finish()` releases the rest
+    and runs validate_assistant_response on the full reply. After a violation
+    nothing more is released and `violation` holds the reason.
+    """
+
+    SENTENCE_END_RE = re.compile(r"[.!?।:\n](?:\s|$)")
+    TAIL_CHARS = 200
+
+    def __init__(self):
+        self.text = ""
+        self.pending = ""
+        self.violation: Optional[str] = None
+
+    def _release(self, candidate: str) -> Tuple[str, Optional[str]]:
+        is_safe, reason = check_content_safety(self.text[-self.TAIL_CHARS:] + candidate, check_type="assistant")
+        if not is_safe:
+            self.violation = reason
+            return "", reason
+        self.text += candidate
+        return candidate, None
+
+    def feed(self, delta: str) -> Tuple[str, Optional[str]]:
+        """
+        Add a streamed delta. Returns (text_safe_to_send, violation_reason).
+        """
+        if self.violation:
+            return "", self.violation
+        self.pending += delta or ""
+        boundary = None
+        for match in self.SENTENCE_END_RE.finditer(self.pending):
+            boundary = match.end()
+        if boundary is None:
+            return "", None
+        candidate, self.pending = self.pending[:boundary], self.pending[boundary:]
+        return self._release(candidate)
 
+    def finish(self) -> Tuple[str, Optional[str]]:
+        """
+        Flush the remaining text and validate the complete reply.
+        """
+        if self.violation:
+            return "", self.violation
+        released = ""
+        if self.pending:
+            released, reason = self._release(self.pending)
+            self.pending = ""
+            if reason:
+                return "", reason
+        is_valid, reason = validate_assistant_response(self.text)
+        if not is_valid:
+            self.violation = reason
+            return "", reason
+        return released, None
@@ -0,0 +1,156 @@
+"""
+Token-budgeted conversation history for chat prompts.
+
+The prompt carries the most recent messages that fit HISTORY_TOKEN_BUDGET
+(counted with the local tokenizer in aichat.chunking), always including the
+newest one. Older turns are folded into a rolling summary stored on the
+session (ChatSession.history_summary). The summary is refreshed in the
+background by aichat.tasks.update_chat_history_summary once enough messages
+have dropped out of the window, so prompt size stays flat as sessions grow.
+"""
+import logging
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from django.conf import settings
+
+from .chunking import count_tokens
+
+logger = logging.getLogger(__name__)
+
+HISTORY_TOKEN_BUDGET = getattr(settings, "CHAT_HISTORY_TOKEN_BUDGET", 1500)
+# Upper bound on rows fetched to fill the budget
+HISTORY_FETCH_LIMIT = getattr(settings, "CHAT_HISTORY_FETCH_LIMIT", 40)
+# Messages outside the window (and not yet summarised) before a summary refresh is queued
+SUMMARY_MIN_NEW_MESSAGES = getattr(settings, "CHAT_HISTORY_SUMMARY_MIN_MESSAGES", 6)
+SUMMARY_MAX_TOKENS = 300
+SUMMARY_MODEL = "gpt-4.1-mini"
+
+# Per-message overhead of the chat format (role, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def message_tokens(content: str) -> int:
+    return count_tokens(content or "") + MESSAGE_OVERHEAD_TOKENS
+
+
+def select_recent(
+    newest_first: Sequence[Tuple[Any, str, str]], budget: int = HISTORY_TOKEN_BUDGET
+) -> List[Tuple[Any, str, str]]:
+    """
+    From (id, role, content) rows ordered newest first, keep the longest recent
+    run that fits the token budget (the newest row is always kept). Returns the
+    kept rows in chronological order.
+    """
+    kept = []
+    used = 0
+    for row in newest_first:
+        cost = message_tokens(row[2])
+        if kept and used + cost > budget:
+            break
+        kept.append(row)
+        used += cost
+    kept.reverse()
+    return kept
+
+
+def _summary_message(session) -> Optional[Dict[str, str]]:
+    summary = getattr(session, "history_summary", "")
+    if not summary:
+        return None
+    return {"role": "system", "content": f"Summary of the earlier conversation:\n{summary}"}
+
+
+def _to_history(session, rows) -> List[Dict[str, str]]:
+    summary = _summary_message(session)
+    history = [summary] if summary else []
+    history.extend({"role": role, "content": content} for _, role, content in rows)
+    return history
+
+
+def _recent_rows(session):
+    return session.messages.order_by("-created_at", "-id").values_list("id", "role", "content")[:HISTORY_FETCH_LIMIT]
+
+
+def load_history(session, budget: int = HISTORY_TOKEN_BUDGET) -> List[Dict[str, str]]:
+    """
+    Prompt history for a session: the rolling summary (if any) followed by the
+    most recent messages within `budget` tokens, oldest first.
+    """
+    return _to_history(session, select_recent(list(_recent_rows(session)), budget))
+
+
+async def aload_history(session, budget: int = HISTORY_TOKEN_BUDGET) -> List[Dict[str, str]]:
+    """
+    Async variant of load_history.
+    """
+    rows = [row async for row in _recent_rows(session)]
+    return _to_history(session, select_recent(rows, budget))
+
+
+def _unsummarised_outside_window(session, budget: int = HISTORY_TOKEN_BUDGET):
+    """
+    Messages that fell out of the prompt window and are not yet covered by the summary.
+    """
+    window = select_recent(list(_recent_rows(session)), budget)
+    if not window:
+        return session.messages.none()
+    qs = session.messages.filter(id__lt=window[0][0])
+    if session.history_summary_until is not None:
+        qs = qs.filter(id__gt=session.history_summary_until)
+    return qs.order_by("created_at", "id")
+
+
+def maybe_schedule_summary(session) -> bool:
+    """
+    Queue a background summary refresh when enough messages have left the window.
+    """
+    if not hasattr(session, "history_summary"):
+        return False
+    try:
+        if _unsummarised_outside_window(session).count() < SUMMARY_MIN_NEW_MESSAGES:
+            return False
+        from .tasks import update_chat_history_summary
+
+        update_chat_history_summary.delay(session.id)
+        return True
+    except Exception as e:
+        logger.warning(f"Could not schedule history summary for session {session.id}: {e}")
+        return False
+
+
+def update_history_summary(session) -> bool:
+    """
+    Fold messages that left the prompt window into session.history_summary.
+    Returns True if the summary changed.
+    """
+    from .llm_clients import get_openai_client
+
+    pending = list(_unsummarised_outside_window(session).values_list("id", "role", "content"))
+    if not pending:
+        return False
+    client = get_openai_client()
+    if client is None:
+        return False
+
+    transcript = "\n".join(f"{role}: {content}" for _, role, content in pending)
+    prompt = (
+        "Update the running summary of a FinMate financial-coaching chat. Keep the user's "
+        "situation, goals, products and trainings discussed, and advice already given. "
+        "Be concise (under 150 words), factual, and do not add new advice.\n\n"
+        f"Current summary:\n{session.history_summary or '(none)'}\n\n"
+        f"New messages:\n{transcript}"
+    )
+    completion = client.chat.completions.create(
+        model=SUMMARY_MODEL,
+        messages=[{"role": "user", "content": prompt}],
+        temperature=0.1,
+        max_tokens=SUMMARY_MAX_TOKENS,
+    )
+    summary = (completion.choices[0].message.content or "").strip()
+    if not summary:
+        return False
+
+    session.history_summary = summary
+    session.history_summary_until = pending[-1][0]
+    session.save(update_fields=["history_summary", "history_summary_until", "updated_at"])
+    return True
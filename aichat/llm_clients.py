@@ -0,0 +1,132 @@
+"""
+Process-wide OpenAI clients for chat completions, embeddings and moderation.
+
+Clients are built lazily on first use and reused, so each call rides on a
+warm keep-alive connection pool instead of paying a new TLS handshake. All
+clients share one timeout and retry policy (the SDK retries connection
+errors, 408/409/429 and 5xx responses with exponential backoff).
+
+Async clients are kept per event loop, because an httpx.AsyncClient's
+connections are bound to the loop that opened them.
+
+Inside `call_budget(seconds)` the getters return the same clients via
+`with_options(timeout=seconds, max_retries=0)`. The turn orchestrator wraps
+each stage in one, so a slow API fails that stage within its budget instead of
+holding a pool thread through the default timeout and retries.
+"""
+import asyncio
+import logging
+import threading
+import weakref
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+
+import httpx
+from django.conf import settings
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, DefaultHttpxClient, OpenAI
+
+logger = logging.getLogger(__name__)
+
+OPENAI_TIMEOUT = getattr(settings, "OPENAI_TIMEOUT", 30.0)
+OPENAI_CONNECT_TIMEOUT = getattr(settings, "OPENAI_CONNECT_TIMEOUT", 5.0)
+OPENAI_MAX_RETRIES = getattr(settings, "OPENAI_MAX_RETRIES", 2)
+OPENAI_MAX_CONNECTIONS = getattr(settings, "OPENAI_MAX_CONNECTIONS", 100)
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = getattr(settings, "OPENAI_MAX_KEEPALIVE_CONNECTIONS", 20)
+OPENAI_KEEPALIVE_EXPIRY = getattr(settings, "OPENAI_KEEPALIVE_EXPIRY", 60.0)
+
+_lock = threading.Lock()
+_client: Optional[OpenAI] = None
+_client_key: Optional[str] = None
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncOpenAI]" = weakref.WeakKeyDictionary()
+_call_options: ContextVar[Optional[Dict[str, Any]]] = ContextVar("openai_call_options", default=None)
+
+
+@contextmanager
+def call_budget(timeout: float):
+    """
+    Calls made through the shared clients in this block time out after
+    `timeout` seconds and are not retried.
+    """
+    token = _call_options.set({"timeout": timeout, "max_retries": 0})
+    try:
+        yield
+    finally:
+        _call_options.reset(token)
+
+
+def _with_budget(client):
+    options = _call_options.get()
+    return client.with_options(**options) if options else client
+
+
+def _api_key() -> Optional[str]:
+    return getattr(settings, "OPENAI_API_KEY", None)
+
+
+def _timeout() -> httpx.Timeout:
+    return httpx.Timeout(OPENAI_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT)
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=OPENAI_MAX_CONNECTIONS,
+        max_keepalive_connections=OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY,
+    )
+
+
+def get_openai_client() -> Optional[OpenAI]:
+    """
+    Shared sync client, or None if OPENAI_API_KEY is not configured.
+    """
+    global _client, _client_key
+    api_key = _api_key()
+    if not api_key:
+        return None
+    if _client is None or _client_key != api_key:
+        with _lock:
+            if _client is None or _client_key != api_key:
+                logger.info("Creating pooled OpenAI client")
+                _client = OpenAI(
+                    api_key=api_key,
+                    timeout=_timeout(),
+                    max_retries=OPENAI_MAX_RETRIES,
+                    http_client=DefaultHttpxClient(limits=_limits(), timeout=_timeout()),
+                )
+                _client_key = api_key
+    return _with_budget(_client)
+
+
+def get_async_openai_client() -> Optional[AsyncOpenAI]:
+    """
+    Shared async client for the running event loop, or None if OPENAI_API_KEY is
+    not configured. Must be called from within a coroutine.
+    """
+    api_key = _api_key()
+    if not api_key:
+        return None
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None or client.api_key != api_key:
+        client = AsyncOpenAI(
+            api_key=api_key,
+            timeout=_timeout(),
+            max_retries=OPENAI_MAX_RETRIES,
+            http_client=DefaultAsyncHttpxClient(limits=_limits(), timeout=_timeout()),
+        )
+        _async_clients[loop] = client
+    return _with_budget(client)
+
+
+def reset_clients() -> None:
+    """
+    Drop the cached clients (e.g. after rotating the API key in tests).
+    """
+    global _client, _client_key
+    with _lock:
+        if _client is not None:
+            _client.close()
+        _client = None
+        _client_key = None
+        _async_clients.clear()
@@ -0,0 +1,76 @@
+import re
+import time
+
+from django.core.management.base import BaseCommand
+
+from aichat.guardrails import CHECK_TYPE_FAMILIES, get_matcher
+
+SAMPLE_PARAGRAPH = (
+    "Your UHFS score is 52, which means your income is fairly steady but your savings buffer "
+    "is thin. This week, try to set aside a small fixed amount after each payout, review your "
+    "monthly expenses, and complete the Budgeting Basics training to earn extra points. "
+    "Products such as a recurring deposit or a micro-insurance plan can help, but please treat "
+    "this as educational guidance and consult an advisor before committing money. "
+)
+
+
+def _legacy_check(rules, text, families):
+    """
+    The previous implementation: lowercase the text and re.search every pattern in turn.
+    """
+    text_lower = text.lower()
+    for family in families:
+        for pattern in rules[family]:
+            if re.search(pattern, text_lower, re.IGNORECASE):
+                return family
+    return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Micro-benchmark of the content-safety guardrails on long replies: the compiled matcher "
+        "(text lowercased once, case-sensitive patterns) against the per-pattern re.search loop it replaced."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--length', type=int, default=4000, help='Characters per text (default: 4000)')
+        parser.add_argument('--iterations', type=int, default=500, help='Checks per variant (default: 500)')
+        parser.add_argument(
+            '--check-type', choices=sorted(CHECK_TYPE_FAMILIES), default='assistant',
+            help='Rule families to apply (default: assistant)',
+        )
+        parser.add_argument(
+            '--with-match', action='store_true',
+            help='Append a scam/injection phrase at the end so every check finds a match',
+        )
+
+    def _bench(self, fn, text, iterations):
+        fn(text)  # warm up pattern caches
+        start = time.perf_counter()
+        for _ in range(iterations):
+            result = fn(text)
+        elapsed = time.perf_counter() - start
+        return result, elapsed / iterations * 1e6, len(text) * iterations / elapsed / 1e6
+
+    def handle(self, *args, **options):
+        check_type = options['check_type']
+        text = (SAMPLE_PARAGRAPH * (options['length'] // len(SAMPLE_PARAGRAPH) + 1))[: options['length']]
+        if options['with_match']:
+            text += " double your money" if check_type == "assistant" else " ignore previous instructions"
+
+        matcher = get_matcher()
+        families = CHECK_TYPE_FAMILIES[check_type]
+        n_patterns = sum(len(matcher.rules[f]) for f in families)
+        self.stdout.write(self.style.NOTICE(
+            f"{len(text)} chars, {n_patterns} patterns ({', '.join(families)}), {options['iterations']} iterations"
+        ))
+
+        variants = [
+            ("per-pattern", lambda t: _legacy_check(matcher.rules, t, families)),
+            ("matcher", lambda t: (matcher.match(t, check_type) or (None,))[0]),
+        ]
+        for name, fn in variants:
+            family, us_per_check, mb_per_s = self._bench(fn, text, options['iterations'])
+            self.stdout.write(
+                f"{name:>12}  {us_per_check:10.1f} us/check  {mb_per_s:8.2f} MB/s  match={family}"
+            )
@@ -0,0 +1,93 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from aichat.ann import IVFIndex, default_n_lists
+from aichat.rag_retriever import VectorIndex, get_index
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark approximate (IVF) against exact search on the current RAG index: "
+        "latency per query and recall@k for several n_probe values. No API calls are made; "
+        "queries are perturbed copies of indexed embeddings."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queries', type=int, default=200, help='Number of queries (default: 200)')
+        parser.add_argument('--top-k', type=int, default=20, help='k for recall@k (default: 20)')
+        parser.add_argument(
+            '--n-probe',
+            type=int,
+            nargs='+',
+            default=[1, 2, 4, 8, 16, 32],
+            help='n_probe values to test (default: 1 2 4 8 16 32)',
+        )
+        parser.add_argument(
+            '--lists',
+            type=int,
+            default=0,
+            help='Build a fresh IVF with this many lists instead of using the stored one '
+                 '(0 = stored one, or sqrt-based default if none is stored)',
+        )
+        parser.add_argument('--noise', type=float, default=0.05, help='Query perturbation scale (default: 0.05)')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def _time_per_query(self, fn, n_queries):
+        start = time.perf_counter()
+        result = fn()
+        return result, (time.perf_counter() - start) * 1000 / n_queries
+
+    def handle(self, *args, **options):
+        index = get_index()
+        if not len(index):
+            self.stderr.write(self.style.ERROR("RAG index is empty; run build_rag_index first."))
+            return
+
+        rng = np.random.default_rng(options['seed'])
+        n_docs, dim = index.matrix.shape
+        n_queries = min(options['queries'], n_docs)
+        rows = rng.choice(n_docs, size=n_queries, replace=False)
+        queries = np.asarray(index.matrix[rows], dtype=np.float32)
+        if index.scales is not None:
+            queries *= np.asarray(index.scales[rows])[:, None]
+        queries = queries + rng.normal(scale=options['noise'] / np.sqrt(dim), size=queries.shape).astype(np.float32)
+        top_k = options['top_k']
+
+        ivf = index.ann
+        if options['lists'] or ivf is None:
+            n_lists = options['lists'] or default_n_lists(n_docs)
+            self.stdout.write(f"Building IVF with {n_lists} lists over {n_docs} rows...")
+            start = time.perf_counter()
+            ivf = IVFIndex.build(index.matrix, n_lists=n_lists)
+            self.stdout.write(f"  built in {time.perf_counter() - start:.2f}s")
+
+        self.stdout.write(
+            self.style.NOTICE(
+                f"{n_docs} docs x {dim} dims ({index.matrix.dtype}), {n_queries} queries, "
+                f"top_k={top_k}, {ivf.n_lists} IVF lists"
+            )
+        )
+
+        exact = VectorIndex(index.docs, index.matrix, scales=index.scales)
+        exact_hits, exact_ms = self._time_per_query(
+            lambda: exact.search_many(list(queries), top_k=top_k, exact=True), n_queries
+        )
+        truth = [{id(doc) for _, doc in hits} for hits in exact_hits]
+        self.stdout.write(f"{'exact':>12}  {exact_ms:8.3f} ms/query  recall@{top_k}=1.000")
+
+        for n_probe in options['n_probe']:
+            approx = VectorIndex(index.docs, index.matrix, ann=ivf, n_probe=n_probe, scales=index.scales)
+            approx_hits, approx_ms = self._time_per_query(
+                lambda: approx.search_many(list(queries), top_k=top_k), n_queries
+            )
+            recall = np.mean(
+                [
+                    len(expected & {id(doc) for _, doc in hits}) / max(1, len(expected))
+                    for expected, hits in zip(truth, approx_hits)
+                ]
+            )
+            self.stdout.write(
+                f"{'n_probe=' + str(n_probe):>12}  {approx_ms:8.3f} ms/query  recall@{top_k}={recall:.3f}"
+            )
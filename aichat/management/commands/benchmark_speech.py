@@ -0,0 +1,75 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from aichat import voice
+from aichat.speech import BACKENDS, SpeechConfigurationError, get_speech_backend
+
+SAMPLE_ADVICE = (
+    "Your income is fairly steady but your savings buffer is thin. "
+    "Try to set aside a small fixed amount after each payout. "
+    "Please treat this as educational guidance and consult an advisor before committing money."
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Latency of the voice pipeline per speech backend: storing the recording, transcription, "
+        "time to first audio byte and full synthesis (the LLM step is not included)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('audio', help='Path to a short recorded question (WAV/MP3)')
+        parser.add_argument(
+            '--backends', default=','.join(BACKENDS),
+            help=f"Comma-separated backends to compare (default: {','.join(BACKENDS)})",
+        )
+        parser.add_argument('--iterations', type=int, default=3, help='Runs per backend (default: 3)')
+        parser.add_argument('--text', default=SAMPLE_ADVICE, help='Reply text to synthesize')
+
+    def _run_once(self, backend, audio_path, text):
+        timings = {}
+        start = time.perf_counter()
+        with open(audio_path, 'rb') as f:
+            key = backend.store_input(f)
+        timings['store'] = time.perf_counter() - start
+
+        t = time.perf_counter()
+        transcript, language = backend.transcribe(key)
+        timings['transcribe'] = time.perf_counter() - t
+
+        t = time.perf_counter()
+        stream = voice.open_speech_stream(text, backend.choose_voice(language), backend)
+        size = 0
+        for data in stream:
+            if not size:
+                timings['first_byte'] = time.perf_counter() - t
+            size += len(data)
+        timings['synthesize'] = time.perf_counter() - t
+        timings['total'] = time.perf_counter() - start
+        return timings, transcript, language, size
+
+    def handle(self, *args, **options):
+        names = [n.strip() for n in options['backends'].split(',') if n.strip()]
+        unknown = [n for n in names if n not in BACKENDS]
+        if unknown:
+            raise CommandError(f"Unknown backend(s): {', '.join(unknown)}")
+
+        stages = ['store', 'transcribe', 'first_byte', 'synthesize', 'total']
+        self.stdout.write(f"{'backend':>8}  " + "  ".join(f"{s:>11}" for s in stages) + "   (median seconds)")
+        for name in names:
+            backend = get_speech_backend(name)
+            try:
+                backend.check_configured()
+            except SpeechConfigurationError as e:
+                self.stdout.write(self.style.WARNING(f"{name:>8}  skipped: {e}"))
+                continue
+
+            runs = []
+            for _ in range(options['iterations']):
+                timings, transcript, language, size = self._run_once(backend, options['audio'], options['text'])
+                runs.append(timings)
+            medians = [statistics.median(run.get(s, 0.0) for run in runs) for s in stages]
+            self.stdout.write(f"{name:>8}  " + "  ".join(f"{m:11.3f}" for m in medians))
+            self.stdout.write(f"{'':>8}  [{language}] {transcript[:60]!r}, {size} bytes of {backend.audio_format}")
@@ -1,23 +1,38 @@
-import json
 import logging
-import time
 from pathlib import Path
-from urllib.parse import urlparse
 
-import requests
-from bs4 import BeautifulSoup
 from django.core.management.base import BaseCommand
 from django.conf import settings
-from openai import OpenAI
 
 from training.models import TrainingSection
 from finance.models import Product
+from aichat.cache import hash_key
+from aichat.llm_clients import get_openai_client
+from aichat.chunking import DEFAULT_CHUNK_OVERLAP, DEFAULT_CHUNK_TOKENS, chunk_document
+from aichat.rag_store import (
+    JSONL_PATH,
+    SUPPORTED_DTYPES,
+    read_jsonl_index,
+    write_binary_index,
+    write_jsonl_index,
+)
+from aichat.scraper import PageScraper
 
 logger = logging.getLogger(__name__)
 
+EMBEDDING_MODEL = "text-embedding-3-large"
+
+# Per-request bounds for the embeddings API (well under its input limits).
+DEFAULT_EMBED_BATCH_SIZE = 64
+MAX_BATCH_CHARS = 400_000  # ~100k tokens at ~4 chars/token
+
+# Scraped pages are chunked, so keep far more than the old 5000-char cut-off;
+# this only guards against pathological pages.
+MAX_SCRAPED_LENGTH = 100_000
+
 
 class Command(BaseCommand):
-    help = "Build RAG index from TrainingSection and Product content (including scraped URLs) into rag_index.jsonl"
+    help = "Build RAG index from TrainingSection and Product content (including scraped URLs) into rag_index.jsonl and a memory-mapped .npy matrix"
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -31,50 +46,107 @@ class Command(BaseCommand):
             default=10,
             help='Timeout in seconds for each URL scrape (default: 10)',
         )
+        parser.add_argument(
+            '--scrape-workers',
+            type=int,
+            default=8,
+            help='Maximum concurrent URL fetches (default: 8)',
+        )
+        parser.add_argument(
+            '--per-host-concurrency',
+            type=int,
+            default=2,
+            help='Maximum concurrent fetches to the same host (default: 2)',
+        )
+        parser.add_argument(
+            '--no-scrape-cache',
+            action='store_true',
+            help='Ignore the on-disk ETag/Last-Modified cache and download every page',
+        )
+        parser.add_argument(
+            '--chunk-tokens',
+            type=int,
+            default=DEFAULT_CHUNK_TOKENS,
+            help=f'Maximum tokens per indexed chunk (default: {DEFAULT_CHUNK_TOKENS})',
+        )
+        parser.add_argument(
+            '--chunk-overlap',
+            type=int,
+            default=DEFAULT_CHUNK_OVERLAP,
+            help=f'Tokens shared by consecutive chunks (default: {DEFAULT_CHUNK_OVERLAP})',
+        )
+        parser.add_argument(
+            '--dtype',
+            choices=SUPPORTED_DTYPES,
+            default='float32',
+            help='Storage dtype of the memory-mapped embedding matrix; int8 stores '
+                 'quantised rows plus per-row scales (default: float32)',
+        )
+        parser.add_argument(
+            '--dimensions',
+            type=int,
+            default=None,
+            help='Request reduced-size embeddings from the model, e.g. 256 or 512 '
+                 '(default: the native 3072); queries are embedded to match',
+        )
+        parser.add_argument(
+            '--ivf-lists',
+            type=int,
+            default=0,
+            help='Also build an IVF approximate-nearest-neighbour index with this many lists '
+                 '(0 = none; used when RAG_ANN_BACKEND="ivf")',
+        )
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Re-embed every document instead of reusing unchanged embeddings',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=DEFAULT_EMBED_BATCH_SIZE,
+            help=f'Maximum documents per embeddings request (default: {DEFAULT_EMBED_BATCH_SIZE})',
+        )
+
+    @staticmethod
+    def content_hash(text: str, dimensions=None) -> str:
+        if dimensions:
+            return hash_key(f"{EMBEDDING_MODEL}@{dimensions}", text)
+        return hash_key(EMBEDDING_MODEL, text)
 
-    def scrape_url(self, url: str, timeout: int = 10) -> str:
+    @staticmethod
+    def iter_batches(indices, texts, batch_size):
         """
-        Scrape text content from a product URL.
-        Returns cleaned text content or empty string if failed.
+        Yield lists of indices bounded by batch_size items and MAX_BATCH_CHARS characters.
         """
-        if not url or not url.startswith(('http://', 'https://')):
-            return ""
-        
-        try:
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-            }
-            response = requests.get(url, headers=headers, timeout=timeout, allow_redirects=True)
-            response.raise_for_status()
-            
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            # Remove script and style elements
-            for script in soup(["script", "style", "nav", "footer", "header"]):
-                script.decompose()
-            
-            # Extract text
-            text = soup.get_text(separator=' ', strip=True)
-            
-            # Clean up: remove excessive whitespace
-            text = ' '.join(text.split())
-            
-            # Limit to reasonable length (avoid huge pages)
-            MAX_SCRAPED_LENGTH = 5000
-            if len(text) > MAX_SCRAPED_LENGTH:
-                text = text[:MAX_SCRAPED_LENGTH] + "..."
-            
-            return text
-        except requests.exceptions.RequestException as e:
-            logger.warning(f"Failed to scrape {url}: {e}")
-            return ""
-        except Exception as e:
-            logger.warning(f"Error parsing {url}: {e}")
-            return ""
+        batch, batch_chars = [], 0
+        for i in indices:
+            size = len(texts[i])
+            if batch and (len(batch) >= batch_size or batch_chars + size > MAX_BATCH_CHARS):
+                yield batch
+                batch, batch_chars = [], 0
+            batch.append(i)
+            batch_chars += size
+        if batch:
+            yield batch
+
+    def load_previous_embeddings(self):
+        """
+        Map doc id -> (content hash, embedding) from the last build's rag_index.jsonl.
+        Lines written before hashes were stored are hashed from their doc text.
+        """
+        previous = {}
+        for item in read_jsonl_index():
+            doc = item.get("doc") or {}
+            emb = item.get("embedding")
+            if not doc.get("id") or not emb:
+                continue
+            previous[doc["id"]] = (item.get("hash") or self.content_hash(doc.get("text", "")), emb)
+        return previous
 
     def handle(self, *args, **options):
-        client = OpenAI(api_key=getattr(settings, "OPENAI_API_KEY", None))
-        if not client.api_key:
+        client = get_openai_client()
+        if client is None:
             self.stderr.write(self.style.ERROR("OPENAI_API_KEY not configured; cannot build RAG index."))
             return
 
@@ -107,18 +179,38 @@ class Command(BaseCommand):
         skip_scraping = options.get('skip_scraping', False)
         scrape_timeout = options.get('scrape_timeout', 10)
         
-        products_with_urls = Product.objects.exclude(official_url__isnull=True).exclude(official_url="")
-        total_products = Product.objects.count()
-        products_to_scrape = products_with_urls.count()
-        
-        if not skip_scraping and products_to_scrape > 0:
+        products = list(Product.objects.all())
+        scraped = {}
+        urls = [p.official_url for p in products if p.official_url]
+        if not skip_scraping and urls:
             self.stdout.write(
                 self.style.NOTICE(
-                    f"Scraping {products_to_scrape} product URLs (timeout: {scrape_timeout}s each)..."
+                    f"Scraping {len(set(urls))} product URLs "
+                    f"(timeout: {scrape_timeout}s each, {options.get('scrape_workers', 8)} workers)..."
                 )
             )
-        
-        for p in Product.objects.all():
+            cache_dir = None
+            if not options.get('no_scrape_cache'):
+                cache_dir = getattr(
+                    settings, "RAG_SCRAPE_CACHE_DIR", Path(settings.BASE_DIR) / ".rag_scrape_cache"
+                )
+            scraper = PageScraper(
+                cache_dir=cache_dir,
+                timeout=scrape_timeout,
+                max_workers=options.get('scrape_workers', 8),
+                per_host_concurrency=options.get('per_host_concurrency', 2),
+                max_length=MAX_SCRAPED_LENGTH,
+            )
+            scraped = scraper.scrape_many(urls)
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"  ✓ {scraper.stats['fetched']} downloaded, "
+                    f"{scraper.stats['not_modified']} unchanged (304), "
+                    f"{scraper.stats['failed']} failed"
+                )
+            )
+
+        for p in products:
             text_parts = [
                 p.name or "",
                 p.scheme_description or "",
@@ -126,19 +218,8 @@ class Command(BaseCommand):
                 p.eligibility or "",
             ]
             
-            # Scrape official_url if available
-            scraped_content = ""
-            if not skip_scraping and p.official_url:
-                self.stdout.write(f"  Scraping {p.official_url}...")
-                scraped_content = self.scrape_url(p.official_url, timeout=scrape_timeout)
-                if scraped_content:
-                    self.stdout.write(
-                        self.style.SUCCESS(f"    ✓ Scraped {len(scraped_content)} chars")
-                    )
-                else:
-                    self.stdout.write(self.style.WARNING(f"    ✗ Failed to scrape"))
-                time.sleep(0.5)  # Be polite to servers
-            
+            scraped_content = scraped.get(p.official_url, "") if p.official_url else ""
+
             # Combine DB fields + scraped content
             if scraped_content:
                 text_parts.append(f"\n\nOfficial website content:\n{scraped_content}")
@@ -168,20 +249,63 @@ class Command(BaseCommand):
             self.stderr.write(self.style.WARNING("No documents found to index."))
             return
 
+        # Chunking: each parent doc becomes overlapping, token-bounded chunks
+        parent_count = len(docs)
+        docs = [
+            chunk
+            for doc in docs
+            for chunk in chunk_document(
+                doc,
+                max_tokens=options.get('chunk_tokens') or DEFAULT_CHUNK_TOKENS,
+                overlap_tokens=options.get('chunk_overlap', DEFAULT_CHUNK_OVERLAP),
+            )
+        ]
+        self.stdout.write(self.style.NOTICE(f"Split {parent_count} documents into {len(docs)} chunks"))
+
         texts = [d["text"] for d in docs]
-        self.stdout.write(self.style.NOTICE(f"Creating embeddings for {len(texts)} documents..."))
+        dimensions = options.get('dimensions') or None
+        hashes = [self.content_hash(t, dimensions) for t in texts]
+        embeddings = [None] * len(docs)
 
-        resp = client.embeddings.create(
-            model="text-embedding-3-large",
-            input=texts,
+        # Incremental mode: reuse embeddings of docs whose text is unchanged
+        previous = {} if options.get('full') else self.load_previous_embeddings()
+        for i, doc in enumerate(docs):
+            prev = previous.get(doc["id"])
+            if prev and prev[0] == hashes[i]:
+                embeddings[i] = prev[1]
+
+        to_embed = [i for i, emb in enumerate(embeddings) if emb is None]
+        current_ids = {d["id"] for d in docs}
+        dropped = sum(1 for doc_id in previous if doc_id not in current_ids)
+        self.stdout.write(
+            self.style.NOTICE(
+                f"{len(docs)} chunks: {len(docs) - len(to_embed)} unchanged, "
+                f"{len(to_embed)} to embed, {dropped} removed since last build"
+            )
         )
-        embeddings = [item.embedding for item in resp.data]
 
-        index_path = Path(settings.BASE_DIR) / "rag_index.jsonl"
-        with index_path.open("w", encoding="utf-8") as f:
-            for doc, emb in zip(docs, embeddings):
-                f.write(json.dumps({"doc": doc, "embedding": emb}) + "\n")
+        batch_size = max(1, options.get('batch_size') or DEFAULT_EMBED_BATCH_SIZE)
+        for batch in self.iter_batches(to_embed, texts, batch_size):
+            self.stdout.write(f"  Embedding batch of {len(batch)} chunks...")
+            extra = {"dimensions": dimensions} if dimensions else {}
+            resp = client.embeddings.create(
+                model=EMBEDDING_MODEL,
+                input=[texts[i] for i in batch],
+                **extra,
+            )
+            for i, item in zip(batch, sorted(resp.data, key=lambda d: d.index)):
+                embeddings[i] = item.embedding
+
+        write_jsonl_index(docs, embeddings, hashes=hashes)
+        matrix_path = write_binary_index(
+            docs,
+            embeddings,
+            dtype=options.get('dtype', 'float32'),
+            model=EMBEDDING_MODEL,
+            ivf_lists=options.get('ivf_lists') or None,
+            dimensions=dimensions,
+        )
 
-        self.stdout.write(self.style.SUCCESS(f"RAG index built at {index_path}"))
+        self.stdout.write(self.style.SUCCESS(f"RAG index built at {JSONL_PATH} and {matrix_path}"))
 
 
@@ -0,0 +1,80 @@
+import json
+import random
+
+from django.core.management.base import BaseCommand, CommandError
+
+from aichat.moderation import (
+    DEFAULT_MODEL_OUTPUT,
+    DEFAULT_N_FEATURES,
+    LOCAL_FLAG_ABOVE,
+    LOCAL_SAFE_BELOW,
+    MODEL_PATH,
+    HashedNgramClassifier,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Train the local hashed n-gram moderation model from a JSONL file of "
+        '{"text": ..., "flagged": true|false} lines and report how many held-out '
+        "texts it would decide without the remote moderation API. The local tier "
+        "stays off until MODERATION_MODEL_PATH points at the model file."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('data', help='JSONL file with "text" and "flagged" fields')
+        output = MODEL_PATH or DEFAULT_MODEL_OUTPUT
+        parser.add_argument('--output', default=str(output), help=f'Model file (default: {output})')
+        parser.add_argument('--features', type=int, default=DEFAULT_N_FEATURES, help='Hash buckets, a power of two')
+        parser.add_argument('--epochs', type=int, default=5)
+        parser.add_argument('--learning-rate', type=float, default=0.2)
+        parser.add_argument('--holdout', type=float, default=0.2, help='Fraction held out for evaluation (default: 0.2)')
+
+    def _read(self, path):
+        samples = []
+        with open(path, "r", encoding="utf-8") as f:
+            for line_no, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                    samples.append((str(row["text"]), bool(row["flagged"])))
+                except (ValueError, KeyError) as e:
+                    raise CommandError(f"{path}:{line_no}: {e}")
+        return samples
+
+    def handle(self, *args, **options):
+        n_features = options['features']
+        if n_features <= 0 or n_features & (n_features - 1):
+            raise CommandError("--features must be a power of two")
+
+        samples = self._read(options['data'])
+        if not samples:
+            raise CommandError("No training samples")
+        random.Random(0).shuffle(samples)
+        n_holdout = int(len(samples) * options['holdout'])
+        holdout, train = samples[:n_holdout], samples[n_holdout:]
+
+        model = HashedNgramClassifier.train(
+            [t for t, _ in train],
+            [y for _, y in train],
+            n_features=n_features,
+            epochs=options['epochs'],
+            learning_rate=options['learning_rate'],
+        )
+        model.save(options['output'])
+        self.stdout.write(self.style.SUCCESS(f"Trained on {len(train)} samples -> {options['output']}"))
+        if MODEL_PATH is None:
+            self.stdout.write(f"Set MODERATION_MODEL_PATH={options['output']} to enable the local moderation tier")
+
+        if holdout:
+            local = wrong = 0
+            for text, flagged in holdout:
+                p = model.predict_proba(text)
+                if p < LOCAL_SAFE_BELOW or p > LOCAL_FLAG_ABOVE:
+                    local += 1
+                    wrong += (p > LOCAL_FLAG_ABOVE) != flagged
+            self.stdout.write(
+                f"Held out {len(holdout)}: {local / len(holdout):.1%} decided locally "
+                f"(thresholds {LOCAL_SAFE_BELOW}/{LOCAL_FLAG_ABOVE}), {wrong} of those wrong"
+            )
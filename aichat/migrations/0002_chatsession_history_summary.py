@@ -0,0 +1,29 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("aichat", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="chatsession",
+            name="history_summary",
+            field=models.TextField(
+                blank=True,
+                default="",
+                help_text="Rolling summary of messages older than the prompt history window",
+            ),
+        ),
+        migrations.AddField(
+            model_name="chatsession",
+            name="history_summary_until",
+            field=models.BigIntegerField(
+                blank=True,
+                help_text="Id of the last message folded into history_summary",
+                null=True,
+            ),
+        ),
+    ]
@@ -0,0 +1,83 @@
+import uuid
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("aichat", "0002_chatsession_history_summary"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="VoiceJob",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("queued", "Queued"),
+                            ("transcribing", "Transcribing"),
+                            ("generating", "Generating advice"),
+                            ("synthesizing", "Synthesizing speech"),
+                            ("completed", "Completed"),
+                            ("failed", "Failed"),
+                        ],
+                        default="queued",
+                        max_length=20,
+                    ),
+                ),
+                (
+                    "input_key",
+                    models.CharField(help_text="S3 key of the uploaded recording", max_length=512),
+                ),
+                ("requested_voice_id", models.CharField(blank=True, max_length=50)),
+                ("requested_language", models.CharField(blank=True, max_length=20)),
+                ("transcription_job_name", models.CharField(blank=True, max_length=255)),
+                ("transcription_started_at", models.DateTimeField(blank=True, null=True)),
+                ("transcript", models.TextField(blank=True)),
+                ("detected_language", models.CharField(blank=True, max_length=20)),
+                ("response_language", models.CharField(blank=True, max_length=20)),
+                ("advice", models.TextField(blank=True)),
+                ("voice_id", models.CharField(blank=True, max_length=50)),
+                (
+                    "audio_key",
+                    models.CharField(
+                        blank=True, help_text="S3 key of the synthesized reply", max_length=512
+                    ),
+                ),
+                ("error", models.TextField(blank=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "session",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="voice_jobs",
+                        to="aichat.chatsession",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="aichat_voice_jobs",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+    ]
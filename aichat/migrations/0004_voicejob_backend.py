@@ -0,0 +1,32 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("aichat", "0003_voicejob"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="voicejob",
+            name="backend",
+            field=models.CharField(
+                default="aws", help_text="Speech backend that stored the recording", max_length=20
+            ),
+        ),
+        migrations.AlterField(
+            model_name="voicejob",
+            name="input_key",
+            field=models.CharField(
+                help_text="Backend key (S3 key for AWS) of the uploaded recording", max_length=512
+            ),
+        ),
+        migrations.AlterField(
+            model_name="voicejob",
+            name="audio_key",
+            field=models.CharField(
+                blank=True, help_text="Backend key of the synthesized reply", max_length=512
+            ),
+        ),
+    ]
@@ -0,0 +1,25 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("aichat", "0004_voicejob_backend"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="chatattachment",
+            name="object_key",
+            field=models.CharField(
+                blank=True,
+                help_text="S3 key of a direct (presigned) upload, used instead of file",
+                max_length=512,
+            ),
+        ),
+        migrations.AddField(
+            model_name="chatattachment",
+            name="extracted_text",
+            field=models.TextField(blank=True, help_text="Filled in asynchronously after upload"),
+        ),
+    ]
@@ -1,3 +1,5 @@
+import uuid
+
 from django.conf import settings
 from django.db import models
 
@@ -24,6 +26,17 @@ class ChatSession(models.Model):
         help_text="Products snapshot used as context at session start",
     )
 
+    history_summary = models.TextField(
+        blank=True,
+        default="",
+        help_text="Rolling summary of messages older than the prompt history window",
+    )
+    history_summary_until = models.BigIntegerField(
+        null=True,
+        blank=True,
+        help_text="Id of the last message folded into history_summary",
+    )
+
     def __str__(self) -> str:
         return self.title or f"FinMate Chat #{self.pk}"
 
@@ -59,10 +72,61 @@ class ChatAttachment(models.Model):
         null=True,
         blank=True,
     )
+    object_key = models.CharField(
+        max_length=512, blank=True, help_text="S3 key of a direct (presigned) upload, used instead of file"
+    )
     original_name = models.CharField(max_length=255, blank=True)
     mime_type = models.CharField(max_length=100, blank=True)
+    extracted_text = models.TextField(blank=True, help_text="Filled in asynchronously after upload")
     uploaded_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self) -> str:
-        return self.original_name or (self.file.name if self.file else "Attachment")
+        return self.original_name or self.object_key or (self.file.name if self.file else "Attachment")
+
+
+
+class VoiceJob(models.Model):
+    """
+    One voice question processed in the background: the request uploads the
+    audio, Celery transcribes it, generates the advice and synthesizes the reply.
+    """
+    STATUS_CHOICES = (
+        ("queued", "Queued"),
+        ("transcribing", "Transcribing"),
+        ("generating", "Generating advice"),
+        ("synthesizing", "Synthesizing speech"),
+        ("completed", "Completed"),
+        ("failed", "Failed"),
+    )
+    TERMINAL_STATUSES = ("completed", "failed")
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="aichat_voice_jobs"
+    )
+    session = models.ForeignKey(
+        ChatSession, on_delete=models.CASCADE, related_name="voice_jobs"
+    )
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="queued")
+
+    backend = models.CharField(max_length=20, default="aws", help_text="Speech backend that stored the recording")
+    input_key = models.CharField(max_length=512, help_text="Backend key (S3 key for AWS) of the uploaded recording")
+    requested_voice_id = models.CharField(max_length=50, blank=True)
+    requested_language = models.CharField(max_length=20, blank=True)
 
+    transcription_job_name = models.CharField(max_length=255, blank=True)
+    transcription_started_at = models.DateTimeField(null=True, blank=True)
+    transcript = models.TextField(blank=True)
+    detected_language = models.CharField(max_length=20, blank=True)
+    response_language = models.CharField(max_length=20, blank=True)
+
+    advice = models.TextField(blank=True)
+    voice_id = models.CharField(max_length=50, blank=True)
+    audio_key = models.CharField(max_length=512, blank=True, help_text="Backend key of the synthesized reply")
+    error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self) -> str:
+        return f"Voice job {self.id} ({self.status})"
@@ -0,0 +1,227 @@
+"""
+Tiered moderation for FinMate.
+
+1. A local linear classifier over hashed word n-grams (MODERATION_MODEL_PATH,
+   built with `manage.py train_moderation_model`) scores the text in
+   microseconds. Clearly safe texts (probability below MODERATION_LOCAL_SAFE_BELOW)
+   and clearly unsafe ones (above MODERATION_LOCAL_FLAG_ABOVE) are decided locally.
+2. Only the ambiguous middle goes to the OpenAI moderation API. Its verdicts are
+   cached by text hash in a TieredCache, so repeated texts never pay a second
+   round trip.
+
+The local tier is opt-in. No model ships with the app, because a useful one
+needs labelled traffic, and a model trained on a handful of seed examples would
+confidently wave through unsafe texts it has never seen. Train one on your own
+data and point MODERATION_MODEL_PATH at the file to enable it. Until then
+every text takes the remote path (still cached). The pattern guardrails in
+aichat.guardrails run before this and are unaffected.
+"""
+import logging
+import re
+import threading
+import zlib
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+
+from .cache import TieredCache, hash_key
+from .guardrails import check_content_safety
+from .llm_clients import get_openai_client
+
+logger = logging.getLogger(__name__)
+
+# None disables the local tier
+MODEL_PATH = Path(settings.MODERATION_MODEL_PATH) if getattr(settings, "MODERATION_MODEL_PATH", None) else None
+DEFAULT_MODEL_OUTPUT = Path(settings.BASE_DIR) / "moderation_model.npz"
+LOCAL_SAFE_BELOW = getattr(settings, "MODERATION_LOCAL_SAFE_BELOW", 0.05)
+LOCAL_FLAG_ABOVE = getattr(settings, "MODERATION_LOCAL_FLAG_ABOVE", 0.97)
+VERDICT_CACHE_TTL = getattr(settings, "MODERATION_CACHE_TTL", 7 * 24 * 60 * 60)
+VERDICT_CACHE_ALIAS = getattr(settings, "MODERATION_CACHE_ALIAS", "default")
+
+DEFAULT_N_FEATURES = 2 ** 18
+LOCAL_FLAG_REASON = "Local moderation model flagged content"
+
+_TOKEN_RE = re.compile(r"\w+")
+
+_verdicts = TieredCache(
+    "moderation",
+    maxsize=4096,
+    ttl=VERDICT_CACHE_TTL,
+    shared_alias=VERDICT_CACHE_ALIAS,
+)
+
+_stats_lock = threading.Lock()
+_stats = {"local_safe": 0, "local_flagged": 0, "remote": 0, "remote_cached": 0}
+
+
+def _count(stat: str) -> None:
+    with _stats_lock:
+        _stats[stat] += 1
+
+
+def get_moderation_stats() -> Dict[str, Any]:
+    with _stats_lock:
+        stats = dict(_stats)
+    total = sum(stats.values())
+    stats["local_rate"] = (stats["local_safe"] + stats["local_flagged"]) / total if total else 0.0
+    return stats
+
+
+def hashed_features(text: str, n_features: int = DEFAULT_N_FEATURES) -> np.ndarray:
+    """
+    Sorted unique bucket indices of the text's word unigrams and bigrams.
+    n_features must be a power of two.
+    """
+    tokens = _TOKEN_RE.findall(text.lower())
+    grams = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    mask = n_features - 1
+    return np.unique(np.fromiter((zlib.crc32(g.encode("utf-8")) & mask for g in grams), dtype=np.int64, count=len(grams)))
+
+
+class HashedNgramClassifier:
+    """
+    Logistic regression over binary hashed n-gram features.
+    """
+
+    def __init__(self, weights: np.ndarray, bias: float = 0.0):
+        self.weights = np.asarray(weights, dtype=np.float32)
+        self.bias = float(bias)
+        self.n_features = self.weights.size
+
+    def predict_proba(self, text: str) -> float:
+        """
+        Probability that text should be flagged.
+        """
+        z = self.bias + float(self.weights[hashed_features(text, self.n_features)].sum())
+        return 1.0 / (1.0 + np.exp(-z))
+
+    @classmethod
+    def train(
+        cls,
+        texts: List[str],
+        labels: List[bool],
+        n_features: int = DEFAULT_N_FEATURES,
+        epochs: int = 5,
+        learning_rate: float = 0.2,
+        l2: float = 1e-6,
+        seed: int = 0,
+    ) -> "HashedNgramClassifier":
+        """
+        Plain SGD on the log loss; only the weights of a sample's features are updated.
+        """
+        features = [hashed_features(t, n_features) for t in texts]
+        y = np.asarray(labels, dtype=np.float32)
+        weights = np.zeros(n_features, dtype=np.float32)
+        bias = 0.0
+        rng = np.random.default_rng(seed)
+        for _ in range(epochs):
+            for i in rng.permutation(len(features)):
+                idx = features[i]
+                p = 1.0 / (1.0 + np.exp(-(bias + weights[idx].sum())))
+                grad = p - y[i]
+                weights[idx] -= learning_rate * (grad + l2 * weights[idx])
+                bias -= learning_rate * grad
+        return cls(weights, bias)
+
+    def save(self, path: Path) -> None:
+        np.savez_compressed(path, weights=self.weights, bias=np.float32(self.bias))
+
+    @classmethod
+    def load(cls, path: Path) -> "HashedNgramClassifier":
+        with np.load(path) as data:
+            return cls(data["weights"], float(data["bias"]))
+
+
+_classifier_lock = threading.Lock()
+_classifier: Dict[str, Any] = {"loaded": False, "model": None}
+
+
+def get_classifier() -> Optional[HashedNgramClassifier]:
+    """
+    The classifier from MODEL_PATH (loaded once), or None if the local tier is
+    not configured or the file cannot be loaded.
+    """
+    if not _classifier["loaded"]:
+        with _classifier_lock:
+            if not _classifier["loaded"]:
+                model = None
+                if MODEL_PATH is not None:
+                    try:
+                        model = HashedNgramClassifier.load(MODEL_PATH)
+                        logger.info(f"Loaded moderation model from {MODEL_PATH} ({model.n_features} features)")
+                    except Exception as e:
+                        logger.error(f"Could not load moderation model {MODEL_PATH}, using remote moderation: {e}")
+                _classifier.update(loaded=True, model=model)
+    return _classifier["model"]
+
+
+def reload_classifier() -> Optional[HashedNgramClassifier]:
+    with _classifier_lock:
+        _classifier.update(loaded=False, model=None)
+    return get_classifier()
+
+
+def _remote_verdict(text: str) -> Optional[Dict[str, Any]]:
+    """
+    {"flagged": bool, "categories": [...]} from the moderation API (cached by
+    text hash), or None when the API is unavailable.
+    """
+    key = hash_key(text)
+    verdict = _verdicts.get(key)
+    if verdict is not None:
+        _count("remote_cached")
+        return verdict
+
+    client = get_openai_client()
+    if client is None:
+        return None
+    try:
+        result = client.moderations.create(input=text).results[0]
+    except Exception as e:
+        logger.error(f"OpenAI moderation API error: {e}, falling back to pattern checks")
+        return None
+    _count("remote")
+    verdict = {
+        "flagged": bool(result.flagged),
+        "categories": [cat for cat, flagged in result.categories.__dict__.items() if flagged],
+    }
+    _verdicts.set(key, verdict)
+    return verdict
+
+
+def moderate_remote(text: str, check_type: str = "user") -> Tuple[bool, Optional[str]]:
+    """
+    Cached OpenAI moderation; pattern checks when the API is unavailable.
+    """
+    verdict = _remote_verdict(text)
+    if verdict is None:
+        return check_content_safety(text, check_type)
+    if verdict["flagged"]:
+        reason = f"OpenAI moderation flagged: {', '.join(verdict['categories'])}"
+        logger.warning(f"OpenAI moderation flagged content: {reason}")
+        return False, reason
+    return True, None
+
+
+def moderate(text: str, check_type: str = "user") -> Tuple[bool, Optional[str]]:
+    """
+    Local classifier for clear cases, cached remote moderation for the rest.
+
+    Returns:
+        (is_safe, reason_if_unsafe)
+    """
+    if not text:
+        return True, None
+    classifier = get_classifier()
+    if classifier is not None:
+        p = classifier.predict_proba(text)
+        if p < LOCAL_SAFE_BELOW:
+            _count("local_safe")
+            return True, None
+        if p > LOCAL_FLAG_ABOVE:
+            _count("local_flagged")
+            logger.warning(f"{LOCAL_FLAG_REASON} (p={p:.3f})")
+            return False, LOCAL_FLAG_REASON
+    return moderate_remote(text, check_type)
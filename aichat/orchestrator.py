@@ -0,0 +1,209 @@
+"""
+Concurrent preparation of a FinMate turn.
+
+Everything the completion needs is independent of everything else, so the
+steps run concurrently and only the completion waits on them:
+
+- moderation: local classifier, remote API for ambiguous texts (when FINMATE_GUARDRAILS_ENABLED),
+- the semantic answer-cache lookup,
+- RAG retrieval (query embedding + search),
+- the context block (UHFS snapshot + training sections),
+- the token-budgeted history.
+
+Each stage has its own timeout (FINMATE_STAGE_TIMEOUTS, seconds, measured
+from the start of the turn). OpenAI calls made by a stage get the same budget
+with no retries (llm_clients.call_budget), so a stage that is given up on also
+stops soon after. Each stage has a degraded result when it fails or times out:
+
+- moderation falls back to the local pattern checks (already passed);
+- the cache lookup and retrieval fall back to nothing;
+- the context block falls back to the session snapshot without training sections;
+- history falls back to just the new message.
+
+Sync callers use a shared thread pool (worker threads close their DB
+connections after each stage); async callers use asyncio.gather.
+"""
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, List, Optional
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections
+
+from .answer_cache import alookup_answer, lookup_answer
+from .guardrails import sanitize_user_input
+from .history import aload_history, load_history
+from .llm_clients import call_budget
+from .moderation import moderate
+from .prompt_context import build_retrieval_query, session_context_block
+from .rag_retriever import aretrieve_relevant_chunks, retrieve_relevant_chunks
+
+logger = logging.getLogger(__name__)
+
+GUARDRAILS_ENABLED = getattr(settings, "FINMATE_GUARDRAILS_ENABLED", False)
+TURN_WORKERS = getattr(settings, "FINMATE_TURN_WORKERS", 32)
+STAGE_TIMEOUTS = {
+    "moderation": 2.0,
+    "answer_cache": 1.5,
+    "retrieval": 3.0,
+    "context": 2.0,
+    "history": 2.0,
+    **getattr(settings, "FINMATE_STAGE_TIMEOUTS", {}),
+}
+
+_executor = ThreadPoolExecutor(max_workers=TURN_WORKERS, thread_name_prefix="finmate-turn")
+
+
+class TurnInputs:
+    """
+    Results of the pre-completion stages of one turn.
+    `blocked_reason` is set when moderation rejected the user message.
+    `timings` maps stage -> elapsed ms, or "timeout" / "error".
+    """
+
+    def __init__(self):
+        self.blocked_reason: Optional[str] = None
+        self.cached_reply: Optional[str] = None
+        self.answer_probe = None
+        self.context_block: Dict[str, Any] = {}
+        self.retrieved_docs: List[Dict[str, Any]] = []
+        self.history: List[Dict[str, str]] = []
+        self.timings: Dict[str, Any] = {}
+
+
+def _snapshot_context(session) -> Dict[str, Any]:
+    return {
+        "uhfs_score": session.uhfs_score,
+        "uhfs_components": session.uhfs_components,
+        "overall_risk": session.uhfs_overall_risk,
+        "suggested_products": session.suggested_products_snapshot or [],
+        "training_sections": [],
+    }
+
+
+def _retrieval_query(session, message_text):
+    return build_retrieval_query(_snapshot_context(session), message_text)
+
+
+def _moderation(message_text) -> Optional[str]:
+    is_safe, reason = moderate(message_text, check_type="user")
+    return None if is_safe else reason
+
+
+def _first_turn_lookup(session, message_text, language_instruction):
+    if session.messages.filter(role="assistant").exists():
+        return None, None
+    return lookup_answer(session, message_text, language_instruction)
+
+
+def _in_worker(name: str, fn: Callable, *args):
+    def run():
+        try:
+            with call_budget(STAGE_TIMEOUTS[name]):
+                return fn(*args)
+        finally:
+            # Pool threads are long-lived; don't leave their DB connections open
+            connections.close_all()
+
+    return run
+
+
+def _local_block_reason(message_text) -> Optional[str]:
+    if not GUARDRAILS_ENABLED:
+        return None
+    _, is_safe, reason = sanitize_user_input(message_text)
+    return None if is_safe else reason
+
+
+def prepare_turn(session, message_text, language_instruction=None) -> TurnInputs:
+    """
+    Run the independent pre-completion stages of a turn concurrently.
+    """
+    turn = TurnInputs()
+    turn.blocked_reason = _local_block_reason(message_text)
+    if turn.blocked_reason:
+        return turn
+
+    stages = {
+        "answer_cache": _in_worker("answer_cache", _first_turn_lookup, session, message_text, language_instruction),
+        "retrieval": _in_worker("retrieval", retrieve_relevant_chunks, _retrieval_query(session, message_text), 5),
+        "context": _in_worker("context", session_context_block, session),
+        "history": _in_worker("history", load_history, session),
+    }
+    if GUARDRAILS_ENABLED:
+        stages["moderation"] = _in_worker("moderation", _moderation, message_text)
+
+    start = time.monotonic()
+    futures = {name: _executor.submit(fn) for name, fn in stages.items()}
+    results = {}
+    for name, future in futures.items():
+        remaining = max(0.0, STAGE_TIMEOUTS[name] - (time.monotonic() - start))
+        try:
+            results[name] = future.result(timeout=remaining)
+            turn.timings[name] = round((time.monotonic() - start) * 1000, 1)
+        except FutureTimeoutError:
+            logger.warning(f"FinMate turn stage '{name}' timed out after {STAGE_TIMEOUTS[name]}s")
+            turn.timings[name] = "timeout"
+        except Exception as e:
+            logger.error(f"FinMate turn stage '{name}' failed: {e}")
+            turn.timings[name] = "error"
+
+    return _collect(turn, session, message_text, results)
+
+
+async def aprepare_turn(session, message_text, language_instruction=None) -> TurnInputs:
+    """
+    Async variant of prepare_turn.
+    """
+    turn = TurnInputs()
+    turn.blocked_reason = _local_block_reason(message_text)
+    if turn.blocked_reason:
+        return turn
+
+    async def first_turn_lookup():
+        if await session.messages.filter(role="assistant").aexists():
+            return None, None
+        return await alookup_answer(session, message_text, language_instruction)
+
+    stages = {
+        "answer_cache": first_turn_lookup(),
+        "retrieval": aretrieve_relevant_chunks(_retrieval_query(session, message_text), top_k=5),
+        "context": sync_to_async(session_context_block)(session),
+        "history": aload_history(session),
+    }
+    if GUARDRAILS_ENABLED:
+        stages["moderation"] = sync_to_async(_moderation, thread_sensitive=False)(message_text)
+
+    start = time.monotonic()
+
+    async def timed(name, coro):
+        try:
+            with call_budget(STAGE_TIMEOUTS[name]):
+                result = await asyncio.wait_for(coro, timeout=STAGE_TIMEOUTS[name])
+        except asyncio.TimeoutError:
+            logger.warning(f"FinMate turn stage '{name}' timed out after {STAGE_TIMEOUTS[name]}s")
+            turn.timings[name] = "timeout"
+            raise
+        except Exception as e:
+            logger.error(f"FinMate turn stage '{name}' failed: {e}")
+            turn.timings[name] = "error"
+            raise
+        turn.timings[name] = round((time.monotonic() - start) * 1000, 1)
+        return result
+
+    names = list(stages)
+    outcomes = await asyncio.gather(*(timed(n, stages[n]) for n in names), return_exceptions=True)
+    results = {n: r for n, r in zip(names, outcomes) if not isinstance(r, BaseException)}
+    return _collect(turn, session, message_text, results)
+
+
+def _collect(turn: TurnInputs, session, message_text, results: Dict[str, Any]) -> TurnInputs:
+    turn.blocked_reason = results.get("moderation")
+    turn.cached_reply, turn.answer_probe = results.get("answer_cache") or (None, None)
+    turn.retrieved_docs = results.get("retrieval") or []
+    turn.context_block = results.get("context") or _snapshot_context(session)
+    turn.history = results.get("history") or [{"role": "user", "content": message_text}]
+    return turn
@@ -0,0 +1,218 @@
+"""
+Compact, deterministic encoding of the chat context (UHFS, suggested products,
+training sections) for the system prompt.
+
+The raw context block carries full ProductSerializer rows, including
+eligibility, details, URLs and timestamps. This module keeps only the fields
+the model uses. It ranks products by relevance to the user's UHFS profile,
+caps the counts, and serialises to minified JSON with sorted keys. The same
+session therefore always yields byte-identical text. That lets the provider's
+prompt caching reuse the system-prompt + context prefix across turns, and
+keeps it within FINMATE_CONTEXT_TOKEN_BUDGET.
+
+It also builds the raw context block of a session and the RAG retrieval query
+derived from it, which the turn orchestrator needs outside any view. The block
+carries the extracted text of the session's latest attachments; that goes in
+its own message after the history, so a new upload does not change the
+cached prefix.
+"""
+import json
+from typing import Any, Dict, Iterable, List, Optional
+
+from django.conf import settings
+
+from training.services.chat_context import get_training_sections_context
+
+from .chunking import count_tokens
+
+MAX_PRODUCTS = getattr(settings, "FINMATE_CONTEXT_MAX_PRODUCTS", 8)
+MAX_TRAININGS = getattr(settings, "FINMATE_CONTEXT_MAX_TRAININGS", 10)
+TOKEN_BUDGET = getattr(settings, "FINMATE_CONTEXT_TOKEN_BUDGET", 1200)
+MAX_ATTACHMENTS = getattr(settings, "FINMATE_CONTEXT_MAX_ATTACHMENTS", 3)
+ATTACHMENT_CHARS = getattr(settings, "FINMATE_CONTEXT_ATTACHMENT_CHARS", 3000)
+TEXT_LIMIT = 160
+
+# UHFS component -> words that mark a product as addressing it
+COMPONENT_KEYWORDS = {
+    "I": ("income", "livelihood", "employment", "business", "loan", "credit"),
+    "F": ("saving", "savings", "deposit", "budget", "credit", "loan"),
+    "R": ("pension", "retirement", "recurring", "tenure"),
+    "P": ("insurance", "protection", "health", "life", "accident", "pension"),
+    "L": ("literacy", "training", "awareness", "education"),
+}
+
+
+def build_context_block(
+    uhfs_score,
+    uhfs_components,
+    overall_risk,
+    suggested_products,
+    training_sections=None,
+) -> Dict[str, Any]:
+    return {
+        "uhfs_score": uhfs_score,
+        "uhfs_components": uhfs_components,
+        "overall_risk": overall_risk,
+        "suggested_products": suggested_products,
+        # Active training sections (cached and invalidated on TrainingSection changes)
+        "training_sections": training_sections
+        if training_sections is not None
+        else get_training_sections_context(),
+    }
+
+
+def session_attachments(session, limit: int = MAX_ATTACHMENTS) -> List[Dict[str, str]]:
+    """
+    Name and extracted text of the session's most recent attachments (newest
+    first). Extraction runs in the background, so a file uploaded this turn
+    may not be included yet.
+    """
+    from .models import ChatAttachment
+
+    rows = (
+        ChatAttachment.objects.filter(message__session=session)
+        .exclude(extracted_text="")
+        .order_by("-uploaded_at")
+        .values_list("original_name", "extracted_text")[:limit]
+    )
+    return [{"name": name or "attachment", "text": text} for name, text in rows]
+
+
+def session_context_block(session) -> Dict[str, Any]:
+    block = build_context_block(
+        session.uhfs_score,
+        session.uhfs_components,
+        session.uhfs_overall_risk,
+        session.suggested_products_snapshot or [],
+    )
+    block["attachments"] = session_attachments(session)
+    return block
+
+
+def build_retrieval_query(context_block: Dict[str, Any], message_text: str) -> str:
+    # RAG: retrieve relevant knowledge snippets based on question + UHFS context
+    return (
+        f"User question: {message_text}\n"
+        f"UHFS score: {context_block.get('uhfs_score')}\n"
+        f"Components: {context_block.get('uhfs_components')}\n"
+        "Retrieve documents that explain this situation and suggest suitable products "
+        "and training modules to improve the user's UHFS."
+    )
+
+
+def _short(text: Optional[str], limit: int = TEXT_LIMIT) -> str:
+    text = " ".join((text or "").split())
+    return text if len(text) <= limit else text[: limit - 1].rstrip() + "…"
+
+
+def _weak_components(uhfs_components: Optional[Dict[str, Any]], n: int = 2) -> List[str]:
+    if not isinstance(uhfs_components, dict):
+        return []
+    scored = [(v, k) for k, v in uhfs_components.items() if isinstance(v, (int, float))]
+    return [k for _, k in sorted(scored)[:n]]
+
+
+def _product_relevance(product: Dict[str, Any], uhfs_score, weak: List[str]) -> tuple:
+    text = " ".join(
+        str(product.get(f) or "")
+        for f in ("category", "name", "purpose", "behavioral_purpose_tag", "scheme_description")
+    ).lower()
+    keyword_hits = sum(
+        1 for component in weak for word in COMPONENT_KEYWORDS.get(component, ()) if word in text
+    )
+    tag = product.get("ufhs_tag")
+    # Products tagged closest to (at or below) the user's score fit their level best
+    gap = abs((uhfs_score or 0) - tag) if isinstance(tag, int) and uhfs_score is not None else 10**6
+    return (-keyword_hits, gap, product.get("id") or 0)
+
+
+def compact_products(
+    products: Iterable[Dict[str, Any]],
+    uhfs_score=None,
+    uhfs_components=None,
+    limit: int = MAX_PRODUCTS,
+) -> List[Dict[str, Any]]:
+    """
+    Most relevant products first, reduced to the fields the model needs.
+    """
+    weak = _weak_components(uhfs_components)
+    ranked = sorted(products or [], key=lambda p: _product_relevance(p, uhfs_score, weak))
+    compact = []
+    for p in ranked[:limit]:
+        item = {
+            "id": p.get("id"),
+            "name": _short(p.get("name"), 80),
+            "category": _short(p.get("category"), 60),
+            "purpose": _short(p.get("purpose") or p.get("scheme_description")),
+            "tag": _short(p.get("behavioral_purpose_tag"), 60),
+            "min_investment": _short(p.get("minimum_investment"), 40),
+        }
+        compact.append({k: v for k, v in item.items() if v not in (None, "")})
+    return compact
+
+
+def compact_training_sections(sections: Iterable[Dict[str, Any]], limit: int = MAX_TRAININGS) -> List[Dict[str, Any]]:
+    compact = []
+    for s in list(sections or [])[:limit]:
+        item = {
+            "id": s.get("id"),
+            "title": _short(s.get("title"), 80),
+            "about": _short(s.get("description"), 120),
+            "points": s.get("score"),
+            "types": s.get("content_types") or [],
+        }
+        compact.append({k: v for k, v in item.items() if v not in (None, "", [])})
+    return compact
+
+
+def build_context_digest(context_block: Dict[str, Any]) -> Dict[str, Any]:
+    components = context_block.get("uhfs_components")
+    if isinstance(components, dict):
+        components = {k: round(v, 2) if isinstance(v, float) else v for k, v in components.items()}
+    return {
+        "uhfs": {
+            "score": context_block.get("uhfs_score"),
+            "risk": context_block.get("overall_risk"),
+            "components": components,
+        },
+        "products": compact_products(
+            context_block.get("suggested_products"),
+            context_block.get("uhfs_score"),
+            context_block.get("uhfs_components"),
+        ),
+        "trainings": compact_training_sections(context_block.get("training_sections")),
+    }
+
+
+def _dumps(digest: Dict[str, Any]) -> str:
+    return json.dumps(digest, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+
+
+def render_attachments(attachments: Iterable[Dict[str, str]], max_chars: int = ATTACHMENT_CHARS) -> str:
+    """
+    Extracted attachment text for the prompt, each document cut to max_chars.
+    """
+    parts = []
+    for attachment in attachments or []:
+        text = (attachment.get("text") or "").strip()
+        if len(text) > max_chars:
+            text = text[:max_chars].rstrip() + " ..."
+        if text:
+            parts.append(f"[{attachment.get('name') or 'attachment'}]\n{text}")
+    return "\n\n".join(parts)
+
+
+def render_context(context_block: Dict[str, Any], token_budget: int = TOKEN_BUDGET) -> str:
+    """
+    Minified JSON digest of the context block, trimmed (lowest-ranked products,
+    then trailing trainings) until it fits token_budget.
+    """
+    digest = build_context_digest(context_block)
+    text = _dumps(digest)
+    while count_tokens(text) > token_budget and (digest["products"] or digest["trainings"]):
+        if len(digest["products"]) >= len(digest["trainings"]):
+            digest["products"].pop()
+        else:
+            digest["trainings"].pop()
+        text = _dumps(digest)
+    return text
@@ -1,88 +1,528 @@
-import json
-import math
-from pathlib import Path
-from typing import List, Dict, Any
+import logging
+import threading
+import time
+from typing import List, Dict, Any, Optional, Sequence, Tuple
 
+import numpy as np
 from django.conf import settings
-from openai import OpenAI
+from asgiref.sync import sync_to_async
 
+from .ann import IVFIndex
+from .bm25 import BM25Index
+from .cache import TieredCache, hash_key
+from .llm_clients import get_async_openai_client, get_openai_client
+from .rag_store import (
+    INDEX_DIR,
+    index_stamp,
+    lexical_text,
+    normalize_rows,
+    read_binary_index,
+    read_jsonl_index,
+)
 
-client = OpenAI(api_key=getattr(settings, "OPENAI_API_KEY", None))
+logger = logging.getLogger(__name__)
 
-INDEX_PATH = Path(settings.BASE_DIR) / "rag_index.jsonl"
+EMBEDDING_MODEL = "text-embedding-3-large"
+NATIVE_EMBEDDING_DIM = 3072
 
+# Rows scored per block when the stored matrix is not float32, to bound the
+# temporary upcast copy.
+SCORE_BLOCK_ROWS = 4096
 
-def _load_index() -> List[Dict[str, Any]]:
+# Chunk hits fetched per requested parent doc before de-duplication, and how
+# many matched chunks of one parent are kept in its returned text.
+CHUNK_OVERSAMPLE = 4
+MAX_CHUNKS_PER_DOC = 2
+
+# Approximate search: "ivf" uses the IVF structure written by
+# build_rag_index --ivf-lists (if present); anything else means exact search.
+# RAG_ANN_NPROBE is the recall/latency knob (lists scanned per query).
+ANN_BACKEND = getattr(settings, "RAG_ANN_BACKEND", None)
+ANN_NPROBE = getattr(settings, "RAG_ANN_NPROBE", 8)
+
+# "hybrid" fuses vector and BM25 rankings (falling back to BM25 alone when the
+# embeddings API is unavailable), "vector" is embeddings only, and "lexical"
+# skips the embeddings call entirely.
+RETRIEVAL_MODE = getattr(settings, "RAG_RETRIEVAL_MODE", "hybrid")
+# Reciprocal rank fusion constant: score = sum(1 / (RRF_K + rank))
+RRF_K = 60
+
+# Seconds between on-disk change checks; a rebuilt index is picked up within this window.
+RELOAD_CHECK_INTERVAL = getattr(settings, "RAG_INDEX_RELOAD_INTERVAL", 5.0)
+
+
+class VectorIndex:
     """
-    Load prebuilt RAG index from rag_index.jsonl.
-    Each line: {"doc": {...}, "embedding": [...]}
+    Exact cosine-similarity index over the RAG documents.
+
+    Embeddings are held as one contiguous, pre-normalised matrix (n_docs x dim),
+    either in memory (float32) or memory-mapped from the binary index (float32,
+    float16, or int8 with per-row `scales`), so scoring a query is a single
+    matrix-vector product and top-k selection is an argpartition instead of a
+    full sort. `dimensions` is the reduced embedding size the index was built
+    with (None = the model's native size); queries are embedded to match.
+    `lexical` is the BM25 index over the same rows.
+
+    With an IVFIndex attached, searches score only the rows of the n_probe
+    closest clusters unless exact=True is requested.
     """
-    if not INDEX_PATH.exists():
-        return []
-    docs: List[Dict[str, Any]] = []
-    with INDEX_PATH.open("r", encoding="utf-8") as f:
-        for line in f:
-            try:
-                item = json.loads(line)
-                docs.append(item)
-            except json.JSONDecodeError:
+
+    def __init__(
+        self,
+        docs: List[Dict[str, Any]],
+        matrix: np.ndarray,
+        ann: Optional[IVFIndex] = None,
+        n_probe: int = ANN_NPROBE,
+        scales: Optional[np.ndarray] = None,
+        dimensions: Optional[int] = None,
+        lexical: Optional[BM25Index] = None,
+    ):
+        self.docs = docs
+        self.matrix = matrix
+        self.ann = ann
+        self.n_probe = n_probe
+        self.scales = scales
+        self.dimensions = dimensions
+        self.lexical = lexical
+
+    @classmethod
+    def from_items(cls, items: List[Dict[str, Any]]) -> "VectorIndex":
+        """
+        Build from rag_index.jsonl items ({"doc": {...}, "embedding": [...]}).
+        Items without a doc or embedding, or with a mismatched dimension, are skipped.
+        """
+        docs: List[Dict[str, Any]] = []
+        vectors: List[List[float]] = []
+        dim = None
+        for item in items:
+            emb = item.get("embedding")
+            doc = item.get("doc")
+            if not emb or not doc:
                 continue
-    return docs
+            if dim is None:
+                dim = len(emb)
+            elif len(emb) != dim:
+                continue
+            docs.append(doc)
+            vectors.append(emb)
+
+        if not docs:
+            return cls([], np.zeros((0, 0), dtype=np.float32))
+
+        matrix = np.ascontiguousarray(normalize_rows(np.asarray(vectors, dtype=np.float32)))
+        return cls(
+            docs,
+            matrix,
+            dimensions=dim if dim != NATIVE_EMBEDDING_DIM else None,
+            lexical=BM25Index.build(lexical_text(doc) for doc in docs),
+        )
 
+    def __len__(self) -> int:
+        return len(self.docs)
 
-INDEX = _load_index()
+    def _score(self, queries: np.ndarray) -> np.ndarray:
+        """
+        (n_queries x n_docs) cosine scores for normalised float32 queries.
+        """
+        if self.matrix.dtype == np.float32 and self.scales is None:
+            return queries @ self.matrix.T
 
+        # Upcast in blocks so a float16/int8 mmap is never copied whole into memory.
+        scores = np.empty((queries.shape[0], self.matrix.shape[0]), dtype=np.float32)
+        for start in range(0, self.matrix.shape[0], SCORE_BLOCK_ROWS):
+            block = np.asarray(self.matrix[start:start + SCORE_BLOCK_ROWS], dtype=np.float32)
+            block_scores = queries @ block.T
+            if self.scales is not None:
+                block_scores *= self.scales[start:start + block.shape[0]]
+            scores[:, start:start + block.shape[0]] = block_scores
+        return scores
 
-def _dot(a: List[float], b: List[float]) -> float:
-    return sum(x * y for x, y in zip(a, b))
+    def search(
+        self, query_embedding: Sequence[float], top_k: int = 5, exact: bool = False
+    ) -> List[Tuple[float, Dict[str, Any]]]:
+        """
+        Return up to top_k (score, doc) pairs for a single query, best first.
+        """
+        return self.search_many([query_embedding], top_k=top_k, exact=exact)[0]
 
+    def search_many(
+        self, query_embeddings: Sequence[Sequence[float]], top_k: int = 5, exact: bool = False
+    ) -> List[List[Tuple[float, Dict[str, Any]]]]:
+        """
+        Score a batch of queries with one matrix product (or via the ANN index).
+        Returns one list of (score, doc) pairs per query, best first.
+        """
+        if not query_embeddings:
+            return []
+        if not self.docs or top_k <= 0:
+            return [[] for _ in query_embeddings]
 
-def _norm(a: List[float]) -> float:
-    return math.sqrt(sum(x * x for x in a))
+        queries = normalize_rows(np.asarray(query_embeddings, dtype=np.float32))
+        if self.ann is not None and not exact:
+            return [
+                [(float(score), self.docs[i]) for score, i in zip(row_scores, row_idx)]
+                for row_scores, row_idx in self.ann.search(
+                    self.matrix, queries, top_k, self.n_probe, scales=self.scales
+                )
+            ]
 
+        scores = self._score(queries)
 
-def _cosine(a: List[float], b: List[float]) -> float:
-    return _dot(a, b) / (_norm(a) * _norm(b) + 1e-9)
+        n_docs = scores.shape[1]
+        k = min(top_k, n_docs)
+        if k < n_docs:
+            top_idx = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        else:
+            top_idx = np.broadcast_to(np.arange(n_docs), scores.shape)
+        top_scores = np.take_along_axis(scores, top_idx, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        top_idx = np.take_along_axis(top_idx, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
 
+        return [
+            [(float(score), self.docs[i]) for score, i in zip(row_scores, row_idx)]
+            for row_scores, row_idx in zip(top_scores, top_idx)
+        ]
 
-def embed_query(text: str) -> List[float]:
+    def search_lexical(self, query: str, top_k: int = 5) -> List[Tuple[float, Dict[str, Any]]]:
+        """
+        BM25 (score, doc) pairs for a query, best first; no network involved.
+        """
+        if self.lexical is None:
+            return []
+        return [(score, self.docs[i]) for score, i in self.lexical.search(query, top_k=top_k)]
+
+
+def _load_vector_index() -> VectorIndex:
     """
-    Create an embedding for a query string.
+    Prefer the memory-mapped binary index; fall back to parsing rag_index.jsonl.
+    """
+    binary = read_binary_index(mmap=True)
+    if binary is not None:
+        docs, matrix, scales, meta = binary
+        ann = None
+        ann_meta = meta.get("ann") or {}
+        if ANN_BACKEND == "ivf" and ann_meta.get("type") == "ivf":
+            try:
+                ann = IVFIndex.load(INDEX_DIR / ann_meta["file"])
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"Could not load IVF index, using exact search: {e}")
+        lexical = None
+        if meta.get("bm25_file"):
+            try:
+                lexical = BM25Index.load(INDEX_DIR / meta["bm25_file"])
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"Could not load BM25 index: {e}")
+        if lexical is None:
+            lexical = BM25Index.build(lexical_text(doc) for doc in docs)
+        return VectorIndex(
+            docs,
+            matrix,
+            ann=ann,
+            scales=scales,
+            dimensions=meta.get("dimensions"),
+            lexical=lexical,
+        )
+    return VectorIndex.from_items(read_jsonl_index())
+
+
+class _IndexHolder:
+    """
+    Lazily loads the vector index on first use and hot-swaps it when the files
+    written by build_rag_index change. Readers always get a complete index:
+    the new one is fully built before the reference is replaced.
+    """
+
+    def __init__(self):
+        self._index: Optional[VectorIndex] = None
+        self._stamp = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self) -> VectorIndex:
+        index = self._index
+        now = time.monotonic()
+        if index is not None and now - self._checked_at < RELOAD_CHECK_INTERVAL:
+            return index
+
+        stamp = index_stamp()
+        if index is not None and stamp == self._stamp:
+            self._checked_at = now
+            return index
+
+        with self._lock:
+            if self._index is None or stamp != self._stamp:
+                if self._index is not None:
+                    logger.info("RAG index changed on disk; reloading")
+                self._index = _load_vector_index()
+                self._stamp = stamp
+            self._checked_at = now
+            return self._index
+
+    def reload(self) -> VectorIndex:
+        with self._lock:
+            self._stamp = index_stamp()
+            self._index = _load_vector_index()
+            self._checked_at = time.monotonic()
+            return self._index
+
+
+_index_holder = _IndexHolder()
+
+# Query embeddings keyed by hash(model, text): an in-process LRU plus an optional
+# shared tier (a Django cache alias, e.g. Redis) so identical retrieval queries
+# across workers skip the embeddings round trip.
+_embedding_cache = TieredCache(
+    "rag-query-embedding",
+    maxsize=getattr(settings, "RAG_EMBEDDING_CACHE_SIZE", 2048),
+    ttl=getattr(settings, "RAG_EMBEDDING_CACHE_TTL", 24 * 60 * 60),
+    shared_alias=getattr(settings, "RAG_EMBEDDING_CACHE_ALIAS", None),
+)
+
+
+def get_index() -> VectorIndex:
     """
-    if not client.api_key:
+    Current vector index (loaded on first call, reloaded after a rebuild).
+    """
+    return _index_holder.get()
+
+
+def reload_index() -> VectorIndex:
+    """
+    Force a reload from disk, e.g. right after build_rag_index in the same process.
+    """
+    return _index_holder.reload()
+
+
+def set_embedding_cache(cache: TieredCache) -> None:
+    """
+    Swap the query-embedding cache (e.g. a TieredCache with a different shared alias).
+    """
+    global _embedding_cache
+    _embedding_cache = cache
+
+
+def get_embedding_cache_stats() -> Dict[str, Any]:
+    """
+    Hit/miss counters of the query-embedding cache for this process.
+    """
+    return _embedding_cache.stats()
+
+
+def embed_queries(texts: List[str], dimensions: Optional[int] = None) -> List[List[float]]:
+    """
+    Create embeddings for several query strings, serving repeats from the
+    embedding cache and sending only the misses in one API call.
+    `dimensions` requests reduced-size embeddings (must match the index build).
+    Returns an empty list if the API key is not configured.
+    """
+    client = get_openai_client()
+    if client is None or not texts:
         # No API key configured; disable RAG silently
         return []
 
-    resp = client.embeddings.create(
-        model="text-embedding-3-large",
-        input=[text],
-    )
-    return resp.data[0].embedding
+    keys, embeddings, missing = _cached_embeddings(texts, dimensions)
+    if missing:
+        resp = client.embeddings.create(**_embedding_request([texts[i] for i in missing], dimensions))
+        _store_embeddings(resp, keys, embeddings, missing)
+    return embeddings
+
+
+async def aembed_queries(texts: List[str], dimensions: Optional[int] = None) -> List[List[float]]:
+    """
+    Async variant of embed_queries using AsyncOpenAI, for the ASGI chat views.
+    """
+    client = get_async_openai_client()
+    if client is None or not texts:
+        return []
+
+    keys, embeddings, missing = _cached_embeddings(texts, dimensions)
+    if missing:
+        resp = await client.embeddings.create(**_embedding_request([texts[i] for i in missing], dimensions))
+        _store_embeddings(resp, keys, embeddings, missing)
+    return embeddings
+
+
+def _cached_embeddings(
+    texts: List[str], dimensions: Optional[int]
+) -> Tuple[List[str], List[Optional[List[float]]], List[int]]:
+    """
+    Look texts up in the embedding cache: (cache keys, embeddings or None, indexes of misses).
+    """
+    model_key = f"{EMBEDDING_MODEL}@{dimensions}" if dimensions else EMBEDDING_MODEL
+    keys = [hash_key(model_key, text) for text in texts]
+    embeddings: List[Optional[List[float]]] = [_embedding_cache.get(key) for key in keys]
+    missing = [i for i, emb in enumerate(embeddings) if emb is None]
+    return keys, embeddings, missing
+
+
+def _embedding_request(inputs: List[str], dimensions: Optional[int]) -> Dict[str, Any]:
+    request: Dict[str, Any] = {"model": EMBEDDING_MODEL, "input": inputs}
+    if dimensions:
+        request["dimensions"] = dimensions
+    return request
+
+
+def _store_embeddings(resp, keys, embeddings, missing) -> None:
+    for i, item in zip(missing, sorted(resp.data, key=lambda d: d.index)):
+        embeddings[i] = item.embedding
+        _embedding_cache.set(keys[i], item.embedding)
+
+
+def embed_query(text: str, dimensions: Optional[int] = None) -> List[float]:
+    """
+    Create an embedding for a query string.
+    """
+    embeddings = embed_queries([text], dimensions=dimensions)
+    return embeddings[0] if embeddings else []
+
+
+def _group_by_parent(hits: List[Tuple[float, Dict[str, Any]]], top_k: int) -> List[Dict[str, Any]]:
+    """
+    Collapse chunk hits (best first) into at most top_k parent docs, ranked by
+    their best chunk. A parent's text is its best matched chunks in document order.
+    Unchunked docs (no parent_id) pass through unchanged.
+    """
+    parents: Dict[str, List[Dict[str, Any]]] = {}
+    order: List[str] = []
+    for _, doc in hits:
+        parent_id = doc.get("parent_id") or doc.get("id")
+        if parent_id not in parents:
+            if len(order) >= top_k:
+                continue
+            parents[parent_id] = []
+            order.append(parent_id)
+        if len(parents[parent_id]) < MAX_CHUNKS_PER_DOC:
+            parents[parent_id].append(doc)
+
+    results = []
+    for parent_id in order:
+        chunks = parents[parent_id]
+        first = chunks[0]
+        if "parent_id" not in first:
+            results.append(first)
+            continue
+        chunks = sorted(chunks, key=lambda d: d.get("chunk_index", 0))
+        results.append(
+            {
+                "id": parent_id,
+                "type": first.get("type"),
+                "title": first.get("title"),
+                "text": "\n...\n".join(c.get("text", "") for c in chunks),
+                "metadata": first.get("metadata", {}),
+            }
+        )
+    return results
+
+
+def _fuse(
+    rankings: List[List[Tuple[float, Dict[str, Any]]]],
+) -> List[Tuple[float, Dict[str, Any]]]:
+    """
+    Reciprocal rank fusion of several best-first (score, doc) rankings.
+    """
+    fused: Dict[int, List[Any]] = {}
+    for ranking in rankings:
+        for rank, (_, doc) in enumerate(ranking):
+            entry = fused.setdefault(id(doc), [0.0, doc])
+            entry[0] += 1.0 / (RRF_K + rank + 1)
+    return sorted(((score, doc) for score, doc in fused.values()), key=lambda x: x[0], reverse=True)
+
+
+def _hybrid_hits(
+    index: VectorIndex, query: str, vector_hits: List[Tuple[float, Dict[str, Any]]], k: int
+) -> List[Tuple[float, Dict[str, Any]]]:
+    """
+    Combine a query's vector hits with its BM25 hits according to RETRIEVAL_MODE.
+    """
+    lexical_hits = index.search_lexical(query, top_k=k) if RETRIEVAL_MODE != "vector" else []
+    if vector_hits and lexical_hits:
+        return _fuse([vector_hits, lexical_hits])
+    return vector_hits or lexical_hits
+
+
+def _safe_embed_queries(queries: List[str], index: VectorIndex) -> List[List[float]]:
+    """
+    Embed queries for retrieval; in hybrid mode an API failure degrades to BM25 only.
+    """
+    if RETRIEVAL_MODE == "lexical":
+        return []
+    if RETRIEVAL_MODE == "vector":
+        return embed_queries(queries, dimensions=index.dimensions)
+    try:
+        return embed_queries(queries, dimensions=index.dimensions)
+    except Exception as e:
+        logger.warning(f"Query embedding failed, using lexical retrieval only: {e}")
+        return []
+
+
+async def _asafe_embed_queries(queries: List[str], index: VectorIndex) -> List[List[float]]:
+    """
+    Async counterpart of _safe_embed_queries.
+    """
+    if RETRIEVAL_MODE == "lexical":
+        return []
+    if RETRIEVAL_MODE == "vector":
+        return await aembed_queries(queries, dimensions=index.dimensions)
+    try:
+        return await aembed_queries(queries, dimensions=index.dimensions)
+    except Exception as e:
+        logger.warning(f"Query embedding failed, using lexical retrieval only: {e}")
+        return []
 
 
 def retrieve_relevant_chunks(query: str, top_k: int = 5) -> List[Dict[str, Any]]:
     """
     Retrieve top_k most relevant documents from the local RAG index.
+    Vector and BM25 rankings are fused (see RAG_RETRIEVAL_MODE), and chunk hits
+    are de-duplicated into their parent docs.
     Returns a list of doc dicts (without embeddings).
     """
-    if not INDEX:
+    index = get_index()
+    if not len(index):
         return []
 
-    q_emb = embed_query(query)
-    if not q_emb:
+    k = top_k * CHUNK_OVERSAMPLE
+    q_embs = _safe_embed_queries([query], index)
+    vector_hits = index.search(q_embs[0], top_k=k) if q_embs else []
+    return _group_by_parent(_hybrid_hits(index, query, vector_hits, k), top_k)
+
+
+async def aretrieve_relevant_chunks(query: str, top_k: int = 5) -> List[Dict[str, Any]]:
+    """
+    Async variant of retrieve_relevant_chunks: the embedding call is awaited and
+    index scoring runs in a worker thread so the event loop is not blocked.
+    """
+    index = await sync_to_async(get_index, thread_sensitive=False)()
+    if not len(index):
         return []
 
-    scored: List[tuple[float, Dict[str, Any]]] = []
-    for item in INDEX:
-        emb = item.get("embedding")
-        doc = item.get("doc")
-        if not emb or not doc:
-            continue
-        sim = _cosine(q_emb, emb)
-        scored.append((sim, doc))
+    k = top_k * CHUNK_OVERSAMPLE
+    q_embs = await _asafe_embed_queries([query], index)
+
+    def _rank():
+        vector_hits = index.search(q_embs[0], top_k=k) if q_embs else []
+        return _group_by_parent(_hybrid_hits(index, query, vector_hits, k), top_k)
+
+    return await sync_to_async(_rank, thread_sensitive=False)()
 
-    scored.sort(reverse=True, key=lambda x: x[0])
-    top = [doc for sim, doc in scored[:top_k]]
-    return top
 
+def retrieve_many(queries: List[str], top_k: int = 5) -> List[List[Dict[str, Any]]]:
+    """
+    Batched variant of retrieve_relevant_chunks: embeds all queries in one
+    API call and scores them with a single matrix product before fusion.
+    Returns one list of doc dicts per query (empty lists if RAG is unavailable).
+    """
+    if not queries:
+        return []
+    index = get_index()
+    if not len(index):
+        return [[] for _ in queries]
 
+    k = top_k * CHUNK_OVERSAMPLE
+    q_embs = _safe_embed_queries(queries, index)
+    vector_rankings = index.search_many(q_embs, top_k=k) if q_embs else [[] for _ in queries]
+    return [
+        _group_by_parent(_hybrid_hits(index, query, vector_hits, k), top_k)
+        for query, vector_hits in zip(queries, vector_rankings)
+    ]
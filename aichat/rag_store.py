@@ -0,0 +1,243 @@
+"""
+On-disk formats for the FinMate RAG index.
+
+- rag_index.jsonl: legacy text format, one {"doc": {...}, "embedding": [...]} per line.
+- rag_index.docs.json + rag_index.<build_id>.npy: binary format. The .npy holds
+  the L2-normalised embedding matrix (float32, float16, or int8 with a per-row
+  rag_index.<build_id>.scales.npy) in row order and is
+  memory-mapped by the retriever, so every worker shares the same pages through
+  the OS page cache. The JSON sidecar holds the doc metadata and names the
+  matrix file; it is written last, so replacing it publishes a build atomically.
+- rag_index.<build_id>.ivf.npz (optional): IVF approximate-nearest-neighbour
+  structure over the same matrix (see aichat.ann), referenced from the sidecar.
+- rag_index.<build_id>.bm25.npz: BM25 postings over the same docs (see aichat.bm25).
+"""
+import json
+import logging
+import os
+import time
+import uuid
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+
+from .bm25 import BM25Index
+
+logger = logging.getLogger(__name__)
+
+INDEX_DIR = Path(settings.BASE_DIR)
+JSONL_PATH = INDEX_DIR / "rag_index.jsonl"
+DOCS_PATH = INDEX_DIR / "rag_index.docs.json"
+
+FORMAT_VERSION = 1
+SUPPORTED_DTYPES = ("float32", "float16", "int8")
+
+
+def _atomic_write_text(path: Path, text: str) -> None:
+    tmp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+    with tmp_path.open("w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """
+    L2-normalise each row so cosine similarity becomes a plain dot product.
+    """
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / (norms + 1e-9)
+
+
+def read_jsonl_index(path: Path = JSONL_PATH) -> List[Dict[str, Any]]:
+    """
+    Load the legacy text index.
+    Each line: {"doc": {...}, "embedding": [...]}
+    """
+    if not path.exists():
+        return []
+    items: List[Dict[str, Any]] = []
+    with path.open("r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                items.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return items
+
+
+def write_jsonl_index(
+    docs: List[Dict[str, Any]],
+    embeddings: List[List[float]],
+    hashes: Optional[List[str]] = None,
+    path: Path = JSONL_PATH,
+) -> None:
+    """
+    Write the text index. When given, each line also carries the doc's content
+    hash so the next incremental build can reuse its embedding.
+    """
+    hashes = hashes or [None] * len(docs)
+    lines = []
+    for doc, emb, content_hash in zip(docs, embeddings, hashes):
+        item = {"doc": doc, "embedding": list(emb)}
+        if content_hash:
+            item["hash"] = content_hash
+        lines.append(json.dumps(item))
+    _atomic_write_text(path, "".join(line + "\n" for line in lines))
+
+
+def _save_npy(path: Path, array: np.ndarray) -> None:
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    with tmp_path.open("wb") as f:
+        np.save(f, np.ascontiguousarray(array))
+    os.replace(tmp_path, path)
+
+
+def quantize_int8(matrix: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Symmetric per-row int8 quantisation: row ~= q_row * scale_row.
+    Returns (int8 matrix, float32 scales).
+    """
+    scales = np.abs(matrix).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    quantized = np.clip(np.rint(matrix / scales[:, None]), -127, 127).astype(np.int8)
+    return quantized, scales.astype(np.float32)
+
+
+def lexical_text(doc: Dict[str, Any]) -> str:
+    """
+    Text a doc is indexed under for BM25: its title plus its body.
+    """
+    return f"{doc.get('title') or ''} {doc.get('text') or ''}"
+
+
+def write_binary_index(
+    docs: List[Dict[str, Any]],
+    embeddings: List[List[float]],
+    dtype: str = "float32",
+    model: Optional[str] = None,
+    ivf_lists: Optional[int] = None,
+    dimensions: Optional[int] = None,
+) -> Path:
+    """
+    Write the memory-mappable matrix and its metadata sidecar.
+    Rows are normalised before storage so readers never have to copy the matrix.
+    dtype "int8" stores quantised rows plus a per-row scale vector.
+    With ivf_lists > 0 an IVF index with that many lists is built alongside;
+    a BM25 index over the same docs always is.
+    `dimensions` records the reduced embedding size requested from the model,
+    so queries are embedded the same way.
+    Returns the path of the matrix file.
+    """
+    if dtype not in SUPPORTED_DTYPES:
+        raise ValueError(f"Unsupported RAG index dtype: {dtype}")
+
+    normalized = normalize_rows(np.asarray(embeddings, dtype=np.float32))
+    build_id = uuid.uuid4().hex[:12]
+    matrix_path = INDEX_DIR / f"rag_index.{build_id}.npy"
+    scales_path = None
+    if dtype == "int8":
+        matrix, scales = quantize_int8(normalized)
+        scales_path = INDEX_DIR / f"rag_index.{build_id}.scales.npy"
+        _save_npy(scales_path, scales)
+    else:
+        matrix = normalized.astype(dtype)
+    _save_npy(matrix_path, matrix)
+
+    ann_meta = None
+    if ivf_lists and len(docs):
+        from .ann import IVFIndex
+
+        # Cluster the unquantised rows; search scores the stored ones.
+        ivf = IVFIndex.build(normalized, n_lists=ivf_lists)
+        ann_path = INDEX_DIR / f"rag_index.{build_id}.ivf.npz"
+        tmp_ann_path = ann_path.with_name(f".{ann_path.name}.tmp")
+        ivf.save(tmp_ann_path)
+        os.replace(tmp_ann_path, ann_path)
+        ann_meta = {"type": "ivf", "file": ann_path.name, "n_lists": ivf.n_lists}
+
+    bm25_path = INDEX_DIR / f"rag_index.{build_id}.bm25.npz"
+    tmp_bm25_path = bm25_path.with_name(f".{bm25_path.name}.tmp")
+    BM25Index.build(lexical_text(doc) for doc in docs).save(tmp_bm25_path)
+    os.replace(tmp_bm25_path, bm25_path)
+
+    meta = {
+        "format_version": FORMAT_VERSION,
+        "build_id": build_id,
+        "built_at": time.time(),
+        "model": model,
+        "dimensions": dimensions,
+        "dtype": dtype,
+        "dim": int(matrix.shape[1]) if matrix.ndim == 2 else 0,
+        "count": len(docs),
+        "matrix_file": matrix_path.name,
+        "scales_file": scales_path.name if scales_path else None,
+        "ann": ann_meta,
+        "bm25_file": bm25_path.name,
+        "docs": docs,
+    }
+    _atomic_write_text(DOCS_PATH, json.dumps(meta))
+
+    # Older builds are unreferenced now; workers that still map them keep
+    # their pages until they reload, since unlinking does not invalidate a mapping.
+    current = {
+        matrix_path.name,
+        bm25_path.name,
+        meta["scales_file"],
+        ann_meta["file"] if ann_meta else None,
+    }
+    for old in list(INDEX_DIR.glob("rag_index.*.npy")) + list(INDEX_DIR.glob("rag_index.*.npz")):
+        if old.name not in current:
+            try:
+                old.unlink()
+            except OSError as e:
+                logger.warning(f"Could not remove stale RAG matrix {old}: {e}")
+
+    return matrix_path
+
+
+def index_stamp() -> Tuple[Any, ...]:
+    """
+    Cheap change marker for the on-disk index: (mtime_ns, size) of the sidecar
+    and the JSONL file. Any rebuild replaces at least one of them.
+    """
+    stamp = []
+    for path in (DOCS_PATH, JSONL_PATH):
+        try:
+            st = path.stat()
+            stamp.append((st.st_mtime_ns, st.st_size))
+        except OSError:
+            stamp.append(None)
+    return tuple(stamp)
+
+
+def read_binary_index(
+    mmap: bool = True,
+) -> Optional[Tuple[List[Dict[str, Any]], np.ndarray, Optional[np.ndarray], Dict[str, Any]]]:
+    """
+    Load the binary index as (docs, matrix, scales, meta), or None if it is
+    missing or inconsistent. scales is the per-row int8 scale vector (else None).
+    With mmap=True the matrix is a read-only np.memmap shared through the page cache.
+    """
+    if not DOCS_PATH.exists():
+        return None
+    mmap_mode = "r" if mmap else None
+    try:
+        meta = json.loads(DOCS_PATH.read_text(encoding="utf-8"))
+        matrix = np.load(INDEX_DIR / meta["matrix_file"], mmap_mode=mmap_mode)
+        scales = None
+        if meta.get("scales_file"):
+            scales = np.load(INDEX_DIR / meta["scales_file"], mmap_mode=mmap_mode)
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning(f"Could not load binary RAG index: {e}")
+        return None
+
+    docs = meta.pop("docs", [])
+    if matrix.ndim != 2 or matrix.shape[0] != len(docs):
+        logger.warning("Binary RAG index matrix does not match its doc sidecar; ignoring it")
+        return None
+    if scales is not None and scales.shape[0] != matrix.shape[0]:
+        logger.warning("Binary RAG index scales do not match its matrix; ignoring it")
+        return None
+    return docs, matrix, scales, meta
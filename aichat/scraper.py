@@ -0,0 +1,209 @@
+"""
+Concurrent page scraper used by build_rag_index.
+
+Pages are fetched by a bounded thread pool with per-host politeness limits
+(a cap on concurrent requests and a minimum gap between requests to the same
+host), pooled keep-alive connections per thread, and a conditional-GET cache on
+disk: the ETag / Last-Modified of each page is stored with its extracted text,
+so unchanged pages come back as a 304 and are not downloaded again.
+"""
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+from urllib.parse import urlparse
+
+import requests
+from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+
+from .cache import hash_key
+
+logger = logging.getLogger(__name__)
+
+USER_AGENT = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+)
+
+
+def html_to_text(content: bytes) -> str:
+    """
+    Extract readable text from an HTML page, dropping scripts and page chrome.
+    """
+    soup = BeautifulSoup(content, "html.parser")
+    for tag in soup(["script", "style", "nav", "footer", "header"]):
+        tag.decompose()
+    text = soup.get_text(separator=" ", strip=True)
+    return " ".join(text.split())
+
+
+class _HostThrottle:
+    """
+    Per-host concurrency cap plus a minimum interval between request starts.
+    """
+
+    def __init__(self, max_concurrent: int, min_interval: float):
+        self.semaphore = threading.BoundedSemaphore(max_concurrent)
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def __enter__(self):
+        self.semaphore.acquire()
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.min_interval
+        if wait > 0:
+            time.sleep(wait)
+        return self
+
+    def __exit__(self, *exc):
+        self.semaphore.release()
+        return False
+
+
+class PageScraper:
+    """
+    Fetch and extract text from many URLs concurrently.
+    Failures are logged and produce an empty string, like the original sequential scraper.
+    """
+
+    def __init__(
+        self,
+        cache_dir: Optional[Path] = None,
+        timeout: int = 10,
+        max_workers: int = 8,
+        per_host_concurrency: int = 2,
+        per_host_interval: float = 0.5,
+        max_length: Optional[int] = 5000,
+    ):
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        if self.cache_dir:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.timeout = timeout
+        self.max_workers = max(1, max_workers)
+        self.per_host_concurrency = max(1, per_host_concurrency)
+        self.per_host_interval = per_host_interval
+        self.max_length = max_length
+        self._throttles: Dict[str, _HostThrottle] = {}
+        self._throttles_lock = threading.Lock()
+        self._local = threading.local()
+        self.stats = {"fetched": 0, "not_modified": 0, "failed": 0}
+        self._stats_lock = threading.Lock()
+
+    def _session(self) -> requests.Session:
+        # requests.Session is not thread-safe, so each worker thread keeps its own
+        # keep-alive pool.
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=16, pool_maxsize=self.per_host_concurrency)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.headers["User-Agent"] = USER_AGENT
+            self._local.session = session
+        return session
+
+    def _throttle(self, url: str) -> _HostThrottle:
+        host = urlparse(url).netloc.lower()
+        with self._throttles_lock:
+            throttle = self._throttles.get(host)
+            if throttle is None:
+                throttle = _HostThrottle(self.per_host_concurrency, self.per_host_interval)
+                self._throttles[host] = throttle
+            return throttle
+
+    def _count(self, stat: str) -> None:
+        with self._stats_lock:
+            self.stats[stat] += 1
+
+    def _cache_path(self, url: str) -> Optional[Path]:
+        if not self.cache_dir:
+            return None
+        return self.cache_dir / f"{hash_key(url)}.json"
+
+    def _read_cache(self, url: str) -> Optional[dict]:
+        path = self._cache_path(url)
+        if not path or not path.exists():
+            return None
+        try:
+            return json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+
+    def _write_cache(self, url: str, response: requests.Response, text: str) -> None:
+        path = self._cache_path(url)
+        if not path:
+            return
+        entry = {
+            "url": url,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "text": text,
+            "fetched_at": time.time(),
+        }
+        tmp_path = path.with_suffix(".tmp")
+        try:
+            tmp_path.write_text(json.dumps(entry), encoding="utf-8")
+            tmp_path.replace(path)
+        except OSError as e:
+            logger.warning(f"Could not write scrape cache for {url}: {e}")
+
+    def _truncate(self, text: str) -> str:
+        if self.max_length and len(text) > self.max_length:
+            return text[:self.max_length] + "..."
+        return text
+
+    def scrape(self, url: str) -> str:
+        """
+        Return cleaned text for one URL, or "" if it cannot be fetched.
+        """
+        if not url or not url.startswith(("http://", "https://")):
+            return ""
+
+        cached = self._read_cache(url)
+        headers = {}
+        if cached:
+            if cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+        try:
+            with self._throttle(url):
+                response = self._session().get(
+                    url, headers=headers, timeout=self.timeout, allow_redirects=True
+                )
+            if response.status_code == 304 and cached:
+                self._count("not_modified")
+                return self._truncate(cached.get("text", ""))
+            response.raise_for_status()
+            text = html_to_text(response.content)
+        except requests.exceptions.RequestException as e:
+            logger.warning(f"Failed to scrape {url}: {e}")
+            self._count("failed")
+            return ""
+        except Exception as e:
+            logger.warning(f"Error parsing {url}: {e}")
+            self._count("failed")
+            return ""
+
+        self._count("fetched")
+        self._write_cache(url, response, text)
+        return self._truncate(text)
+
+    def scrape_many(self, urls: Iterable[str]) -> Dict[str, str]:
+        """
+        Scrape distinct URLs concurrently. Returns {url: text}.
+        """
+        unique_urls = list(dict.fromkeys(u for u in urls if u))
+        if not unique_urls:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(unique_urls))) as pool:
+            texts = pool.map(self.scrape, unique_urls)
+            return dict(zip(unique_urls, texts))
@@ -1,13 +1,23 @@
+from django.urls import reverse
 from rest_framework import serializers
 
-from .models import ChatSession, ChatMessage, ChatAttachment
+from .speech import get_speech_backend
+from .uploads import object_url
+from .models import ChatSession, ChatMessage, ChatAttachment, VoiceJob
 
 
 class ChatAttachmentSerializer(serializers.ModelSerializer):
+    url = serializers.SerializerMethodField()
+
     class Meta:
         model = ChatAttachment
-        fields = ["id", "file", "original_name", "mime_type", "uploaded_at"]
-        read_only_fields = ["id", "uploaded_at"]
+        fields = ["id", "file", "url", "original_name", "mime_type", "uploaded_at"]
+        read_only_fields = ["id", "url", "uploaded_at"]
+
+    def get_url(self, obj):
+        if obj.object_key:
+            return object_url(obj.object_key)
+        return obj.file.url if obj.file else None
 
 
 class ChatMessageSerializer(serializers.ModelSerializer):
@@ -58,5 +68,32 @@ class FinMateChatRequestSerializer(serializers.Serializer):
 
     session_id = serializers.IntegerField(required=False)
     message = serializers.CharField(allow_blank=False)
+    # upload_token values from /finmate/attachments/uploads/, for files uploaded directly to S3
+    attachment_tokens = serializers.ListField(child=serializers.CharField(), required=False)
+
 
+class VoiceJobSerializer(serializers.ModelSerializer):
+    audio_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = VoiceJob
+        fields = [
+            "id",
+            "session",
+            "status",
+            "transcript",
+            "detected_language",
+            "response_language",
+            "advice",
+            "voice_id",
+            "audio_url",
+            "error",
+            "created_at",
+            "updated_at",
+        ]
+        read_only_fields = fields
 
+    def get_audio_url(self, obj):
+        if not obj.audio_key:
+            return None
+        return get_speech_backend(obj.backend).output_url(obj.audio_key) or reverse("voice-job-audio", args=[obj.id])
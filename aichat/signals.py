@@ -0,0 +1,17 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from finance.models import Product
+from training.models import TrainingSection
+
+from .answer_cache import invalidate_answer_cache
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=TrainingSection)
+@receiver(post_delete, sender=TrainingSection)
+def invalidate_cached_answers(sender, **kwargs):
+    # Cached answers quote products and trainings; drop them once the change is committed
+    transaction.on_commit(invalidate_answer_cache)
@@ -0,0 +1,495 @@
+"""
+Speech backends for the FinMate voice pipeline (aichat.voice).
+
+- "aws": S3 upload + Amazon Transcribe (asynchronous job, polled) + Polly.
+  boto3 clients are created on first use, not at import.
+- "local": offline CPU stand-in. faster-whisper transcribes in-process and
+  espeak-ng synthesizes WAV. Nothing is uploaded and there is no job to poll;
+  audio is spooled to VOICE_LOCAL_SPOOL_DIR. Meant for load tests, development
+  and low-latency deployments that can trade voice quality for the S3 round trip.
+  The web process writes uploads into the spool and a Celery worker reads them
+  and writes the reply back, so both must see the same directory (same host or
+  a shared volume). Spooled files older than VOICE_LOCAL_SPOOL_TTL are deleted
+  after each job.
+
+SPEECH_BACKEND selects the backend; `manage.py benchmark_speech` compares them.
+"""
+import io
+import logging
+import os
+import shlex
+import shutil
+import subprocess
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, Optional, Tuple
+
+import requests
+from django.conf import settings
+
+from . import uploads
+
+try:
+    from faster_whisper import WhisperModel
+    FASTER_WHISPER_AVAILABLE = True
+except ImportError:
+    FASTER_WHISPER_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+SPEECH_BACKEND = getattr(settings, "SPEECH_BACKEND", "aws")
+
+AWS_REGION = getattr(settings, "AWS_S3_REGION_NAME", "ap-south-1")
+S3_BUCKET = getattr(settings, "AWS_STORAGE_BUCKET_NAME", None)
+
+# Upper bound on waiting for a Transcribe job, and the poll backoff (seconds)
+TRANSCRIBE_TIMEOUT = getattr(settings, "VOICE_TRANSCRIBE_TIMEOUT", 90)
+TRANSCRIBE_POLL_INTERVAL = getattr(settings, "VOICE_TRANSCRIBE_POLL_INTERVAL", 1.0)
+TRANSCRIBE_MAX_POLL_INTERVAL = 5.0
+AUDIO_URL_EXPIRY = getattr(settings, "VOICE_AUDIO_URL_EXPIRY", 60 * 60)
+
+LOCAL_SPOOL_DIR = Path(getattr(settings, "VOICE_LOCAL_SPOOL_DIR", None) or Path(settings.BASE_DIR) / "voice_spool")
+LOCAL_ASR_MODEL = getattr(settings, "VOICE_LOCAL_ASR_MODEL", "tiny")
+LOCAL_TTS_COMMAND = getattr(settings, "VOICE_LOCAL_TTS_COMMAND", "espeak-ng")
+LOCAL_SPOOL_TTL = getattr(settings, "VOICE_LOCAL_SPOOL_TTL", 24 * 60 * 60)
+LOCAL_TTS_TIMEOUT = 30
+
+POLLY_VOICE_BY_LANGUAGE = {
+    "en": "Aditi",  # Indian English
+    "en-in": "Aditi",
+    "en-us": "Joanna",  # US English
+    "hi": "Aditi",  # Hindi (Aditi supports Hindi)
+    "hi-in": "Aditi",
+    "ta": "Kajal",  # Tamil
+    "ta-in": "Kajal",
+    "te": "Aditi",  # Telugu - fallback
+    "te-in": "Aditi",
+    "kn": "Aditi",  # Kannada - fallback
+    "kn-in": "Aditi",
+    "ml": "Aditi",  # Malayalam - fallback
+    "ml-in": "Aditi",
+    "pa": "Aditi",  # Punjabi - fallback
+    "pa-in": "Aditi",
+    "bn": "Aditi",  # Bengali - fallback
+    "bn-in": "Aditi",
+}
+DEFAULT_POLLY_VOICE = "Aditi"
+
+# Voices that require neural engine
+NEURAL_VOICES = ["Kajal"]
+
+TRANSCRIBE_LANGUAGE_OPTIONS = [
+    "hi-IN",
+    "en-IN",
+    "en-US",
+    "ta-IN",
+    "te-IN",
+    "kn-IN",
+    "ml-IN",
+    "pa-IN",
+    "bn-IN",
+]
+
+
+class TranscriptionError(Exception):
+    """
+    Transcription failed.
+    """
+
+
+class TranscriptionTimeout(TranscriptionError):
+    """
+    Transcribe job did not finish within TRANSCRIBE_TIMEOUT.
+    """
+
+
+class SpeechConfigurationError(Exception):
+    """
+    The backend cannot run here (missing credentials, bucket or local engine).
+    `details` is a dict for the error response.
+    """
+
+    def __init__(self, message: str, details: Optional[Dict[str, Any]] = None):
+        super().__init__(message)
+        self.details = details or {}
+
+
+class BytesAudio:
+    """
+    In-memory audio behind the iter_chunks/close interface of a Polly AudioStream.
+    """
+
+    def __init__(self, data: bytes):
+        self._buffer = io.BytesIO(data)
+
+    def read(self) -> bytes:
+        return self._buffer.read()
+
+    def iter_chunks(self, chunk_size):
+        return iter(lambda: self._buffer.read(chunk_size), b"")
+
+    def close(self):
+        self._buffer.close()
+
+
+def poll_delay(attempt: int) -> float:
+    """
+    Seconds to wait before poll number `attempt` (exponential, capped).
+    """
+    return min(TRANSCRIBE_POLL_INTERVAL * 1.5 ** attempt, TRANSCRIBE_MAX_POLL_INTERVAL)
+
+
+class SpeechBackend:
+    """
+    Interface of a speech backend.
+
+    Backends with `polls_transcription` run transcription as a remote job:
+    start_transcription() returns a job reference and transcription_result()
+    returns None until it is done. The others transcribe in-process with
+    transcribe(). Synthesized audio is returned as a stream with
+    iter_chunks()/close(); `sentence_streaming` says whether the audio of
+    consecutive sentences can simply be concatenated (true for MP3).
+    """
+
+    name = ""
+    polls_transcription = False
+    sentence_streaming = True
+    audio_format = "mp3"
+    content_type = "audio/mpeg"
+
+    def check_configured(self) -> None:
+        """
+        Raise SpeechConfigurationError if the backend cannot run.
+        """
+
+    def store_input(self, audio_file) -> str:
+        """
+        Keep an uploaded recording where this backend can transcribe it; returns its key.
+        """
+        raise NotImplementedError
+
+    def presign_input(self, content_type: str, max_bytes: int) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """
+        (key, presigned POST) for uploading a recording directly, or None if
+        recordings must be sent through the app.
+        """
+        return None
+
+    def input_size(self, key: str) -> Optional[int]:
+        """
+        Size of a directly uploaded recording, or None if it is not there.
+        """
+        return None
+
+    def transcribe(self, key: str, timeout: float = TRANSCRIBE_TIMEOUT) -> Tuple[str, str]:
+        """
+        (transcript, detected language code such as "hi-IN"), blocking.
+        """
+        raise NotImplementedError
+
+    def start_transcription(self, key: str) -> str:
+        raise NotImplementedError
+
+    def transcription_result(self, ref: str) -> Optional[Tuple[str, str]]:
+        raise NotImplementedError
+
+    def choose_voice(self, language_code: str) -> str:
+        raise NotImplementedError
+
+    def preferred_engine(self, voice_id: str) -> str:
+        return self.name
+
+    def synthesize(self, text: str, voice_id: str) -> Tuple[Any, str]:
+        """
+        (audio stream, engine used) for text.
+        """
+        raise NotImplementedError
+
+    def store_output(self, audio: bytes, key: str) -> str:
+        raise NotImplementedError
+
+    def open_output(self, key: str) -> BinaryIO:
+        raise NotImplementedError
+
+    def output_url(self, key: str) -> Optional[str]:
+        """
+        Direct download URL for stored output, or None to serve it through the app.
+        """
+        return None
+
+    def cleanup(self) -> None:
+        """
+        Delete stored audio past its retention; called after each job finishes.
+        """
+
+
+class AwsSpeechBackend(SpeechBackend):
+    name = "aws"
+    polls_transcription = True
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clients: Dict[str, Any] = {}
+
+    def _client(self, service: str):
+        client = self._clients.get(service)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(service)
+                if client is None:
+                    import boto3
+
+                    client = boto3.session.Session().client(service, region_name=AWS_REGION)
+                    self._clients[service] = client
+        return client
+
+    def check_configured(self) -> None:
+        if not S3_BUCKET:
+            raise SpeechConfigurationError("AWS_STORAGE_BUCKET_NAME not configured")
+        if not getattr(settings, "AWS_ACCESS_KEY_ID", None) or not getattr(settings, "AWS_SECRET_ACCESS_KEY", None):
+            raise SpeechConfigurationError(
+                "AWS credentials not configured",
+                {"details": "Please set AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY in environment/settings."},
+            )
+
+    def store_input(self, audio_file) -> str:
+        key = f"voice_inputs/{uuid.uuid4()}.wav"
+        audio_file.seek(0)
+        self._client("s3").upload_fileobj(
+            audio_file,
+            S3_BUCKET,
+            key,
+            ExtraArgs={"ContentType": getattr(audio_file, "content_type", "audio/wav")},
+        )
+        logger.info(f"Successfully uploaded {key} to S3 bucket {S3_BUCKET}")
+        return key
+
+    def presign_input(self, content_type: str, max_bytes: int) -> Optional[Tuple[str, Dict[str, Any]]]:
+        key = f"voice_inputs/{uuid.uuid4()}.wav"
+        return key, uploads.presigned_post(key, content_type, max_bytes)
+
+    def input_size(self, key: str) -> Optional[int]:
+        return uploads.object_size(key)
+
+    def start_transcription(self, key: str) -> str:
+        job_name = f"transcribe_{uuid.uuid4()}"
+        self._client("transcribe").start_transcription_job(
+            TranscriptionJobName=job_name,
+            Media={"MediaFileUri": f"s3://{S3_BUCKET}/{key}"},
+            MediaFormat="wav",
+            IdentifyLanguage=True,
+            LanguageOptions=TRANSCRIBE_LANGUAGE_OPTIONS,
+        )
+        return job_name
+
+    def transcription_result(self, ref: str) -> Optional[Tuple[str, str]]:
+        job = self._client("transcribe").get_transcription_job(TranscriptionJobName=ref)["TranscriptionJob"]
+        state = job["TranscriptionJobStatus"]
+        if state == "FAILED":
+            raise TranscriptionError("Transcription failed")
+        if state != "COMPLETED":
+            return None
+        transcript_json = requests.get(job["Transcript"]["TranscriptFileUri"], timeout=10).json()
+        text = (transcript_json["results"]["transcripts"][0].get("transcript") or "").strip()
+        return text, job.get("LanguageCode", "en-IN")
+
+    def transcribe(self, key: str, timeout: float = TRANSCRIBE_TIMEOUT) -> Tuple[str, str]:
+        ref = self.start_transcription(key)
+        deadline = time.monotonic() + timeout
+        attempt = 0
+        while True:
+            result = self.transcription_result(ref)
+            if result is not None:
+                return result
+            delay = poll_delay(attempt)
+            if time.monotonic() + delay > deadline:
+                raise TranscriptionTimeout(f"Transcription did not finish within {timeout} seconds")
+            time.sleep(delay)
+            attempt += 1
+
+    def choose_voice(self, language_code: str) -> str:
+        normalized = language_code.lower()
+        return POLLY_VOICE_BY_LANGUAGE.get(normalized) or POLLY_VOICE_BY_LANGUAGE.get(
+            normalized.split("-")[0], DEFAULT_POLLY_VOICE
+        )
+
+    def preferred_engine(self, voice_id: str) -> str:
+        return "neural" if voice_id in NEURAL_VOICES else "standard"
+
+    def synthesize(self, text: str, voice_id: str) -> Tuple[Any, str]:
+        # Neural voices fall back to the standard engine; the last Polly error is raised
+        polly = self._client("polly")
+        engine = self.preferred_engine(voice_id)
+        try:
+            response = polly.synthesize_speech(Text=text, VoiceId=voice_id, OutputFormat="mp3", Engine=engine)
+            return response["AudioStream"], engine
+        except Exception as e:
+            logger.error(f"Error calling Polly with {engine} engine: {e}")
+            if engine != "neural":
+                raise
+        logger.info(f"Retrying with standard engine for voice {voice_id}")
+        response = polly.synthesize_speech(Text=text, VoiceId=voice_id, OutputFormat="mp3", Engine="standard")
+        return response["AudioStream"], "standard"
+
+    def store_output(self, audio: bytes, key: str) -> str:
+        self._client("s3").put_object(Bucket=S3_BUCKET, Key=key, Body=audio, ContentType=self.content_type)
+        return key
+
+    def open_output(self, key: str) -> BinaryIO:
+        return self._client("s3").get_object(Bucket=S3_BUCKET, Key=key)["Body"]
+
+    def output_url(self, key: str) -> Optional[str]:
+        try:
+            return self._client("s3").generate_presigned_url(
+                "get_object", Params={"Bucket": S3_BUCKET, "Key": key}, ExpiresIn=AUDIO_URL_EXPIRY
+            )
+        except Exception as e:
+            logger.error(f"Could not presign {key}: {e}")
+            return None
+
+
+class LocalSpeechBackend(SpeechBackend):
+    name = "local"
+    # Each espeak-ng call produces a complete WAV file, so a reply is synthesized in one piece
+    sentence_streaming = False
+    audio_format = "wav"
+    content_type = "audio/wav"
+
+    ESPEAK_VOICE_BY_LANGUAGE = {
+        "en": "en",
+        "hi": "hi",
+        "ta": "ta",
+        "te": "te",
+        "kn": "kn",
+        "ml": "ml",
+        "pa": "pa",
+        "bn": "bn",
+    }
+
+    def __init__(self, spool_dir: Path = LOCAL_SPOOL_DIR):
+        self.spool_dir = Path(spool_dir)
+        self._lock = threading.Lock()
+        self._model = None
+
+    def check_configured(self) -> None:
+        if not FASTER_WHISPER_AVAILABLE:
+            raise SpeechConfigurationError("Local speech backend needs the faster-whisper package")
+        command = shlex.split(LOCAL_TTS_COMMAND)
+        if not command or shutil.which(command[0]) is None:
+            raise SpeechConfigurationError(f"TTS command '{LOCAL_TTS_COMMAND}' not found")
+
+    def _asr_model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    logger.info(f"Loading faster-whisper model '{LOCAL_ASR_MODEL}' on CPU")
+                    self._model = WhisperModel(LOCAL_ASR_MODEL, device="cpu", compute_type="int8")
+        return self._model
+
+    def _path(self, key: str) -> Path:
+        path = (self.spool_dir / key).resolve()
+        if self.spool_dir.resolve() not in path.parents:
+            raise ValueError(f"Invalid spool key {key!r}")
+        return path
+
+    def store_input(self, audio_file) -> str:
+        key = f"inputs/{uuid.uuid4()}.wav"
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        audio_file.seek(0)
+        if hasattr(audio_file, "chunks"):
+            chunks = audio_file.chunks()
+        else:
+            chunks = iter(lambda: audio_file.read(64 * 1024), b"")
+        with path.open("wb") as f:
+            for chunk in chunks:
+                f.write(chunk)
+        return key
+
+    @staticmethod
+    def _language_code(language: Optional[str]) -> str:
+        language = (language or "en").lower()
+        for option in TRANSCRIBE_LANGUAGE_OPTIONS:
+            if option.lower().split("-")[0] == language:
+                return option
+        return "en-IN"
+
+    def transcribe(self, key: str, timeout: float = TRANSCRIBE_TIMEOUT) -> Tuple[str, str]:
+        path = self._path(key)
+        try:
+            segments, info = self._asr_model().transcribe(str(path), beam_size=1, vad_filter=True)
+            text = " ".join(segment.text.strip() for segment in segments).strip()
+        except Exception as e:
+            raise TranscriptionError(f"Transcription failed: {e}")
+        finally:
+            path.unlink(missing_ok=True)
+        return text, self._language_code(info.language)
+
+    def choose_voice(self, language_code: str) -> str:
+        return self.ESPEAK_VOICE_BY_LANGUAGE.get(language_code.lower().split("-")[0], "en")
+
+    def synthesize(self, text: str, voice_id: str) -> Tuple[Any, str]:
+        result = subprocess.run(
+            [*shlex.split(LOCAL_TTS_COMMAND), "-v", voice_id, "--stdout"],
+            input=text.encode("utf-8"),
+            capture_output=True,
+            timeout=LOCAL_TTS_TIMEOUT,
+            check=True,
+        )
+        return BytesAudio(result.stdout), self.preferred_engine(voice_id)
+
+    def store_output(self, audio: bytes, key: str) -> str:
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+        tmp_path.write_bytes(audio)
+        os.replace(tmp_path, path)
+        return key
+
+    def open_output(self, key: str) -> BinaryIO:
+        return self._path(key).open("rb")
+
+    def cleanup(self, max_age: float = LOCAL_SPOOL_TTL) -> int:
+        """
+        Delete spooled inputs and replies older than max_age seconds (replies are
+        kept that long for VoiceJobAudioView). Returns the number of files removed.
+        """
+        cutoff = time.time() - max_age
+        removed = 0
+        for path in self.spool_dir.glob("*/*"):
+            try:
+                if path.is_file() and path.stat().st_mtime < cutoff:
+                    path.unlink()
+                    removed += 1
+            except OSError as e:
+                logger.warning(f"Could not remove spooled file {path}: {e}")
+        if removed:
+            logger.info(f"Removed {removed} spooled voice files")
+        return removed
+
+
+BACKENDS = {
+    "aws": AwsSpeechBackend,
+    "local": LocalSpeechBackend,
+}
+
+_backends_lock = threading.Lock()
+_backends: Dict[str, SpeechBackend] = {}
+
+
+def get_speech_backend(name: Optional[str] = None) -> SpeechBackend:
+    """
+    Shared instance of the named backend (default: SPEECH_BACKEND).
+    """
+    name = name or SPEECH_BACKEND
+    backend = _backends.get(name)
+    if backend is None:
+        if name not in BACKENDS:
+            raise ValueError(f"Unknown speech backend '{name}' (choose from {', '.join(BACKENDS)})")
+        with _backends_lock:
+            backend = _backends.get(name)
+            if backend is None:
+                backend = _backends[name] = BACKENDS[name]()
+    return backend
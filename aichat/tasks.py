@@ -0,0 +1,194 @@
+import logging
+
+from celery import shared_task
+from django.utils import timezone
+
+from . import uploads, voice
+from .history import maybe_schedule_summary, update_history_summary
+from .models import ChatAttachment, ChatMessage, ChatSession, VoiceJob
+from .speech import TRANSCRIBE_TIMEOUT, TranscriptionError, get_speech_backend, poll_delay
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def update_chat_history_summary(session_id):
+    try:
+        session = ChatSession.objects.get(id=session_id)
+    except ChatSession.DoesNotExist:
+        return False
+    try:
+        return update_history_summary(session)
+    except Exception as e:
+        logger.error(f"History summary update failed for session {session_id}: {e}")
+        return False
+
+
+@shared_task
+def extract_attachment_text(attachment_id):
+    """
+    Pull the text out of an uploaded chat attachment (off the request path).
+    """
+    attachment = ChatAttachment.objects.filter(id=attachment_id).first()
+    if attachment is None:
+        return False
+    try:
+        text = uploads.extract_text(
+            uploads.read_attachment(attachment), attachment.mime_type, attachment.original_name
+        )
+    except Exception as e:
+        logger.error(f"Text extraction failed for attachment {attachment_id}: {e}")
+        return False
+    if text:
+        ChatAttachment.objects.filter(id=attachment_id).update(extracted_text=text)
+    return bool(text)
+
+
+def _update_job(job, **fields):
+    for name, value in fields.items():
+        setattr(job, name, value)
+    job.save(update_fields=[*fields, "updated_at"])
+
+
+def _fail_job(job, error):
+    logger.error(f"Voice job {job.id} failed: {error}")
+    _update_job(job, status="failed", error=str(error))
+
+
+def _claim_job(job_id, from_status, to_status, **fields):
+    """
+    Move a job from from_status to to_status in one conditional UPDATE. Returns
+    the job, or None if it was not in from_status (e.g. a redelivered task
+    whose job another worker already took).
+    """
+    claimed = VoiceJob.objects.filter(id=job_id, status=from_status).update(
+        status=to_status, updated_at=timezone.now(), **fields
+    )
+    return VoiceJob.objects.select_related("session").filter(id=job_id).first() if claimed else None
+
+
+def enqueue_voice_job(job):
+    """
+    Queue process_voice_job for a new job; mark the job failed if the broker is unreachable.
+    """
+    try:
+        process_voice_job.delay(str(job.id))
+    except Exception as e:
+        _fail_job(job, f"Could not queue the voice job, please try again: {e}")
+
+
+@shared_task
+def process_voice_job(job_id):
+    """
+    Transcribe an uploaded voice question. Remote transcription (AWS) is
+    started here and finished by poll_voice_job; in-process backends transcribe
+    and answer right away.
+    """
+    job = _claim_job(job_id, "queued", "transcribing", transcription_started_at=timezone.now())
+    if job is None:
+        return False
+    try:
+        backend = get_speech_backend(job.backend)
+    except Exception as e:
+        _fail_job(job, e)
+        return False
+    if not backend.polls_transcription:
+        try:
+            try:
+                text, detected_language = backend.transcribe(job.input_key)
+            except Exception as e:
+                _fail_job(job, f"Transcription failed: {e}")
+                return False
+            return _finish_voice_job(job, backend, text, detected_language)
+        finally:
+            backend.cleanup()
+    try:
+        job_name = backend.start_transcription(job.input_key)
+    except Exception as e:
+        _fail_job(job, f"Could not start transcription: {e}")
+        return False
+    _update_job(job, transcription_job_name=job_name)
+    poll_voice_job.apply_async((job_id, 0), countdown=poll_delay(0))
+    return True
+
+
+@shared_task
+def poll_voice_job(job_id, attempt=0):
+    """
+    Check the transcription job once; reschedule itself (with backoff) while it
+    is running, so no worker sleeps on it. Gives up after VOICE_TRANSCRIBE_TIMEOUT.
+    """
+    job = VoiceJob.objects.filter(id=job_id, status="transcribing").first()
+    if job is None:
+        return False
+    backend = get_speech_backend(job.backend)
+    try:
+        result = backend.transcription_result(job.transcription_job_name)
+    except TranscriptionError as e:
+        _fail_job(job, e)
+        return False
+    except Exception as e:
+        logger.warning(f"Polling transcription for voice job {job_id} failed: {e}")
+        result = None
+
+    if result is not None:
+        job = _claim_job(job_id, "transcribing", "generating")
+        if job is None:
+            return False
+        return _finish_voice_job(job, backend, *result)
+    if (timezone.now() - job.transcription_started_at).total_seconds() >= TRANSCRIBE_TIMEOUT:
+        _fail_job(job, f"Transcription did not finish within {TRANSCRIBE_TIMEOUT} seconds")
+        return False
+    poll_voice_job.apply_async((job_id, attempt + 1), countdown=poll_delay(attempt + 1))
+    return None
+
+
+def _finish_voice_job(job, backend, text, detected_language):
+    """
+    Answer a transcribed job. Any error leaves the job failed, never stuck mid-pipeline.
+    """
+    try:
+        _answer_voice_job(job, backend, text, detected_language)
+    except Exception as e:
+        logger.exception(f"Answering voice job {job.id} failed")
+        _fail_job(job, f"Could not answer the voice question: {e}")
+    return job.status == "completed"
+
+
+def _answer_voice_job(job, backend, text, detected_language):
+    from .views import _generate_finmate_ai_reply
+
+    if not text:
+        _fail_job(job, "Could not transcribe the audio. Please try again with a clearer recording.")
+        return
+
+    response_language = (job.requested_language or detected_language or "en-IN").upper()
+    voice_id = job.requested_voice_id or backend.choose_voice(response_language)
+    _update_job(
+        job,
+        status="generating",
+        transcript=text,
+        detected_language=detected_language,
+        response_language=response_language,
+        voice_id=voice_id,
+    )
+
+    session = job.session
+    ChatMessage.objects.create(session=session, role="user", content=text)
+    advice = _generate_finmate_ai_reply(
+        session, text, language_instruction=voice.get_language_instruction(response_language)
+    )
+    ChatMessage.objects.create(session=session, role="assistant", content=advice)
+    maybe_schedule_summary(session)
+    _update_job(job, status="synthesizing", advice=advice)
+
+    try:
+        audio_key = backend.store_output(
+            voice.synthesize_speech(advice, voice_id, backend),
+            f"voice_outputs/{job.id}.{backend.audio_format}",
+        )
+    except Exception as e:
+        logger.error(f"TTS failed for voice job {job.id}: {e}")
+        _update_job(job, status="completed", error=f"TTS failed, returning text only: {e}")
+        return
+    _update_job(job, status="completed", audio_key=audio_key)
@@ -0,0 +1,178 @@
+"""
+Content-addressed cache for synthesized speech.
+
+Polly output depends only on (text, voice, engine, format), so each sentence's
+audio is stored on local disk under the hash of those and served directly
+when the sentence comes up again: fallback replies, standard product
+explanations, disclaimers. The directory is bounded by
+VOICE_TTS_CACHE_MAX_BYTES. When a write takes it over the limit, the least
+recently used files (mtime, refreshed on every hit) are deleted down to 90%
+of it. Files are written to a temp name and renamed into place, so readers in
+other workers never see a partial file.
+"""
+import logging
+import os
+import threading
+import uuid
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, Optional
+
+from django.conf import settings
+
+from .cache import hash_key
+
+logger = logging.getLogger(__name__)
+
+TTS_CACHE_ENABLED = getattr(settings, "VOICE_TTS_CACHE_ENABLED", True)
+TTS_CACHE_DIR = Path(getattr(settings, "VOICE_TTS_CACHE_DIR", None) or Path(settings.BASE_DIR) / "tts_cache")
+TTS_CACHE_MAX_BYTES = getattr(settings, "VOICE_TTS_CACHE_MAX_BYTES", 512 * 1024 * 1024)
+
+
+class AudioCacheWriter:
+    """
+    Collects one entry's bytes in a temp file; `commit()` publishes it, `abort()` drops it.
+    """
+
+    def __init__(self, cache: "AudioCache", key: str):
+        self.cache = cache
+        self.key = key
+        self.path = cache.path(key)
+        self.tmp_path = self.path.with_name(f".{self.path.name}.{uuid.uuid4().hex}.tmp")
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file: Optional[BinaryIO] = self.tmp_path.open("wb")
+        self.size = 0
+
+    def write(self, data: bytes) -> None:
+        if self._file is not None:
+            self._file.write(data)
+            self.size += len(data)
+
+    def commit(self) -> None:
+        if self._file is None:
+            return
+        self._file.close()
+        self._file = None
+        if not self.size:
+            self.tmp_path.unlink(missing_ok=True)
+            return
+        os.replace(self.tmp_path, self.path)
+        self.cache._stored(self.size)
+
+    def abort(self) -> None:
+        if self._file is None:
+            return
+        self._file.close()
+        self._file = None
+        self.tmp_path.unlink(missing_ok=True)
+
+
+class AudioCache:
+    def __init__(self, directory: Path, max_bytes: int):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._size: Optional[int] = None  # bytes on disk as of the last scan + our writes since
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    @staticmethod
+    def key(text: str, voice_id: str, engine: str, output_format: str = "mp3") -> str:
+        # The format doubles as the file suffix
+        return f"{hash_key(text, voice_id, engine, output_format)}.{output_format}"
+
+    def path(self, key: str) -> Path:
+        return self.directory / key[:2] / key
+
+    def _count(self, stat: str, n: int = 1) -> None:
+        with self._lock:
+            self._stats[stat] += n
+
+    def open(self, key: str) -> Optional[BinaryIO]:
+        """
+        Cached audio for key (and mark it recently used), or None.
+        """
+        path = self.path(key)
+        try:
+            f = path.open("rb")
+        except OSError:
+            self._count("misses")
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self._count("hits")
+        return f
+
+    def writer(self, key: str) -> Optional[AudioCacheWriter]:
+        try:
+            return AudioCacheWriter(self, key)
+        except OSError as e:
+            logger.warning(f"TTS cache not writable ({self.directory}): {e}")
+            return None
+
+    def _stored(self, nbytes: int) -> None:
+        with self._lock:
+            self._stats["stores"] += 1
+            if self._size is not None:
+                self._size += nbytes
+            over = self._size is None or self._size > self.max_bytes
+        if over:
+            self.evict()
+
+    def _entries(self):
+        entries = []
+        for shard in os.scandir(self.directory):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if not entry.name.startswith("."):
+                    try:
+                        st = entry.stat()
+                    except OSError:
+                        continue
+                    entries.append((st.st_mtime, st.st_size, entry.path))
+        return entries
+
+    def evict(self) -> int:
+        """
+        Rescan the directory and delete least recently used files down to 90%
+        of max_bytes. Returns the number of files removed.
+        """
+        try:
+            entries = self._entries()
+        except OSError as e:
+            logger.warning(f"TTS cache scan failed: {e}")
+            return 0
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        if total > self.max_bytes:
+            target = self.max_bytes * 0.9
+            for _, size, path in sorted(entries):
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                removed += 1
+            logger.info(f"TTS cache evicted {removed} files, {total} bytes remain")
+        with self._lock:
+            self._size = total
+            self._stats["evictions"] += removed
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size_bytes"] = self._size
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+
+_audio_cache = AudioCache(TTS_CACHE_DIR, TTS_CACHE_MAX_BYTES) if TTS_CACHE_ENABLED else None
+
+
+def get_audio_cache() -> Optional[AudioCache]:
+    return _audio_cache
@@ -0,0 +1,178 @@
+"""
+Direct-to-S3 uploads for chat attachments and voice recordings.
+
+Instead of proxying the file through a Django worker, the client asks for a
+presigned POST (S3 enforces the content type and size limit), uploads straight
+to the bucket, and then confirms with the signed `upload_token` it was given:
+as `attachment_tokens` on a chat message, or `upload_token` on a voice request.
+The token binds the object key to the user and the kind of upload, so nothing
+is stored for uploads that are never confirmed.
+
+Post-processing (text extraction for attachments) runs on Celery.
+"""
+import io
+import logging
+import os
+import threading
+import uuid
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+from django.core import signing
+from django.utils.text import get_valid_filename
+
+try:
+    from pypdf import PdfReader
+    PYPDF_AVAILABLE = True
+except ImportError:
+    PYPDF_AVAILABLE = False
+
+try:
+    import docx
+    DOCX_AVAILABLE = True
+except ImportError:
+    DOCX_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+S3_BUCKET = getattr(settings, "AWS_STORAGE_BUCKET_NAME", None)
+AWS_REGION = getattr(settings, "AWS_S3_REGION_NAME", "ap-south-1")
+UPLOAD_URL_EXPIRY = getattr(settings, "UPLOAD_URL_EXPIRY", 15 * 60)
+UPLOAD_TOKEN_MAX_AGE = getattr(settings, "UPLOAD_TOKEN_MAX_AGE", 24 * 60 * 60)
+ATTACHMENT_MAX_BYTES = getattr(settings, "CHAT_ATTACHMENT_MAX_BYTES", 25 * 1024 * 1024)
+ATTACHMENT_TEXT_MAX_CHARS = getattr(settings, "CHAT_ATTACHMENT_TEXT_MAX_CHARS", 20000)
+
+UPLOAD_TOKEN_SALT = "aichat.uploads"
+ATTACHMENT_PREFIX = "aichat/uploads/direct"
+
+TEXT_MIME_TYPES = ("application/json", "application/csv", "application/xml")
+TEXT_EXTENSIONS = (".txt", ".csv", ".json", ".md", ".xml")
+
+
+class UploadError(Exception):
+    """
+    The upload token is invalid or expired, or the object was never uploaded.
+    """
+
+
+_s3_lock = threading.Lock()
+_s3 = None
+
+
+def _s3_client():
+    global _s3
+    if _s3 is None:
+        with _s3_lock:
+            if _s3 is None:
+                import boto3
+
+                _s3 = boto3.session.Session().client("s3", region_name=AWS_REGION)
+    return _s3
+
+
+def check_configured() -> None:
+    if not S3_BUCKET:
+        raise UploadError("AWS_STORAGE_BUCKET_NAME not configured")
+
+
+def presigned_post(key: str, content_type: str, max_bytes: int) -> Dict[str, Any]:
+    """
+    {"url", "fields"} for a browser/mobile form POST of one object to key.
+    """
+    return _s3_client().generate_presigned_post(
+        Bucket=S3_BUCKET,
+        Key=key,
+        Fields={"Content-Type": content_type},
+        Conditions=[{"Content-Type": content_type}, ["content-length-range", 1, max_bytes]],
+        ExpiresIn=UPLOAD_URL_EXPIRY,
+    )
+
+
+def object_size(key: str) -> Optional[int]:
+    """
+    Size of an uploaded object, or None if it does not exist (yet).
+    """
+    try:
+        return _s3_client().head_object(Bucket=S3_BUCKET, Key=key)["ContentLength"]
+    except Exception as e:
+        logger.info(f"Uploaded object {key} not found: {e}")
+        return None
+
+
+def object_url(key: str) -> Optional[str]:
+    try:
+        return _s3_client().generate_presigned_url(
+            "get_object", Params={"Bucket": S3_BUCKET, "Key": key}, ExpiresIn=UPLOAD_URL_EXPIRY
+        )
+    except Exception as e:
+        logger.error(f"Could not presign {key}: {e}")
+        return None
+
+
+def read_object(key: str) -> bytes:
+    return _s3_client().get_object(Bucket=S3_BUCKET, Key=key)["Body"].read()
+
+
+def sign_upload(user, kind: str, key: str, **meta) -> str:
+    return signing.dumps({"kind": kind, "user": user.pk, "key": key, **meta}, salt=UPLOAD_TOKEN_SALT, compress=True)
+
+
+def read_upload_token(token: str, user, kind: str) -> Dict[str, Any]:
+    """
+    Payload of an upload token issued to user for this kind of upload.
+    """
+    try:
+        payload = signing.loads(token, salt=UPLOAD_TOKEN_SALT, max_age=UPLOAD_TOKEN_MAX_AGE)
+    except signing.SignatureExpired:
+        raise UploadError("Upload token expired, please upload the file again")
+    except signing.BadSignature:
+        raise UploadError("Invalid upload token")
+    if payload.get("kind") != kind or payload.get("user") != user.pk:
+        raise UploadError("Invalid upload token")
+    return payload
+
+
+def attachment_key(filename: str) -> str:
+    name = get_valid_filename(os.path.basename(filename or "")) or "attachment"
+    return f"{ATTACHMENT_PREFIX}/{uuid.uuid4().hex}/{name[-100:]}"
+
+
+def confirm_attachment_upload(token: str, user) -> Dict[str, Any]:
+    """
+    {"key", "name", "content_type"} of an attachment the client has uploaded.
+    """
+    upload = read_upload_token(token, user, "attachment")
+    if object_size(upload["key"]) is None:
+        raise UploadError(f"Attachment '{upload.get('name', '')}' has not been uploaded yet")
+    return upload
+
+
+def read_attachment(attachment) -> bytes:
+    if attachment.object_key:
+        return read_object(attachment.object_key)
+    with attachment.file.open("rb") as f:
+        return f.read()
+
+
+def extract_text(data: bytes, mime_type: str = "", name: str = "") -> str:
+    """
+    Plain text of a text, PDF or DOCX attachment (truncated to
+    CHAT_ATTACHMENT_TEXT_MAX_CHARS); empty for anything else.
+    """
+    mime_type = (mime_type or "").lower()
+    name = (name or "").lower()
+    if mime_type.startswith("text/") or mime_type in TEXT_MIME_TYPES or name.endswith(TEXT_EXTENSIONS):
+        text = data.decode("utf-8", errors="replace")
+    elif mime_type == "application/pdf" or name.endswith(".pdf"):
+        if not PYPDF_AVAILABLE:
+            logger.warning("pypdf not installed, skipping PDF text extraction")
+            return ""
+        text = "\n".join(page.extract_text() or "" for page in PdfReader(io.BytesIO(data)).pages)
+    elif name.endswith(".docx"):
+        if not DOCX_AVAILABLE:
+            logger.warning("python-docx not installed, skipping DOCX text extraction")
+            return ""
+        text = "\n".join(p.text for p in docx.Document(io.BytesIO(data)).paragraphs)
+    else:
+        return ""
+    return text.strip()[:ATTACHMENT_TEXT_MAX_CHARS]
@@ -1,12 +1,44 @@
+from django.conf import settings
 from django.urls import path
 
-from .views import FinMateInitView, FinMateChatView, voice_to_finance
+from .views import (
+    AttachmentUploadView,
+    FinMateInitView,
+    FinMateChatView,
+    FinMateChatStreamView,
+    VoiceJobAudioView,
+    VoiceJobCreateView,
+    VoiceJobDetailView,
+    VoiceUploadView,
+    voice_to_finance,
+)
+
+# Under ASGI the async views keep LLM calls off worker threads
+if getattr(settings, "CHAT_ASYNC_VIEWS", False):
+    from . import async_views
+
+    finmate_init_view = async_views.finmate_init
+    finmate_chat_view = async_views.finmate_chat
+    # SSE subscriptions only under ASGI; WSGI clients poll voice-job-detail
+    async_routes = [
+        path("voice/jobs/<uuid:job_id>/events/", async_views.voice_job_events, name="voice-job-events"),
+    ]
+else:
+    finmate_init_view = FinMateInitView.as_view()
+    finmate_chat_view = FinMateChatView.as_view()
+    async_routes = []
 
 
 urlpatterns = [
-    path("finmate/init/", FinMateInitView.as_view(), name="finmate-init"),
-    path("finmate/chat/", FinMateChatView.as_view(), name="finmate-chat"),
+    path("finmate/init/", finmate_init_view, name="finmate-init"),
+    path("finmate/chat/", finmate_chat_view, name="finmate-chat"),
+    path("finmate/chat/stream/", FinMateChatStreamView.as_view(), name="finmate-chat-stream"),
+    path("finmate/attachments/uploads/", AttachmentUploadView.as_view(), name="finmate-attachment-upload"),
     path("voice/ask", voice_to_finance, name="voice-to-finance"),
-]
+    path("voice/uploads/", VoiceUploadView.as_view(), name="voice-upload"),
+    path("voice/jobs/", VoiceJobCreateView.as_view(), name="voice-job-create"),
+    path("voice/jobs/<uuid:job_id>/", VoiceJobDetailView.as_view(), name="voice-job-detail"),
+    path("voice/jobs/<uuid:job_id>/audio/", VoiceJobAudioView.as_view(), name="voice-job-audio"),
+] + async_routes
 
 
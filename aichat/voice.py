@@ -0,0 +1,196 @@
+"""
+FinMate voice pipeline on top of a speech backend (aichat.speech).
+
+Shared by the synchronous /voice/ask endpoint and the job-based flow
+(VoiceJob + aichat.tasks.process_voice_job / poll_voice_job), where a request
+only stores the audio and Celery does the rest.
+"""
+import logging
+import re
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List, Optional
+
+from django.conf import settings
+
+from .speech import SpeechBackend, get_speech_backend
+from .tts_cache import get_audio_cache
+
+logger = logging.getLogger(__name__)
+
+# Polly allows 3000 billed characters per request; sentences longer than
+# TTS_CHUNK_CHARS are split. Up to TTS_CONCURRENCY sentences of one reply are
+# synthesized at a time.
+TTS_CHUNK_CHARS = getattr(settings, "VOICE_TTS_CHUNK_CHARS", 1000)
+TTS_CONCURRENCY = getattr(settings, "VOICE_TTS_CONCURRENCY", 4)
+TTS_WORKERS = getattr(settings, "VOICE_TTS_WORKERS", 16)
+TTS_READ_SIZE = 16 * 1024
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?।])\s+|\n+")
+
+_tts_executor = ThreadPoolExecutor(max_workers=TTS_WORKERS, thread_name_prefix="voice-tts")
+
+LANGUAGE_DISPLAY_NAMES = {
+    "EN-IN": "English",
+    "EN-US": "English",
+    "HI-IN": "Hindi",
+    "TA-IN": "Tamil",
+    "TE-IN": "Telugu",
+    "KN-IN": "Kannada",
+    "ML-IN": "Malayalam",
+    "PA-IN": "Punjabi",
+    "BN-IN": "Bengali",
+}
+
+
+def get_language_instruction(language_code: Optional[str]) -> Optional[str]:
+    if not language_code:
+        return None
+    display = LANGUAGE_DISPLAY_NAMES.get(language_code.upper(), "the user's language")
+    return f"Respond in {display}"
+
+
+class _CachedAudio:
+    """
+    A TTS cache file behind the same iter_chunks/close interface as a Polly stream.
+    """
+
+    def __init__(self, f):
+        self._file = f
+
+    def iter_chunks(self, chunk_size):
+        return iter(lambda: self._file.read(chunk_size), b"")
+
+    def close(self):
+        self._file.close()
+
+
+class _CachingStream:
+    """
+    Relays a synthesized stream and stores it in the TTS cache once fully read.
+    """
+
+    def __init__(self, stream, writer):
+        self._stream = stream
+        self._writer = writer
+
+    def iter_chunks(self, chunk_size):
+        for data in self._stream.iter_chunks(chunk_size):
+            self._writer.write(data)
+            yield data
+        self._writer.commit()
+
+    def close(self):
+        self._writer.abort()  # no-op after commit
+        self._stream.close()
+
+
+def _open_audio(backend: SpeechBackend, text: str, voice_id: str):
+    """
+    Readable audio for one chunk: from the TTS cache when present, else from
+    the backend (stored in the cache as it is read).
+    """
+    cache = get_audio_cache()
+    key = None
+    if cache is not None:
+        # Keyed on the requested engine, so audio from a neural -> standard
+        # fallback is found again by the next request for the same voice
+        key = cache.key(text, voice_id, backend.preferred_engine(voice_id), backend.audio_format)
+        cached = cache.open(key)
+        if cached is not None:
+            return _CachedAudio(cached)
+    stream, _engine = backend.synthesize(text, voice_id)
+    writer = cache.writer(key) if cache is not None else None
+    return _CachingStream(stream, writer) if writer is not None else stream
+
+
+def _split_long(sentence: str, max_chars: int) -> List[str]:
+    parts, current = [], ""
+    for word in sentence.split():
+        if current and len(current) + 1 + len(word) > max_chars:
+            parts.append(current)
+            current = ""
+        current = f"{current} {word}" if current else word
+    if current:
+        parts.append(current)
+    return [p[i:i + max_chars] for p in parts for i in range(0, len(p), max_chars)]
+
+
+def split_for_speech(text: str, max_chars: int = TTS_CHUNK_CHARS) -> List[str]:
+    """
+    One chunk per sentence (longer sentences split at words to max_chars).
+    Sentences are the unit of the TTS cache, and the first one can play
+    while the rest are still being synthesized.
+    """
+    chunks = []
+    for sentence in _SENTENCE_RE.split(text or ""):
+        sentence = sentence.strip()
+        if sentence:
+            chunks.extend(_split_long(sentence, max_chars) if len(sentence) > max_chars else [sentence])
+    return chunks
+
+
+def _release(futures) -> None:
+    for future in futures:
+        if future.cancel():
+            continue
+        try:
+            future.result().close()
+        except Exception:
+            pass
+
+
+def open_speech_stream(text: str, voice_id: str, backend: Optional[SpeechBackend] = None) -> Iterator[bytes]:
+    """
+    Audio bytes for text, produced sentence by sentence. Sentences come from
+    the TTS cache or are synthesized concurrently (at most TTS_CONCURRENCY in
+    flight), and their audio is relayed in order as it arrives, so nothing is
+    buffered whole. Backends whose audio cannot be concatenated
+    (`sentence_streaming = False`) synthesize the text in one piece.
+
+    Waits for the first chunk before returning, so a synthesis failure raises
+    here (while a fallback response is still possible). A later chunk that
+    fails ends the audio early.
+    """
+    backend = backend or get_speech_backend()
+    chunks = split_for_speech(text) if backend.sentence_streaming else [(text or "").strip()]
+    if not any(chunks):
+        raise ValueError("Nothing to synthesize")
+    pending = deque(_tts_executor.submit(_open_audio, backend, chunk, voice_id) for chunk in chunks[:TTS_CONCURRENCY])
+    queued = deque(chunks[TTS_CONCURRENCY:])
+    try:
+        first_stream = pending.popleft().result()
+    except Exception:
+        _release(pending)
+        raise
+
+    def relay():
+        stream = first_stream
+        try:
+            while True:
+                if queued:
+                    pending.append(_tts_executor.submit(_open_audio, backend, queued.popleft(), voice_id))
+                try:
+                    for data in stream.iter_chunks(TTS_READ_SIZE):
+                        yield data
+                finally:
+                    stream.close()
+                if not pending:
+                    return
+                try:
+                    stream = pending.popleft().result()
+                except Exception as e:
+                    logger.error(f"Speech synthesis failed mid-reply, truncating audio: {e}")
+                    return
+        finally:
+            # Client went away or a chunk failed: release what is still in flight
+            _release(pending)
+
+    return relay()
+
+
+def synthesize_speech(text: str, voice_id: str, backend: Optional[SpeechBackend] = None) -> bytes:
+    """
+    Whole audio for text (chunked like open_speech_stream, for long advice).
+    """
+    return b"".join(open_speech_stream(text, voice_id, backend))
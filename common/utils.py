@@ -1,8 +1,21 @@
 import re
+from django.conf import settings
 from django.core.exceptions import ValidationError
 
+# Cache backends whose contents are not seen by other processes
+PROCESS_LOCAL_CACHE_BACKENDS = (
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+)
+
 
 def validate_indian_phone(value):
     """Validates a 10-digit Indian phone number"""
     if not re.match(r"^[6-9]\d{9}$", str(value)):
         raise ValidationError("Invalid Indian phone number.")
+
+
+def is_shared_cache(alias):
+    """True if the Django cache alias is shared by all processes (Redis, Memcached, DB, file)."""
+    config = settings.CACHES.get(alias)
+    return bool(config) and config.get("BACKEND") not in PROCESS_LOCAL_CACHE_BACKENDS
@@ -218,6 +218,114 @@ DEFAULT_FROM_EMAIL =os.getenv("DEFAULT_FROM_EMAIL", default="no-reply@example.co
 # Webhook secret for partner verification
 WEBHOOK_SECRET =os.getenv("WEBHOOK_SECRET")
 OPENAI_API_KEY=os.getenv("OPENAI_API_KEY")
+# Shared OpenAI client pool (aichat.llm_clients): timeouts in seconds, SDK retries with backoff
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "30"))
+OPENAI_CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "5"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "2"))
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "100"))
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "20"))
 
 STATIC_URL = '/static/'
-STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
\ No newline at end of file
+STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
+
+# Caches: in-process by default, Redis (django-redis) when REDIS_CACHE_URL is set
+REDIS_CACHE_URL = os.getenv("REDIS_CACHE_URL")
+CACHES = {
+    "default": (
+        {
+            "BACKEND": "django_redis.cache.RedisCache",
+            "LOCATION": REDIS_CACHE_URL,
+            "OPTIONS": {"CLIENT_CLASS": "django_redis.client.DefaultClient"},
+        }
+        if REDIS_CACHE_URL
+        else {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+    ),
+}
+
+# FinMate RAG
+RAG_INDEX_RELOAD_INTERVAL = float(os.getenv("RAG_INDEX_RELOAD_INTERVAL", "5"))
+RAG_EMBEDDING_CACHE_SIZE = int(os.getenv("RAG_EMBEDDING_CACHE_SIZE", "2048"))
+RAG_EMBEDDING_CACHE_TTL = int(os.getenv("RAG_EMBEDDING_CACHE_TTL", str(24 * 60 * 60)))
+# Django cache alias used as the shared embedding tier (e.g. "default" with Redis); empty = in-process only
+RAG_EMBEDDING_CACHE_ALIAS = os.getenv("RAG_EMBEDDING_CACHE_ALIAS") or None
+# "ivf" enables approximate search when build_rag_index was run with --ivf-lists
+RAG_ANN_BACKEND = os.getenv("RAG_ANN_BACKEND") or None
+RAG_ANN_NPROBE = int(os.getenv("RAG_ANN_NPROBE", "8"))
+# "hybrid" (vector + BM25, BM25-only fallback), "vector", or "lexical" (no embeddings call)
+RAG_RETRIEVAL_MODE = os.getenv("RAG_RETRIEVAL_MODE", "hybrid")
+
+# Serve the FinMate/Watson init and chat endpoints with the async views (use with an ASGI server)
+CHAT_ASYNC_VIEWS = os.getenv("CHAT_ASYNC_VIEWS", "False") == "True"
+
+# Training-section prompt context cache (invalidated by TrainingSection save/delete).
+# Only used when the cache alias is shared (REDIS_CACHE_URL set); with LocMemCache it is rebuilt from the DB per turn
+TRAINING_CONTEXT_CACHE_TTL = int(os.getenv("TRAINING_CONTEXT_CACHE_TTL", str(24 * 60 * 60)))
+TRAINING_CONTEXT_VERSION_CHECK_INTERVAL = float(os.getenv("TRAINING_CONTEXT_VERSION_CHECK_INTERVAL", "5"))
+
+# Chat prompt history: recent messages within a token budget plus a rolling summary of older turns
+CHAT_HISTORY_TOKEN_BUDGET = int(os.getenv("CHAT_HISTORY_TOKEN_BUDGET", "1500"))
+CHAT_HISTORY_SUMMARY_MIN_MESSAGES = int(os.getenv("CHAT_HISTORY_SUMMARY_MIN_MESSAGES", "6"))
+
+# Semantic answer cache for first-turn FinMate questions (invalidated on Product/TrainingSection changes).
+# Needs a shared cache (REDIS_CACHE_URL); it is disabled when the default cache is the per-process LocMemCache
+FINMATE_ANSWER_CACHE_ENABLED = os.getenv("FINMATE_ANSWER_CACHE_ENABLED", "True") == "True"
+FINMATE_ANSWER_CACHE_THRESHOLD = float(os.getenv("FINMATE_ANSWER_CACHE_THRESHOLD", "0.93"))
+FINMATE_ANSWER_CACHE_TTL = int(os.getenv("FINMATE_ANSWER_CACHE_TTL", str(6 * 60 * 60)))
+FINMATE_ANSWER_CACHE_SCORE_BUCKET = int(os.getenv("FINMATE_ANSWER_CACHE_SCORE_BUCKET", "10"))
+# UHFS components below this value count as weak when partitioning the answer cache
+FINMATE_ANSWER_CACHE_WEAK_BELOW = float(os.getenv("FINMATE_ANSWER_CACHE_WEAK_BELOW", "0.5"))
+
+# Compact prompt context (aichat.prompt_context)
+FINMATE_CONTEXT_MAX_PRODUCTS = int(os.getenv("FINMATE_CONTEXT_MAX_PRODUCTS", "8"))
+FINMATE_CONTEXT_TOKEN_BUDGET = int(os.getenv("FINMATE_CONTEXT_TOKEN_BUDGET", "1200"))
+# Extracted attachment text in the prompt: most recent attachments of the session, characters kept from each
+FINMATE_CONTEXT_MAX_ATTACHMENTS = int(os.getenv("FINMATE_CONTEXT_MAX_ATTACHMENTS", "3"))
+FINMATE_CONTEXT_ATTACHMENT_CHARS = int(os.getenv("FINMATE_CONTEXT_ATTACHMENT_CHARS", "3000"))
+
+# Per-turn fan-out (aichat.orchestrator): input moderation on/off, thread pool size, stage timeouts in seconds
+FINMATE_GUARDRAILS_ENABLED = os.getenv("FINMATE_GUARDRAILS_ENABLED", "False") == "True"
+FINMATE_TURN_WORKERS = int(os.getenv("FINMATE_TURN_WORKERS", "32"))
+FINMATE_STAGE_TIMEOUTS = {
+    "moderation": float(os.getenv("FINMATE_MODERATION_TIMEOUT", "2")),
+    "retrieval": float(os.getenv("FINMATE_RETRIEVAL_TIMEOUT", "3")),
+}
+
+# Guardrail rules: optional JSON file extending the built-in patterns, re-read when it changes
+GUARDRAIL_RULES_FILE = os.getenv("GUARDRAIL_RULES_FILE") or None
+GUARDRAIL_RULES_RELOAD_INTERVAL = float(os.getenv("GUARDRAIL_RULES_RELOAD_INTERVAL", "5"))
+
+# Tiered moderation (aichat.moderation): local model decides below/above these probabilities, the rest goes to the API.
+# The local tier is opt-in: no model ships, train one with `manage.py train_moderation_model` and set MODERATION_MODEL_PATH
+MODERATION_MODEL_PATH = os.getenv("MODERATION_MODEL_PATH") or None
+MODERATION_LOCAL_SAFE_BELOW = float(os.getenv("MODERATION_LOCAL_SAFE_BELOW", "0.05"))
+MODERATION_LOCAL_FLAG_ABOVE = float(os.getenv("MODERATION_LOCAL_FLAG_ABOVE", "0.97"))
+MODERATION_CACHE_TTL = int(os.getenv("MODERATION_CACHE_TTL", str(7 * 24 * 60 * 60)))
+
+# Voice pipeline: bound on Transcribe polling, first poll interval, SSE subscription length (CHAT_ASYNC_VIEWS only), reply URL lifetime (seconds)
+VOICE_TRANSCRIBE_TIMEOUT = int(os.getenv("VOICE_TRANSCRIBE_TIMEOUT", "90"))
+VOICE_TRANSCRIBE_POLL_INTERVAL = float(os.getenv("VOICE_TRANSCRIBE_POLL_INTERVAL", "1"))
+VOICE_JOB_EVENTS_TIMEOUT = int(os.getenv("VOICE_JOB_EVENTS_TIMEOUT", "120"))
+VOICE_AUDIO_URL_EXPIRY = int(os.getenv("VOICE_AUDIO_URL_EXPIRY", "3600"))
+
+# Polly synthesis of long replies: max sentence length (chars) and sentences in flight per reply
+VOICE_TTS_CHUNK_CHARS = int(os.getenv("VOICE_TTS_CHUNK_CHARS", "1000"))
+VOICE_TTS_CONCURRENCY = int(os.getenv("VOICE_TTS_CONCURRENCY", "4"))
+
+# Content-addressed on-disk cache of synthesized sentences, LRU-evicted above VOICE_TTS_CACHE_MAX_BYTES
+VOICE_TTS_CACHE_ENABLED = os.getenv("VOICE_TTS_CACHE_ENABLED", "True") == "True"
+VOICE_TTS_CACHE_DIR = os.getenv("VOICE_TTS_CACHE_DIR") or None
+VOICE_TTS_CACHE_MAX_BYTES = int(os.getenv("VOICE_TTS_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+# Speech backend for the voice pipeline: "aws" (S3 + Transcribe + Polly) or "local" (faster-whisper + espeak-ng on CPU).
+# The local spool directory must be shared by the web and Celery worker hosts; spooled audio is deleted after VOICE_LOCAL_SPOOL_TTL seconds
+SPEECH_BACKEND = os.getenv("SPEECH_BACKEND", "aws")
+VOICE_LOCAL_SPOOL_DIR = os.getenv("VOICE_LOCAL_SPOOL_DIR") or None
+VOICE_LOCAL_SPOOL_TTL = int(os.getenv("VOICE_LOCAL_SPOOL_TTL", str(24 * 60 * 60)))
+VOICE_LOCAL_ASR_MODEL = os.getenv("VOICE_LOCAL_ASR_MODEL", "tiny")
+VOICE_LOCAL_TTS_COMMAND = os.getenv("VOICE_LOCAL_TTS_COMMAND", "espeak-ng")
+
+# Direct (presigned) S3 uploads: POST URL lifetime, how long an upload can still be confirmed, attachment limits
+UPLOAD_URL_EXPIRY = int(os.getenv("UPLOAD_URL_EXPIRY", "900"))
+UPLOAD_TOKEN_MAX_AGE = int(os.getenv("UPLOAD_TOKEN_MAX_AGE", str(24 * 60 * 60)))
+CHAT_ATTACHMENT_MAX_BYTES = int(os.getenv("CHAT_ATTACHMENT_MAX_BYTES", str(25 * 1024 * 1024)))
+CHAT_ATTACHMENT_TEXT_MAX_CHARS = int(os.getenv("CHAT_ATTACHMENT_TEXT_MAX_CHARS", "20000"))
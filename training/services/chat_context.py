@@ -0,0 +1,132 @@
+"""
+Training-section context for the FinMate / Watson chat prompts.
+
+The context (active sections with their content flags) changes only when an
+admin edits training content, so it is cached in two tiers: a process-local
+copy and a shared copy in the Django cache. Both are keyed by a version token
+stored in the shared cache; TrainingSection save/delete signals replace the
+token (see training.signals), which invalidates every process at once.
+Processes re-read the token at most every VERSION_CHECK_INTERVAL seconds.
+
+This needs TRAINING_CONTEXT_CACHE_ALIAS to be a shared cache (e.g. Redis via
+REDIS_CACHE_URL). With a per-process backend such as the LocMemCache default,
+an admin edit would only invalidate the process that saved it, so the context
+is built from the database on every call instead.
+"""
+import logging
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+
+from common.utils import is_shared_cache
+from training.models import TrainingSection
+
+logger = logging.getLogger(__name__)
+
+CACHE_ALIAS = getattr(settings, "TRAINING_CONTEXT_CACHE_ALIAS", "default")
+CACHE_TTL = getattr(settings, "TRAINING_CONTEXT_CACHE_TTL", 24 * 60 * 60)
+VERSION_CHECK_INTERVAL = getattr(settings, "TRAINING_CONTEXT_VERSION_CHECK_INTERVAL", 5.0)
+
+VERSION_KEY = "training:chat-context:version"
+VALUE_KEY_PREFIX = "training:chat-context:"
+
+_lock = threading.Lock()
+_local: Dict[str, Any] = {"version": None, "value": None, "checked_at": 0.0}
+
+
+def build_training_sections_context() -> List[Dict[str, Any]]:
+    """
+    Active training sections so the assistant can recommend the right modules (uncached).
+    """
+    sections = TrainingSection.objects.filter(is_active=True).order_by("order", "id")
+    context_sections = []
+    for section in sections:
+        context_sections.append(
+            {
+                "id": section.id,
+                "title": section.title,
+                "description": section.description or "",
+                "score": section.score,
+                "order": section.order,
+                "content_types": section.get_available_content_types(),
+                "has_video": section.has_video(),
+                "has_audio": section.has_audio(),
+                "has_text": section.has_text(),
+            }
+        )
+    return context_sections
+
+
+def _shared_cache():
+    return caches[CACHE_ALIAS]
+
+
+def _current_version() -> Optional[str]:
+    """
+    Version token from the shared cache (created if missing); None if the cache is down.
+    """
+    try:
+        cache = _shared_cache()
+        version = cache.get(VERSION_KEY)
+        if version is None:
+            cache.add(VERSION_KEY, uuid.uuid4().hex, timeout=None)
+            version = cache.get(VERSION_KEY)
+        return version
+    except Exception as e:
+        logger.warning(f"Training context cache unavailable: {e}")
+        return None
+
+
+def get_training_sections_context() -> List[Dict[str, Any]]:
+    """
+    Cached training-section context. Callers must treat the result as read-only.
+    """
+    if not is_shared_cache(CACHE_ALIAS):
+        return build_training_sections_context()
+
+    now = time.monotonic()
+    with _lock:
+        if _local["value"] is not None and now - _local["checked_at"] < VERSION_CHECK_INTERVAL:
+            return _local["value"]
+
+    version = _current_version()
+    if version is None:
+        return build_training_sections_context()
+
+    with _lock:
+        if _local["value"] is not None and _local["version"] == version:
+            _local["checked_at"] = now
+            return _local["value"]
+
+    value_key = f"{VALUE_KEY_PREFIX}{version}"
+    value = None
+    try:
+        value = _shared_cache().get(value_key)
+    except Exception as e:
+        logger.warning(f"Training context cache read failed: {e}")
+    if value is None:
+        value = build_training_sections_context()
+        try:
+            _shared_cache().set(value_key, value, timeout=CACHE_TTL)
+        except Exception as e:
+            logger.warning(f"Training context cache write failed: {e}")
+
+    with _lock:
+        _local.update(version=version, value=value, checked_at=now)
+    return value
+
+
+def invalidate_training_sections_context() -> None:
+    """
+    Drop the cached context in this process and, via a new version token, in all others.
+    """
+    with _lock:
+        _local.update(version=None, value=None, checked_at=0.0)
+    try:
+        _shared_cache().set(VERSION_KEY, uuid.uuid4().hex, timeout=None)
+    except Exception as e:
+        logger.warning(f"Training context cache invalidation failed: {e}")
@@ -0,0 +1,13 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import TrainingSection
+from .services.chat_context import invalidate_training_sections_context
+
+
+@receiver(post_save, sender=TrainingSection)
+@receiver(post_delete, sender=TrainingSection)
+def invalidate_chat_context(sender, **kwargs):
+    # After commit, so a concurrent reader cannot re-cache the pre-change rows
+    transaction.on_commit(invalidate_training_sections_context)
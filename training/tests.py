@@ -1,3 +1,22 @@
 from django.test import TestCase
 
-# Create your tests here.
+from training.models import TrainingSection
+from training.services.chat_context import get_training_sections_context
+
+
+class TrainingChatContextTests(TestCase):
+    def test_context_refreshes_after_section_change(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            section = TrainingSection.objects.create(title="Budgeting basics", text_content="Track spends")
+        self.assertEqual([s["title"] for s in get_training_sections_context()], ["Budgeting basics"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            section.title = "Budgeting 101"
+            section.save()
+        context = get_training_sections_context()
+        self.assertEqual([s["title"] for s in context], ["Budgeting 101"])
+        self.assertEqual(context[0]["content_types"], ["text"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            section.delete()
+        self.assertEqual(get_training_sections_context(), [])